@@ -0,0 +1,100 @@
+# Import the required packages
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from replay import Replay, TermStructure, install_stand_ins
+
+# This script benchmarks the Carry and Trend pipeline on the offline replay harness.
+# It reports the latency of CarryTrendAlpha.update per day, the memory growth over a multi-year replay
+# and how the latency scales as the number of markets grows. Run it with `python benchmark.py`,
+# or `python benchmark.py --csv prices.csv` to replay a term structure from a CSV file
+
+# Define a function to summarise a list of latencies in milliseconds
+def latency_summary(latencies):
+    latencies = np.array(latencies) * 1000
+    return {
+        "days": len(latencies),
+        "mean ms": latencies.mean(),
+        "p50 ms": np.percentile(latencies, 50),
+        "p95 ms": np.percentile(latencies, 95),
+        "max ms": latencies.max()
+    }
+
+def format_summary(summary):
+    return ", ".join(f"{name} {value:.3f}" if isinstance(value, float) else f"{name} {value}" for name, value in summary.items())
+
+# Define a function to replay a term structure, recording the traced memory at the end of each year
+def replay_with_memory(term_structure, start_date):
+    replay = Replay(term_structure, start_date)
+    memory_by_year = {}
+
+    def on_day(replay, t, day):
+        if t + 1 == len(term_structure.dates) or term_structure.dates[t + 1].year != day.year:
+            memory_by_year[day.year] = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.start()
+    try:
+        replay.run(on_day)
+    finally:
+        tracemalloc.stop()
+    return replay, memory_by_year
+
+def benchmark_latency_and_memory(term_structure, start_date):
+    start = time.perf_counter()
+    replay, memory_by_year = replay_with_memory(term_structure, start_date)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(term_structure.markets)} markets over {len(term_structure.dates)} days in {elapsed:.1f}s ({replay.insight_count} insights)")
+    # tracemalloc slows everything down, so the latencies are measured on a second replay without it
+    replay = Replay(term_structure, start_date)
+    replay.run()
+    print("update latency: " + format_summary(latency_summary(replay.update_latencies)))
+    print("churn: " + ", ".join(f"{name} {value}" for name, value in replay.portfolio_model.churn_statistics.items() if not isinstance(value, dict)))
+
+    # The state is bounded by the lookback windows, so after the first years the memory should stay flat
+    print("traced memory at the end of each year:")
+    previous = None
+    for year, memory in memory_by_year.items():
+        growth = "" if previous is None else f" ({(memory - previous) / 1024:+.0f} KiB)"
+        print(f"  {year}: {memory / 1024 ** 2:.2f} MiB{growth}")
+        previous = memory
+
+def benchmark_scaling(market_counts, start, end, contracts_table):
+    print("scaling with the number of markets:")
+    for n_markets in market_counts:
+        term_structure = TermStructure.synthetic(n_markets, start, end, contracts_table=contracts_table)
+        replay = Replay(term_structure, datetime.combine(term_structure.dates[-1], datetime.min.time()))
+        replay.run()
+        summary = latency_summary(replay.update_latencies)
+        print(f"  {n_markets:4d} markets: {format_summary(summary)}, {summary['mean ms'] / n_markets * 1000:.1f} us per market")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Carry and Trend pipeline on the offline replay harness")
+    parser.add_argument("--csv", help="CSV term structure with the columns date, market, expiry and close, synthetic data is used if not given")
+    parser.add_argument("--markets", type=int, default=18, help="number of synthetic markets")
+    parser.add_argument("--start", default="2012-01-01", help="first day of the synthetic data")
+    parser.add_argument("--end", default="2019-12-31", help="last day of the synthetic data")
+    parser.add_argument("--scaling", type=int, nargs="*", default=[18, 50, 100, 150], help="market counts to measure the scaling on")
+    parser.add_argument("--scaling-years", type=int, default=2, help="years of synthetic data for each scaling run")
+    args = parser.parse_args()
+
+    install_stand_ins()
+    from futures_contracts import contracts
+
+    if args.csv:
+        term_structure = TermStructure.from_csv(args.csv)
+    else:
+        term_structure = TermStructure.synthetic(args.markets, args.start, args.end, contracts_table=contracts)
+    # Trading starts after the first third of the data, the rest is the warm up
+    start_date = datetime.combine(term_structure.dates[len(term_structure.dates) // 3], datetime.min.time())
+    benchmark_latency_and_memory(term_structure, start_date)
+
+    if args.scaling:
+        end_year = datetime.strptime(args.end, "%Y-%m-%d").year
+        benchmark_scaling(args.scaling, f"{end_year - args.scaling_years + 1}-01-01", args.end, contracts)
+
+if __name__ == "__main__":
+    main()
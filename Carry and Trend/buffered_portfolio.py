@@ -2,39 +2,92 @@
 from AlgorithmImports import *
 
 # This script creates a portfolio that adjusts positions based on insights and minimizing trading churn
-class PortfolioConstruction(EqualWeightingPortfolioConstructionModel):
+class PortfolioConstruction(PortfolioConstructionModel):
 
-    def __init__(self, rebalance, buffer_value):
+    def __init__(self, rebalance, buffer_value, buffer_grid=(0, 0.05, 0.1, 0.15, 0.2, 0.3)):
         # Initialise the class
-        super().__init__(rebalance)
+        super().__init__()
+        self.set_rebalancing_func(rebalance)
         self.buffer_value = buffer_value
+        self.removed_symbols = set()
+
+        # Churn statistics, the grid of buffer values lets us see how many trades other buffers would have placed
+        self.buffer_grid = np.array(sorted(set(buffer_grid) | {buffer_value}), dtype=np.float64)
+        self.insight_count = 0
+        self.trade_count = 0
+        self.trades_avoided = 0
+        self.contracts_traded = 0.0
+        self.contracts_avoided = 0.0
+        self.trades_by_buffer = np.zeros(len(self.buffer_grid))
+        self.contracts_by_buffer = np.zeros(len(self.buffer_grid))
 
     def create_targets(self, algorithm: QCAlgorithm, insights: List[Insight]) -> List[PortfolioTarget]:
-        targets = super().create_targets(algorithm, insights)
-        updated_targets = []
-        for item in insights:
-            contract = algorithm.securities[item.symbol]
-            best_position = contract.forecast * contract.position / 10
-
-            # To reduce churn we create a buffer zone 
-            buffer_range = self.buffer_value * abs(contract.position)
-            lower_limit = round(best_position - buffer_range)
-            upper_limit = round(best_position + buffer_range)
-            
-            # Determine the amount put in the buffer zone
-            holdings_amt = contract.holdings.quantity
-            if lower_limit <= holdings_amt <= upper_limit:
-                continue
-            amount = lower_limit if holdings_amt < lower_limit else upper_limit
-
-            # Place trades
-            updated_targets.append(PortfolioTarget(item.symbol, amount))
-        
-        # Liquidate contracts that have an expired insight
-        for item in targets:
-            if item.quantity == 0:
-                updated_targets.append(item)
+        updated_targets = self.create_buffered_targets(algorithm, insights)
+
+        # Liquidate contracts that have an expired insight or have been removed from the universe
+        if self.is_rebalance_due(insights, algorithm.utc_time):
+            symbols = {insight.symbol for insight in algorithm.insights.remove_expired_insights(algorithm.utc_time)} | self.removed_symbols
+            self.removed_symbols = set()
+            updated_targets += [PortfolioTarget(symbol, 0) for symbol in symbols if not algorithm.insights.has_active_insights(symbol, algorithm.utc_time)]
 
         return updated_targets
 
-    
\ No newline at end of file
+    # Define a function to determine the trades for all the insights at once
+    def create_buffered_targets(self, algorithm, insights):
+        if not insights:
+            return []
+        contracts = [algorithm.securities[item.symbol] for item in insights]
+        forecasts = np.array([contract.forecast for contract in contracts], dtype=np.float64)
+        positions = np.array([contract.position for contract in contracts], dtype=np.float64)
+        holdings_amt = np.array([contract.holdings.quantity for contract in contracts], dtype=np.float64)
+        best_positions = forecasts * positions / 10
+
+        # To reduce churn we create a buffer zone, only trade up to its nearest limit if the holdings are outside of it
+        lower_limits, upper_limits, trades = self.buffer_zone(best_positions, positions, holdings_amt, self.buffer_value)
+        amounts = np.where(holdings_amt < lower_limits, lower_limits, upper_limits)
+
+        self.update_churn_statistics(best_positions, positions, holdings_amt, trades, amounts)
+
+        # Place trades
+        return [PortfolioTarget(insights[i].symbol, float(amounts[i])) for i in np.flatnonzero(trades)]
+
+    def buffer_zone(self, best_positions, positions, holdings_amt, buffer_value):
+        buffer_range = buffer_value * np.abs(positions)
+        lower_limits = np.round(best_positions - buffer_range)
+        upper_limits = np.round(best_positions + buffer_range)
+        trades = (holdings_amt < lower_limits) | (holdings_amt > upper_limits)
+        return lower_limits, upper_limits, trades
+
+    # Define a function to record how much trading the buffer has saved
+    def update_churn_statistics(self, best_positions, positions, holdings_amt, trades, amounts):
+        # Without a buffer we would trade to the rounded optimal position
+        unbuffered_amounts = np.round(best_positions)
+        unbuffered_trades = unbuffered_amounts != holdings_amt
+        self.insight_count += len(positions)
+        self.trade_count += int(trades.sum())
+        self.trades_avoided += int((unbuffered_trades & ~trades).sum())
+        self.contracts_traded += float(np.abs(amounts - holdings_amt)[trades].sum())
+        self.contracts_avoided += float(np.abs(unbuffered_amounts - holdings_amt)[unbuffered_trades].sum() - np.abs(amounts - holdings_amt)[trades].sum())
+
+        # Then repeat it for every buffer value in the grid (buffer values x insights), measured against the current holdings
+        lower_limits, upper_limits, grid_trades = self.buffer_zone(best_positions[None, :], positions[None, :], holdings_amt[None, :], self.buffer_grid[:, None])
+        grid_amounts = np.where(holdings_amt < lower_limits, lower_limits, upper_limits)
+        self.trades_by_buffer += grid_trades.sum(axis=1)
+        self.contracts_by_buffer += np.where(grid_trades, np.abs(grid_amounts - holdings_amt), 0).sum(axis=1)
+
+    # Summary of the churn statistics
+    @property
+    def churn_statistics(self):
+        return {
+            "insights": self.insight_count,
+            "trades": self.trade_count,
+            "trades avoided": self.trades_avoided,
+            "contracts traded": self.contracts_traded,
+            "contracts avoided": self.contracts_avoided,
+            "trades by buffer": dict(zip(self.buffer_grid.tolist(), self.trades_by_buffer.tolist())),
+            "contracts by buffer": dict(zip(self.buffer_grid.tolist(), self.contracts_by_buffer.tolist()))
+        }
+
+    def on_securities_changed(self, algorithm: QCAlgorithm, changes: SecurityChanges) -> None:
+        super().on_securities_changed(algorithm, changes)
+        self.removed_symbols |= {security.symbol for security in changes.removed_securities}
@@ -0,0 +1,68 @@
+# Import the required packages
+from AlgorithmImports import *
+from price_history import PriceHistory
+
+# This script smooths the annualised raw carry of a future over several spans.
+# Each span keeps the running state of carry.ewm(span=span, min_periods=span).mean() (adjust=True)
+# so a new carry observation is folded in once, rather than re-smoothing the whole history every day
+class CarrySignal:
+
+    def __init__(self, carry_range, capacity, lookback_period):
+        # Initialise the class
+        self.carry_range = carry_range
+        self.decays = np.array([1 - 2 / (span + 1) for span in carry_range])
+        self.min_periods = np.array(carry_range)
+        # The stored carry history is bounded by the lookback period
+        self.history = PriceHistory(capacity, lookback_period)
+        self.reset()
+
+    def reset(self):
+        self.history.clear()
+        self.nobs = 0
+        self.means = np.zeros(len(self.carry_range))
+        self.old_wts = np.ones(len(self.carry_range))
+        # The state before the latest observation, so that a repeated date can replace it
+        self.previous_state = None
+
+    # Define a function to add a new annualised raw carry observation
+    def update(self, date, annualised_raw_carry):
+        if self.history.last_date == date and self.previous_state is not None:
+            # The carry for the latest date has changed, so undo the previous update first. The saved arrays are copied
+            # because the update changes the weights in place, and the same date can be updated again
+            nobs, means, old_wts = self.previous_state
+            self.nobs, self.means, self.old_wts = nobs, means.copy(), old_wts.copy()
+        else:
+            self.previous_state = (self.nobs, self.means.copy(), self.old_wts.copy())
+        self.history.append(date, annualised_raw_carry)
+
+        self.nobs += 1
+        if self.nobs == 1:
+            self.means[:] = annualised_raw_carry
+            return
+        # Decay the existing weights, then fold in the new observation with a weight of 1
+        self.old_wts *= self.decays
+        self.means = (self.old_wts * self.means + annualised_raw_carry) / (self.old_wts + 1)
+        self.old_wts += 1
+
+    # Define functions to save and restore the signal, see checkpoint.py
+    def get_state(self):
+        previous_nobs, previous_means, previous_old_wts = self.previous_state if self.previous_state is not None else (-1, self.means, self.old_wts)
+        return {
+            "nobs": np.array([self.nobs, previous_nobs]),
+            "means": np.vstack([self.means, previous_means]),
+            "old_wts": np.vstack([self.old_wts, previous_old_wts]),
+            "history_dates": self.history.dates.copy(),
+            "history_values": self.history.values.copy()
+        }
+
+    def set_state(self, state):
+        self.history.set_state({"dates": state["history_dates"], "values": state["history_values"]})
+        self.nobs, previous_nobs = state["nobs"].tolist()
+        self.means = state["means"][0].copy()
+        self.old_wts = state["old_wts"][0].copy()
+        self.previous_state = (previous_nobs, state["means"][1].copy(), state["old_wts"][1].copy()) if previous_nobs >= 0 else None
+
+    # The smoothed carry for each span, NaN until the span has enough observations
+    @property
+    def smoothed_carry(self):
+        return np.where(self.nobs >= self.min_periods, self.means, np.nan)
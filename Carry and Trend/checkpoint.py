@@ -0,0 +1,28 @@
+# Import the required packages
+from AlgorithmImports import *
+import io
+
+# This script saves and restores the state of the CarryTrendAlpha in the object store.
+# The state is a compressed NumPy archive with one array per field, so a new deployment can resume from it
+# and only replay the data since the checkpoint was taken rather than the full multi-year warm up
+
+# Define a function to save the state of the alpha model under a key of the object store
+def save_checkpoint(algorithm, alpha, key):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **alpha.get_state())
+    algorithm.object_store.save_bytes(key, bytearray(buffer.getvalue()))
+
+# Define a function to load a saved state, if there is none then return None
+def load_checkpoint(algorithm, key):
+    if not algorithm.object_store.contains_key(key):
+        return None
+    with np.load(io.BytesIO(bytes(algorithm.object_store.read_bytes(key))), allow_pickle=False) as archive:
+        return {name: archive[name] for name in archive.files}
+
+# The state of each component is stored under its own prefix
+def add_state(state, prefix, component_state):
+    for name, value in component_state.items():
+        state[f"{prefix}.{name}"] = value
+
+def get_state(state, prefix):
+    return {name[len(prefix) + 1:]: value for name, value in state.items() if name.startswith(prefix + ".")}
@@ -0,0 +1,51 @@
+# Import the required packages
+from AlgorithmImports import *
+
+# This script keeps the exponential moving averages of the adjusted price of a future for the EMAC trend forecasts.
+# Each EMA follows the LEAN ExponentialMovingAverage the alpha used to register: the first price is the first value, then
+# ema = k * price + (1 - k) * ema with k = 2 / (span + 1). The EMAs are plain arrays so the state can be saved and restored,
+# where a LEAN indicator could only be warmed up again from a history request that starts from a different seed
+class EmacSignal:
+
+    def __init__(self, fast_ema_range, slow_ema_range):
+        # Initialise the class, the fast and slow EMAs share the spans they have in common
+        self.ema_range = sorted(set(fast_ema_range) | set(slow_ema_range))
+        self.fast_index = np.searchsorted(self.ema_range, fast_ema_range)
+        self.slow_index = np.searchsorted(self.ema_range, slow_ema_range)
+        self.k = np.array([2 / (span + 1) for span in self.ema_range])
+        self.reset()
+
+    def reset(self):
+        self.last_date = None
+        self.nobs = 0
+        self.emas = np.zeros(len(self.ema_range))
+
+    # Define a function to add the adjusted close of a new day
+    def update(self, date, price):
+        # Prices are only accepted once per date and in chronological order
+        if self.last_date is not None and date <= self.last_date:
+            return
+        self.last_date = date
+        self.nobs += 1
+        if self.nobs == 1:
+            self.emas[:] = price
+        else:
+            self.emas = price * self.k + self.emas * (1 - self.k)
+
+    # Define functions to save and restore the signal, see checkpoint.py
+    def get_state(self):
+        return {
+            "last_date": np.datetime64(self.last_date, "D") if self.last_date is not None else np.datetime64("NaT", "D"),
+            "nobs": np.array(self.nobs),
+            "emas": self.emas.copy()
+        }
+
+    def set_state(self, state):
+        self.last_date = state["last_date"].item()
+        self.nobs = int(state["nobs"])
+        self.emas = state["emas"].astype(np.float64)
+
+    # The difference between the fast and the slow EMA of each EMAC filter
+    @property
+    def ewmac(self):
+        return self.emas[self.fast_index] - self.emas[self.slow_index]
@@ -0,0 +1,46 @@
+# Import the required packages
+from AlgorithmImports import *
+from bisect import bisect_left, bisect_right
+
+# This script keeps the contracts of each futures chain sorted by expiry.
+# It is maintained from on_securities_changed so finding the contracts around the mapped one is a bisect
+# on a single chain, rather than a scan and sort of every security in the algorithm
+class FuturesChainIndex:
+
+    def __init__(self):
+        # Initialise the class, the expiries and contracts of each chain are kept in two parallel sorted lists
+        self.expiries_by_canonical = {}
+        self.contracts_by_canonical = {}
+        self.contract_by_symbol = {}
+
+    def add(self, contract):
+        symbol = contract.symbol
+        if symbol in self.contract_by_symbol:
+            return
+        expiries = self.expiries_by_canonical.setdefault(symbol.canonical, [])
+        contracts = self.contracts_by_canonical.setdefault(symbol.canonical, [])
+        # Contracts with the same expiry are kept in the order they were added
+        index = bisect_right(expiries, contract.expiry)
+        expiries.insert(index, contract.expiry)
+        contracts.insert(index, contract)
+        self.contract_by_symbol[symbol] = contract
+
+    def remove(self, contract):
+        symbol = contract.symbol
+        if self.contract_by_symbol.pop(symbol, None) is None:
+            return
+        expiries = self.expiries_by_canonical[symbol.canonical]
+        contracts = self.contracts_by_canonical[symbol.canonical]
+        index = bisect_left(expiries, contract.expiry)
+        while contracts[index].symbol != symbol:
+            index += 1
+        del expiries[index]
+        del contracts[index]
+
+    # Define a function to obtain the contracts that expire on or after the mapped contract, in order of expiry
+    def get_contracts_from(self, mapped_symbol, count):
+        mapped_contract = self.contract_by_symbol.get(mapped_symbol)
+        if mapped_contract is None:
+            return []
+        index = bisect_left(self.expiries_by_canonical[mapped_symbol.canonical], mapped_contract.expiry)
+        return self.contracts_by_canonical[mapped_symbol.canonical][index:index + count]
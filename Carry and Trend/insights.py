@@ -2,23 +2,29 @@
  
 from AlgorithmImports import *
 from futures_contracts import contracts
-from weights import GetWeights
+from weights import InstrumentWeights
+from volatility import VolatilityEstimator
+from price_history import PriceHistory
+from carry import CarrySignal
+from emac import EmacSignal
+from futures_chains import FuturesChainIndex
+from checkpoint import add_state, get_state
 
 class CarryTrendAlpha(AlphaModel):
     # Define the initial parameters we will be working with
-    futures = []
     business_days = 256
     trend_forecast_scalars = {2: 12.1, 4: 8.53, 8: 5.95, 16: 4.1, 32: 2.79, 64: 1.91} 
     carry_forecast_scalar = 30 
     fdm_by_count = {1: 1.0, 2: 1.02, 3: 1.03, 4: 1.23, 5: 1.25, 6: 1.27, 7: 1.29, 8: 1.32, 9: 1.34}
+    checkpoint_version = 2
 
-    def __init__(self, algorithm, emac_filters, abs_forecast_limit, sigma_range, risk_tol, blend_years):
+    def __init__(self, algorithm, emac_filters, abs_forecast_limit, sigma_range, risk_tol, blend_years, instrument_weights=None):
         # Initialise the class first for the EMAC parameters then the carry ones
         self.algorithm = algorithm
+        self.futures = []
         self.emac_range = [2**x for x in range(4, emac_filters+1)]
         self.fast_ema_range = self.emac_range
         self.slow_ema_range = [fast_range * 4 for fast_range in self.emac_range] 
-        self.all_ema_range = sorted(list(set(self.fast_ema_range + self.slow_ema_range)))
         
         self.carry_range = [5, 20, 60, 120]
         
@@ -28,10 +34,25 @@ class CarryTrendAlpha(AlphaModel):
         self.contracts = contracts
         self.day = -1
         self.lookback_period = timedelta(sigma_range*(7/5) + blend_years*365)
+        # One slot per calendar day in the lookback period
+        self.history_capacity = self.lookback_period.days + 1
         # Instrument Diversification Multiplier
         self.idm = 1.5    
         self.sigma_range = sigma_range
         self.risk_tol = risk_tol                                          
+        # Lookup arrays for the vectorised forecasts
+        self.trend_forecast_scalar_array = np.array([self.trend_forecast_scalars[span] for span in self.emac_range])
+        self.fdm_by_count_array = np.array([self.fdm_by_count.get(count, np.nan) for count in range(len(self.emac_range) + len(self.carry_range) + 1)])
+        # Instrument weights, cached on the classifications of the active instruments
+        self.instrument_weights = InstrumentWeights() if instrument_weights is None else instrument_weights
+        # Contracts of each futures chain sorted by expiry
+        self.chain_index = FuturesChainIndex()
+        # A saved state is only valid for the parameters and the version of the state it was saved with
+        self.checkpoint_parameters = np.array([self.checkpoint_version, sigma_range, blend_years] + self.emac_range, dtype=np.float64)
+        self.checkpoint_state = None
+        self.checkpoint_index_by_future = {}
+        self.restored_contract_prices = {}
+        self.restored_latest_mapped = {}
         
 
     # Define a function that updates the signal
@@ -46,8 +67,11 @@ class CarryTrendAlpha(AlphaModel):
 
         # Update the annualised carry data
         for future in self.futures:
+            # Only the contracts the carry model reads are consolidated
+            self.update_subscriptions(algorithm, future)
+
             # Obtain the near and far contracts
-            contracts = self.get_near_and_further_contracts(algorithm.securities, future.mapped)
+            contracts = self.get_near_and_further_contracts(future.mapped)
             if contracts is None:
                 continue
             near_contract, further_contract = contracts[0], contracts[1]
@@ -57,14 +81,14 @@ class CarryTrendAlpha(AlphaModel):
             future.further_contract = further_contract
 
             # Determine if the daily consolidator has provided a bar for any of the contracts
-            if not hasattr(near_contract, "raw_history") or not hasattr(further_contract, "raw_history") or near_contract.raw_history.empty or further_contract.raw_history.empty:
+            if getattr(near_contract, "raw_history", None) is None or getattr(further_contract, "raw_history", None) is None or near_contract.raw_history.empty or further_contract.raw_history.empty:
                 continue
             # Then update the raw carry data on an annualised basis
-            raw_carry_data = near_contract.raw_history.iloc[0] - further_contract.raw_history.iloc[0]
+            raw_carry_data = near_contract.raw_history.last_value - further_contract.raw_history.last_value
             month_diff = round((further_contract.expiry - near_contract.expiry).days / 30)
             year_diff = abs(month_diff) / 12
             annualised_raw_carry = raw_carry_data / year_diff
-            future.annualised_raw_carry_history.loc[near_contract.raw_history.index[0]] = annualised_raw_carry
+            future.carry_signal.update(near_contract.raw_history.last_date, annualised_raw_carry)
 
         # If we are in the warm up period and more than 10 days from the start date then do nothing
         # This is done so that we have insights at the end of the warm up period 
@@ -75,7 +99,7 @@ class CarryTrendAlpha(AlphaModel):
         # Estimate the standard deviation of % daily returns for each future
         std_pct_by_contract = {}
         for future in self.futures:
-            std_pcts = self.estimate_std_of_rets(future.raw_history, future.adjusted_history)
+            std_pcts = self.estimate_std_of_rets(future)
             # First determine if there is sufficient data
             if std_pcts is None:
                 continue
@@ -83,41 +107,38 @@ class CarryTrendAlpha(AlphaModel):
 
         # Then generate the insights that will drive our strategy
         insights = []
-        weight_by_ticker = GetWeights({future.symbol: self.contracts[future.symbol].classification for future in std_pct_by_contract.keys()})
-        for ticker, instrument_weight in weight_by_ticker.items():
-            future = algorithm.securities[ticker]
-            target_contract = [future.near_contract, future.further_contract][self.contracts[future.symbol].contract_offset]
-            std_pct = std_pct_by_contract[future]
-            daily_risk_prices = std_pct / (self.annualisation_factor) * target_contract.price 
-
-            # Determine the target position
-            position = (algorithm.portfolio.total_portfolio_value * self.idm * instrument_weight * self.risk_tol)/(future.symbol_properties.contract_multiplier * daily_risk_prices * (self.annualisation_factor))
-
-            # Determine the EMAC forecast
-            emac_forecasts = self.calculate_emac_forecasts(future.ewmac_by_range, daily_risk_prices)
-            if not emac_forecasts:
-                continue
-            emac_combined_forecasts = sum(emac_forecasts) / len(emac_forecasts) 
+        futures = [future for future in std_pct_by_contract.keys() if hasattr(future, "near_contract")]
+        if not futures:
+            return insights
+        target_contracts = [[future.near_contract, future.further_contract][self.contracts[future.symbol].contract_offset] for future in futures]
 
-            # Determine the carry forecast
-            raw_carry_forecasts = self.calculate_carry_forecasts(future.annualised_raw_carry_history, daily_risk_prices)
-            if not raw_carry_forecasts:
-                continue
-            carry_combined_forecasts = sum(raw_carry_forecasts) / len(raw_carry_forecasts) 
-            
-            # Finally, we create a forecast that takes 65% of the EMAC signal and 35% of the carry signal 
-            raw_combined_forecast = 0.65 * emac_combined_forecasts + 0.35 * carry_combined_forecasts
-            scaled_combined_forecast = raw_combined_forecast * self.fdm_by_count[len(emac_forecasts) + len(raw_carry_forecasts)] 
-            capped_combined_forecast = max(min(scaled_combined_forecast, self.abs_forecast_limit), -self.abs_forecast_limit)
+        # Gather the inputs of every instrument into arrays so all the forecasts are computed in a few vectorised steps
+        instrument_weights = self.instrument_weights.get_weights([self.contracts[future.symbol].classification for future in futures])
+        contract_multipliers = np.array([future.symbol_properties.contract_multiplier for future in futures])
+        std_pcts = np.array([std_pct_by_contract[future] for future in futures])
+        prices = np.array([target_contract.price for target_contract in target_contracts])
+        ewmac_values = np.array([future.emac_signal.ewmac for future in futures]).reshape(len(futures), len(self.emac_range))
+        smoothed_carry = np.array([future.carry_signal.smoothed_carry for future in futures])
+        daily_risk_prices = std_pcts / (self.annualisation_factor) * prices
 
-            if capped_combined_forecast * position == 0:
-                continue
-            target_contract.forecast = capped_combined_forecast
-            target_contract.position = position
+        # Determine the target positions
+        positions = (algorithm.portfolio.total_portfolio_value * self.idm * instrument_weights * self.risk_tol)/(contract_multipliers * daily_risk_prices * (self.annualisation_factor))
+
+        # Determine the EMAC and carry forecasts, then combine them
+        emac_forecasts = self.calculate_emac_forecasts(ewmac_values, daily_risk_prices)
+        carry_forecasts = self.calculate_carry_forecasts(smoothed_carry, daily_risk_prices)
+        capped_combined_forecasts, has_forecast = self.calculate_combined_forecasts(emac_forecasts, carry_forecasts)
+        directions = capped_combined_forecasts * positions
+
+        for i in np.flatnonzero(has_forecast & (directions != 0)):
+            future = futures[i]
+            target_contract = target_contracts[i]
+            target_contract.forecast = capped_combined_forecasts[i]
+            target_contract.position = positions[i]
             
             local_time = Extensions.convert_to(algorithm.time, algorithm.time_zone, future.exchange.time_zone)
             expiry = future.exchange.hours.get_next_market_open(local_time, False) - timedelta(seconds=1)
-            insights.append(Insight.price(target_contract.symbol, expiry, InsightDirection.UP if capped_combined_forecast * position > 0 else InsightDirection.DOWN))
+            insights.append(Insight.price(target_contract.symbol, expiry, InsightDirection.UP if directions[i] > 0 else InsightDirection.DOWN))
         
         if insights:
             self.day = data.time.day
@@ -129,73 +150,171 @@ class CarryTrendAlpha(AlphaModel):
         for security in changes.added_securities:
             symbol = security.symbol
 
-            # First reate a consolidator to update the history of any new futures added
-            security.consolidator = TradeBarConsolidator(timedelta(1))
-            security.consolidator.data_consolidated += self.consolidation_handler
-            algorithm.subscription_manager.add_consolidator(symbol, security.consolidator)
+            # Individual contracts only get a consolidator once the carry model needs them, see update_subscriptions
+            if not symbol.is_canonical():
+                security.consolidator = None
+                security.raw_history = None
+                self.chain_index.add(security)
+            else:
+                # First create a consolidator to update the history of any new futures added
+                self.attach_consolidator(algorithm, security)
 
-            # Then update the raw and adjusted history
-            security.raw_history = pd.Series()
+                # Then update the raw and adjusted history
+                security.raw_history = PriceHistory(self.history_capacity, self.lookback_period)
+                security.adjusted_history = PriceHistory(self.history_capacity, self.lookback_period)
+                security.carry_signal = CarrySignal(self.carry_range, self.history_capacity, self.lookback_period)
+                security.volatility_estimator = VolatilityEstimator(self.sigma_range, self.annualisation_factor, self.lookback_period)
 
-            if symbol.is_canonical():
-                security.adjusted_history = pd.Series()
-                security.annualised_raw_carry_history = pd.Series()
+                # Then generate the EMAs for the trend, they are updated with the adjusted history
+                security.emac_signal = EmacSignal(self.fast_ema_range, self.slow_ema_range)
 
-                # Then generate the indicators for the contract
-                ema_by_range = {span: algorithm.EMA(symbol, span, Resolution.DAILY) for span in self.all_ema_range}
-                security.ewmac_by_range = {}
-                for i, fast_range in enumerate(self.emac_range):
-                    security.ewmac_by_range[fast_range] = IndicatorExtensions.minus(ema_by_range[fast_range], ema_by_range[self.slow_ema_range[i]])
+                security.subscribed_contracts = set()
+                self.futures.append(security)
 
-                security.automatic_indicators = ema_by_range.values()
+                # If we are resuming from a checkpoint then restore the state of the future
+                self.restore_future(algorithm, security)
 
-                self.futures.append(security)
+        # If we are resuming from a checkpoint then subscribe to the contracts that were in use straight away, so no daily bar is missed
+        for future in self.futures:
+            mapped_id = self.restored_latest_mapped.get(str(future.symbol.id))
+            latest_mapped = next((contract.symbol for contract in self.chain_index.contracts_by_canonical.get(future.symbol, []) if str(contract.symbol.id) == mapped_id), None)
+            if latest_mapped is not None:
+                del self.restored_latest_mapped[str(future.symbol.id)]
+                future.latest_mapped = latest_mapped
+                self.update_subscriptions(algorithm, future)
 
         for security in changes.removed_securities:
-            # Finally remove the consolidator and the indicators
-            algorithm.subscription_manager.remove_consolidator(security.symbol, security.consolidator)
-            if security.symbol.is_canonical():
-                for indicator in security.automatic_indicators:
-                    algorithm.deregister_indicator(indicator)    
+            # Finally remove the consolidator
+            self.detach_consolidator(algorithm, security)
+            if not security.symbol.is_canonical():
+                self.chain_index.remove(security)
+                continuous_contract = algorithm.securities[security.symbol.canonical]
+                if hasattr(continuous_contract, "subscribed_contracts"):
+                    continuous_contract.subscribed_contracts.discard(security.symbol)
     
+    # Define a function to keep the daily consolidators on the contracts the carry model reads
+    def update_subscriptions(self, algorithm, future):
+        if getattr(future, "latest_mapped", None) is None:
+            return
+        # These are the mapped, near and further contracts. The next contract is also kept so it already has a price when it rolls in
+        symbols = {contract.symbol for contract in self.chain_index.get_contracts_from(future.latest_mapped, 3)}
+        symbols.add(future.latest_mapped)
+        if symbols == future.subscribed_contracts:
+            return
+        for symbol in future.subscribed_contracts - symbols:
+            self.detach_consolidator(algorithm, algorithm.securities[symbol])
+        for symbol in symbols - future.subscribed_contracts:
+            if symbol not in algorithm.securities:
+                continue
+            contract = algorithm.securities[symbol]
+            contract.raw_history = PriceHistory(1)
+            if str(symbol.id) in self.restored_contract_prices:
+                contract.raw_history.append(*self.restored_contract_prices.pop(str(symbol.id)))
+            self.attach_consolidator(algorithm, contract)
+        future.subscribed_contracts = {symbol for symbol in symbols if symbol in algorithm.securities}
+
+    def attach_consolidator(self, algorithm, security):
+        security.consolidator = TradeBarConsolidator(timedelta(1))
+        security.consolidator.data_consolidated += self.consolidation_handler
+        algorithm.subscription_manager.add_consolidator(security.symbol, security.consolidator)
+
+    def detach_consolidator(self, algorithm, security):
+        if getattr(security, "consolidator", None) is None:
+            return
+        security.consolidator.data_consolidated -= self.consolidation_handler
+        algorithm.subscription_manager.remove_consolidator(security.symbol, security.consolidator)
+        security.consolidator = None
+        if not security.symbol.is_canonical():
+            security.raw_history = None
+
+    # Define a function to obtain the state of the model so it can be saved, see checkpoint.py
+    def get_state(self):
+        state = {
+            "time": np.datetime64(self.algorithm.time, "s"),
+            "day": np.array(self.day),
+            "parameters": self.checkpoint_parameters,
+            "futures": np.array([str(future.symbol.id) for future in self.futures], dtype=str)
+        }
+        state["latest_mapped"] = np.array([str(future.latest_mapped.id) if getattr(future, "latest_mapped", None) is not None else "" for future in self.futures], dtype=str)
+        contract_ids, contract_dates, contract_values = [], [], []
+        for i, future in enumerate(self.futures):
+            add_state(state, f"{i}.raw_history", future.raw_history.get_state())
+            add_state(state, f"{i}.adjusted_history", future.adjusted_history.get_state())
+            add_state(state, f"{i}.carry_signal", future.carry_signal.get_state())
+            add_state(state, f"{i}.volatility_estimator", future.volatility_estimator.get_state())
+            add_state(state, f"{i}.emac_signal", future.emac_signal.get_state())
+            # Then save the latest prices of the contracts used for the carry
+            for symbol in future.subscribed_contracts:
+                raw_history = getattr(self.algorithm.securities[symbol], "raw_history", None)
+                if raw_history is None or raw_history.empty:
+                    continue
+                contract_ids.append(str(symbol.id))
+                contract_dates.append(raw_history.last_date)
+                contract_values.append(raw_history.last_value)
+        state["contracts"] = np.array(contract_ids, dtype=str)
+        state["contract_dates"] = np.array(contract_dates, dtype="datetime64[D]")
+        state["contract_values"] = np.array(contract_values, dtype=np.float64)
+        return state
+
+    # Define a function to resume from a saved state, it returns the time the state was saved or None if it cannot be used
+    # The futures are restored as they are added to the universe
+    def set_state(self, state):
+        # A state saved with different parameters or after the start date cannot be used
+        if not np.array_equal(state["parameters"], self.checkpoint_parameters) or state["time"] > np.datetime64(self.algorithm.start_date, "s"):
+            return None
+        self.day = int(state["day"])
+        self.checkpoint_state = state
+        self.checkpoint_index_by_future = {future_id: i for i, future_id in enumerate(state["futures"].tolist())}
+        self.restored_latest_mapped = {future_id: mapped_id for future_id, mapped_id in zip(state["futures"].tolist(), state["latest_mapped"].tolist()) if mapped_id}
+        self.restored_contract_prices = {contract_id: (date, value) for contract_id, date, value in zip(state["contracts"].tolist(), state["contract_dates"].tolist(), state["contract_values"].tolist())}
+        return state["time"].item()
+
+    def restore_future(self, algorithm, future):
+        i = self.checkpoint_index_by_future.pop(str(future.symbol.id), None)
+        if i is None:
+            return
+        future.raw_history.set_state(get_state(self.checkpoint_state, f"{i}.raw_history"))
+        future.adjusted_history.set_state(get_state(self.checkpoint_state, f"{i}.adjusted_history"))
+        future.carry_signal.set_state(get_state(self.checkpoint_state, f"{i}.carry_signal"))
+        future.volatility_estimator.set_state(get_state(self.checkpoint_state, f"{i}.volatility_estimator"))
+        future.emac_signal.set_state(get_state(self.checkpoint_state, f"{i}.emac_signal"))
+
     # Define a function to determine the EMAC forecast for each future
-    def calculate_emac_forecasts(self, ewmac_by_range, daily_risk_prices):
-        forecasts = []
-        for span in self.emac_range:
-            # Obtain the risk adjusted EWMAC, then scale it and cap. 
-            risk_adjusted_ewmac = ewmac_by_range[span].current.value / daily_risk_prices
-            scaled_forecast_ewmac = risk_adjusted_ewmac * self.trend_forecast_scalars[span]
-            capped_forecast_ewmac = max(min(scaled_forecast_ewmac, self.abs_forecast_limit), -self.abs_forecast_limit)
-            forecasts.append(capped_forecast_ewmac)
-        return forecasts    
+    def calculate_emac_forecasts(self, ewmac_values, daily_risk_prices):
+        # Obtain the risk adjusted EWMAC for every instrument and span, then scale it and cap. 
+        risk_adjusted_ewmac = ewmac_values / daily_risk_prices[:, None]
+        scaled_forecast_ewmac = risk_adjusted_ewmac * self.trend_forecast_scalar_array
+        return np.clip(scaled_forecast_ewmac, -self.abs_forecast_limit, self.abs_forecast_limit)
     
     # Define a function to determine the carry forecast for each future
-    def calculate_carry_forecasts(self, annualised_raw_carry, daily_risk_prices):
-        carry_forecast = annualised_raw_carry / daily_risk_prices
-
-        forecasts = []
-        for span in self.carry_range:
-            # First smooth out the carry forecast
-            smooth_carry_forecast = carry_forecast.ewm(span=span, min_periods=span).mean().dropna()
-            if smooth_carry_forecast.empty:
-                continue
-            smooth_carry_forecast = smooth_carry_forecast.iloc[-1]
-            # Then scale the signal
-            scaled_carry_forecast = smooth_carry_forecast * self.carry_forecast_scalar
-            # Then cap it
-            capped_carry_forecast = max(min(scaled_carry_forecast, self.abs_forecast_limit), -self.abs_forecast_limit)
-            forecasts.append(capped_carry_forecast)
-
-        return forecasts    
+    def calculate_carry_forecasts(self, smoothed_carry, daily_risk_prices):
+        # The carry is smoothed as it arrives and the risk price is the same for the whole history, so it can be applied after smoothing
+        # The spans that do not have enough data yet are NaN
+        smooth_carry_forecast = smoothed_carry / daily_risk_prices[:, None]
+        # Then scale the signal and cap it
+        scaled_carry_forecast = smooth_carry_forecast * self.carry_forecast_scalar
+        return np.clip(scaled_carry_forecast, -self.abs_forecast_limit, self.abs_forecast_limit)
+
+    # Define a function to combine the EMAC and carry forecasts of each future
+    def calculate_combined_forecasts(self, emac_forecasts, carry_forecasts):
+        # An instrument needs at least one EMAC and one carry forecast
+        emac_counts = np.full(len(emac_forecasts), emac_forecasts.shape[1])
+        carry_counts = np.sum(~np.isnan(carry_forecasts), axis=1)
+        has_forecast = (emac_counts > 0) & (carry_counts > 0)
+
+        emac_combined_forecasts = np.divide(emac_forecasts.sum(axis=1), emac_counts, out=np.zeros(len(emac_counts)), where=emac_counts > 0)
+        carry_combined_forecasts = np.divide(np.nansum(carry_forecasts, axis=1), carry_counts, out=np.zeros(len(carry_counts)), where=carry_counts > 0)
+
+        # Finally, we create a forecast that takes 65% of the EMAC signal and 35% of the carry signal 
+        raw_combined_forecasts = 0.65 * emac_combined_forecasts + 0.35 * carry_combined_forecasts
+        scaled_combined_forecasts = raw_combined_forecasts * self.fdm_by_count_array[emac_counts + carry_counts]
+        capped_combined_forecasts = np.clip(scaled_combined_forecasts, -self.abs_forecast_limit, self.abs_forecast_limit)
+        return capped_combined_forecasts, has_forecast
     
-    # Define a function to obtain and align the historical data for each contract
-    def get_near_and_further_contracts(self, securities, mapped_symbol):
-       
-        futures_sorted_by_expiry = sorted(
-            [kvp.Value for kvp in securities 
-            if not kvp.key.is_canonical() and kvp.key.canonical == mapped_symbol.canonical and kvp.Value.Expiry >= securities[mapped_symbol].Expiry
-            ], 
-        key=lambda contract: contract.expiry)
+    # Define a function to obtain the near and further contracts relative to the mapped contract
+    def get_near_and_further_contracts(self, mapped_symbol):
+        # The chain index keeps each chain sorted by expiry, so this only depends on the size of one chain
+        futures_sorted_by_expiry = self.chain_index.get_contracts_from(mapped_symbol, 2)
         if len(futures_sorted_by_expiry) < 2:
             return None
         near_contract = futures_sorted_by_expiry[0]
@@ -203,45 +322,36 @@ class CarryTrendAlpha(AlphaModel):
         return near_contract, further_contract    
 
     # Then create a function to estimate the standard deviation of the percentage returns 
-    def estimate_std_of_rets(self, raw_history, adjusted_history):
-        # First align the history of the raw and adjusted prices
-        raw_history_aligned, adjusted_history_aligned = self.align_history(raw_history, adjusted_history)
-
-        # Then determine the exponentially weighted standard deviation of the returns
-        returns = adjusted_history_aligned.diff().dropna() / raw_history_aligned.shift(1).dropna() 
-        rolling_ewmstd_pct_returns = returns.ewm(span=self.sigma_range, min_periods=self.sigma_range).std().dropna()
-        # If there is no data then do nothing
-        if rolling_ewmstd_pct_returns.empty: 
-            return None
-        # Then obtain the annualised estimate of the standard deviation
-        annualised_rolling_ewmstd_pct_returns = rolling_ewmstd_pct_returns * (self.annualisation_factor)
-        # Finally obtain a blended estimate
-        blended_estimate = 0.3*annualised_rolling_ewmstd_pct_returns.mean() + 0.7*annualised_rolling_ewmstd_pct_returns.iloc[-1]
-        return blended_estimate    
-    
-    # Create a function to align the history of two databases
-    def align_history(self, a, b):
-        idx = sorted(list(set(a.index).intersection(set(b.index)))) 
-        return a.loc[idx], b.loc[idx]
+    def estimate_std_of_rets(self, future):
+        # The estimator is updated as each daily bar arrives, so we only need to read the blended estimate
+        # If there is no data then this is None
+        return future.volatility_estimator.blended_estimate
 
+    # Create a function to pass the latest aligned raw and adjusted prices to the volatility estimator
+    def update_volatility(self, future, end_date):
+        if future.raw_history.empty or future.adjusted_history.empty:
+            return
+        if future.raw_history.last_date != end_date or future.adjusted_history.last_date != end_date:
+            return
+        future.volatility_estimator.update(end_date, future.raw_history.last_value, future.adjusted_history.last_value)
 
     def consolidation_handler(self, sender: object, consolidated_bar: TradeBar) -> None:
         security = self.algorithm.securities[consolidated_bar.symbol]
         end_date = consolidated_bar.end_time.date()
         if security.symbol.is_canonical():
-            # Update the adjusted history
-            security.adjusted_history.loc[end_date] = consolidated_bar.close
-            security.adjusted_history = security.adjusted_history[security.adjusted_history.index >= end_date - self.lookback_period]
+            # Update the adjusted history and the EMAs
+            security.adjusted_history.append(end_date, consolidated_bar.close)
+            security.emac_signal.update(end_date, consolidated_bar.close)
+            self.update_volatility(security, end_date)
         else:
             # Otherwise update the raw history
             continuous_contract = self.algorithm.securities[security.symbol.canonical]
             if hasattr(continuous_contract, "latest_mapped") and consolidated_bar.symbol == continuous_contract.latest_mapped:
-                continuous_contract.raw_history.loc[end_date] = consolidated_bar.close
-                continuous_contract.raw_history = continuous_contract.raw_history[continuous_contract.raw_history.index >= end_date - self.lookback_period]
+                continuous_contract.raw_history.append(end_date, consolidated_bar.close)
+                self.update_volatility(continuous_contract, end_date)
             
             # Update the raw carry history
-            security.raw_history.loc[end_date] = consolidated_bar.close
-            security.raw_history = security.raw_history.iloc[-1:]
+            security.raw_history.append(end_date, consolidated_bar.close)
 
 
 
@@ -4,6 +4,7 @@ from insights import CarryTrendAlpha
 from buffered_portfolio import PortfolioConstruction
 from selection import FutureSelection
 from weights import GetWeights
+from checkpoint import save_checkpoint, load_checkpoint
 
 class CarryAndTrend(QCAlgorithm):
 
@@ -28,14 +29,15 @@ class CarryAndTrend(QCAlgorithm):
         self.universe_settings.data_mapping_mode = DataMappingMode.LAST_TRADING_DAY
         self.add_universe_selection(FutureSelection())
 
-        self.add_alpha(CarryTrendAlpha(
+        self.alpha = CarryTrendAlpha(
             self,
             self.get_parameter("emac_value", 6), 
             self.get_parameter("abs_forecast_limit", 20),           
             self.get_parameter("sigma_range", 32),
             self.get_parameter("risk_limit", 0.2),               
             self.get_parameter("blend_years", 3) 
-        ))
+        )
+        self.add_alpha(self.alpha)
         
         # We won't rebalance the portfolio if there are any changes in the insights or securities
 
@@ -45,10 +47,11 @@ class CarryAndTrend(QCAlgorithm):
         self.day = -1
         
         # Create our portfolio with a rebalancing function
-        self.set_portfolio_construction(PortfolioConstruction(
+        self.portfolio_model = PortfolioConstruction(
             self.rebalance_portfolio,
             self.get_parameter("buffer_value", 0.1)              # Hardcoded on p.167 & p.173
-        ))
+        )
+        self.set_portfolio_construction(self.portfolio_model)
 
         # Immediate execution to ensure that only orders are made based on the alpha model, if the portfolio value falls by 10% then liquidate
         self.set_execution(ImmediateExecutionModel())
@@ -56,7 +59,32 @@ class CarryAndTrend(QCAlgorithm):
         
 
         # We need several years of data to warm-up the algorithm
-        self.set_warm_up(self.start_date - datetime(2016, 1, 1)) 
+        # If the alpha state was saved in the object store then we resume from it and only replay the data since it was saved.
+        # Checkpoints are off unless a key is given, set the checkpoint_key parameter in live deployments so backtests stay reproducible
+        warm_up_start = datetime(2016, 1, 1)
+        self.checkpoint_key = self.get_parameter("checkpoint_key", "")
+        if self.checkpoint_key:
+            state = load_checkpoint(self, self.checkpoint_key)
+            if state is not None:
+                warm_up_start = self.alpha.set_state(state) or warm_up_start
+        self.set_warm_up(self.start_date - warm_up_start) 
+
+    # Save the alpha state at the end of the warm up so the next backtest with the same start date can skip it
+    def on_warmup_finished(self):
+        if self.checkpoint_key:
+            save_checkpoint(self, self.alpha, self.checkpoint_key)
+
+    # In live trading we save the latest state so a redeployment only replays the gap
+    def on_end_of_algorithm(self):
+        if self.checkpoint_key and self.live_mode:
+            save_checkpoint(self, self.alpha, self.checkpoint_key)
+
+        # Report how much trading the buffer avoided and how other buffer values compare
+        churn_statistics = self.portfolio_model.churn_statistics
+        self.set_runtime_statistic("Trades avoided by buffer", str(churn_statistics["trades avoided"]))
+        self.set_runtime_statistic("Contracts avoided by buffer", str(round(churn_statistics["contracts avoided"])))
+        for buffer_value, trades in churn_statistics["trades by buffer"].items():
+            self.log(f"Buffer {buffer_value}: {trades:.0f} trades, {churn_statistics['contracts by buffer'][buffer_value]:.0f} contracts")
 
     # Create a rebalancing function to rebalance the portfolio
     def rebalance_portfolio(self, time):
@@ -0,0 +1,91 @@
+# Import the required packages
+from AlgorithmImports import *
+
+# This script stores a date indexed price history in a fixed capacity NumPy ring buffer.
+# Every value is written twice (at i and i + capacity) so the live window is always one contiguous slice,
+# which lets us hand out the dates and values as views without copying them
+class PriceHistory:
+
+    def __init__(self, capacity, lookback_period=None):
+        # Initialise the class
+        self.capacity = capacity
+        self.lookback_period = lookback_period
+        self._dates = np.empty(2 * capacity, dtype="datetime64[D]")
+        self._values = np.empty(2 * capacity, dtype=np.float64)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    # Zero-copy views of the dates and values currently held, from the oldest to the latest
+    @property
+    def dates(self):
+        return self._dates[self._start:self._start + self._size]
+
+    @property
+    def values(self):
+        return self._values[self._start:self._start + self._size]
+
+    @property
+    def last_date(self):
+        return self._dates[self._start + self._size - 1].item() if self._size else None
+
+    @property
+    def last_value(self):
+        return self._values[self._start + self._size - 1] if self._size else None
+
+    @property
+    def first_date(self):
+        return self._dates[self._start].item() if self._size else None
+
+    @property
+    def first_value(self):
+        return self._values[self._start] if self._size else None
+
+    # Define a function to add a new price, a price for the latest date is overwritten in place
+    def append(self, date, value):
+        date = np.datetime64(date, "D")
+        if self._size and self._dates[self._start + self._size - 1] == date:
+            index = (self._start + self._size - 1) % self.capacity
+        else:
+            # If the buffer is full then the oldest price is dropped
+            if self._size == self.capacity:
+                self._start = (self._start + 1) % self.capacity
+                self._size -= 1
+            index = (self._start + self._size) % self.capacity
+            self._size += 1
+        self._dates[index] = self._dates[index + self.capacity] = date
+        self._values[index] = self._values[index + self.capacity] = value
+
+        # Then drop any prices that have fallen out of the lookback period
+        if self.lookback_period is not None:
+            self.evict_before(date - np.timedelta64(self.lookback_period.days, "D"))
+
+    # Define a function to drop the prices dated before a cutoff
+    def evict_before(self, cutoff):
+        if not self._size:
+            return
+        count = int(np.searchsorted(self.dates, np.datetime64(cutoff, "D"), side="left"))
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+    # Define functions to save and restore the prices, see checkpoint.py
+    def get_state(self):
+        return {"dates": self.dates.copy(), "values": self.values.copy()}
+
+    def set_state(self, state):
+        dates = state["dates"][-self.capacity:]
+        values = state["values"][-self.capacity:]
+        self._start = 0
+        self._size = len(dates)
+        self._dates[:self._size] = self._dates[self.capacity:self.capacity + self._size] = dates
+        self._values[:self._size] = self._values[self.capacity:self.capacity + self._size] = values
@@ -0,0 +1,412 @@
+# Import the required packages
+import sys
+import time
+import types
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+# This script replays futures term structures through CarryTrendAlpha, FutureSelection, the instrument weights and the
+# buffered PortfolioConstruction without the LEAN engine or any network access.
+# It installs lightweight stand-ins for the parts of AlgorithmImports these classes use, then feeds them daily bars
+# from synthetic or CSV term structures. See benchmark.py for the benchmark suite built on top of it
+
+# Stand-ins for the LEAN types used by the Carry and Trend classes
+class Symbol:
+    def __init__(self, value, market, expiry=None, canonical=None):
+        self.value = value
+        self.market = market
+        self.expiry = expiry
+        self.canonical = self if canonical is None else canonical
+        self.id = f"{value} {market}" if expiry is None else f"{value} {market} {expiry:%Y%m%d}"
+
+    @staticmethod
+    def create(ticker, security_type, market):
+        return Symbol(ticker, market)
+
+    # Create the symbol of a contract of this canonical future
+    def create_contract(self, expiry):
+        return Symbol(self.value, self.market, expiry, self)
+
+    def is_canonical(self):
+        return self.expiry is None
+
+    def __eq__(self, other):
+        return isinstance(other, Symbol) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return self.id
+
+class Event:
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self.handlers.remove(handler)
+        return self
+
+    def fire(self, *args):
+        for handler in list(self.handlers):
+            handler(*args)
+
+class TradeBarConsolidator:
+    def __init__(self, period):
+        self.period = period
+        self.data_consolidated = Event()
+
+class InsightDirection:
+    UP = 1
+    FLAT = 0
+    DOWN = -1
+
+class Insight:
+    def __init__(self, symbol, close_time_utc, direction):
+        self.symbol = symbol
+        self.close_time_utc = close_time_utc
+        self.direction = direction
+
+    @staticmethod
+    def price(symbol, expiry, direction):
+        return Insight(symbol, expiry, direction)
+
+class PortfolioTarget:
+    def __init__(self, symbol, quantity):
+        self.symbol = symbol
+        self.quantity = quantity
+
+class InsightManager:
+    def __init__(self):
+        self.insights = []
+        self.total_count = 0
+
+    def add_range(self, insights):
+        self.insights.extend(insights)
+        self.total_count += len(insights)
+
+    def remove_expired_insights(self, utc_time):
+        expired = [insight for insight in self.insights if insight.close_time_utc <= utc_time]
+        self.insights = [insight for insight in self.insights if insight.close_time_utc > utc_time]
+        return expired
+
+    def has_active_insights(self, symbol, utc_time):
+        return any(insight.symbol == symbol and insight.close_time_utc > utc_time for insight in self.insights)
+
+class AlphaModel:
+    pass
+
+class PortfolioConstructionModel:
+    def __init__(self, rebalance=None):
+        self.rebalancing_func = rebalance
+
+    def set_rebalancing_func(self, rebalance):
+        self.rebalancing_func = rebalance
+
+    def is_rebalance_due(self, insights, algorithm_utc):
+        return self.rebalancing_func is None or self.rebalancing_func(algorithm_utc) is not None
+
+    def on_securities_changed(self, algorithm, changes):
+        pass
+
+class FutureUniverseSelectionModel:
+    def __init__(self, refresh_interval, future_chain_symbol_selector):
+        self.refresh_interval = refresh_interval
+        self.future_chain_symbol_selector = future_chain_symbol_selector
+
+class FutureFilterUniverse:
+    def __init__(self, contracts, local_time):
+        self.contracts = contracts
+        self.local_time = local_time
+
+    def expiration(self, min_expiry_days, max_expiry_days):
+        return FutureFilterUniverse([symbol for symbol in self.contracts if timedelta(min_expiry_days) <= symbol.expiry - self.local_time <= timedelta(max_expiry_days)], self.local_time)
+
+class ExchangeHours:
+    def get_next_market_open(self, local_time, extended_market_hours):
+        return datetime.combine(local_time.date() + timedelta(1), datetime.min.time()) + timedelta(hours=9, minutes=30)
+
+class Extensions:
+    @staticmethod
+    def convert_to(time, from_time_zone, to_time_zone):
+        return time
+
+class ObjectStore:
+    def __init__(self):
+        self.contents = {}
+
+    def save_bytes(self, key, contents):
+        self.contents[key] = bytes(contents)
+
+    def read_bytes(self, key):
+        return self.contents[key]
+
+    def contains_key(self, key):
+        return key in self.contents
+
+class Security:
+    def __init__(self, symbol, contract_multiplier):
+        self.symbol = symbol
+        self.expiry = symbol.expiry
+        self.price = 0.0
+        self.mapped = None
+        self.symbol_properties = SimpleNamespace(contract_multiplier=contract_multiplier)
+        self.exchange = SimpleNamespace(time_zone="America/New_York", hours=ExchangeHours())
+        self.holdings = SimpleNamespace(quantity=0.0)
+
+class SubscriptionManager:
+    def __init__(self):
+        self.consolidators_by_symbol = {}
+
+    def add_consolidator(self, symbol, consolidator):
+        self.consolidators_by_symbol.setdefault(symbol, []).append(consolidator)
+
+    def remove_consolidator(self, symbol, consolidator):
+        consolidators = self.consolidators_by_symbol.get(symbol, [])
+        if consolidator in consolidators:
+            consolidators.remove(consolidator)
+        if not consolidators:
+            self.consolidators_by_symbol.pop(symbol, None)
+
+# The algorithm the models are attached to
+class ReplayAlgorithm:
+    def __init__(self, start_date, cash):
+        self.start_date = start_date
+        self.time = start_date
+        self.utc_time = start_date
+        self.time_zone = "America/New_York"
+        self.securities = {}
+        self.subscription_manager = SubscriptionManager()
+        self.portfolio = SimpleNamespace(total_portfolio_value=cash)
+        self.insights = InsightManager()
+        self.object_store = ObjectStore()
+
+def install_stand_ins():
+    # Make the stand-ins importable as AlgorithmImports so the Carry and Trend scripts can be imported unchanged
+    if "AlgorithmImports" in sys.modules:
+        return
+    algorithm_imports = types.ModuleType("AlgorithmImports")
+    futures = SimpleNamespace(
+        Currencies=SimpleNamespace(EUR="6E", GBP="6B", JPY="6J"),
+        Energies=SimpleNamespace(NATURAL_GAS="NG", CRUDE_OIL_WTI="CL"),
+        Financials=SimpleNamespace(Y_2_TREASURY_NOTE="ZT", Y_10_TREASURY_NOTE="ZN", Y_30_TREASURY_BOND="ZB"),
+        Grains=SimpleNamespace(CORN="ZC", SOYBEANS="ZS", WHEAT="ZW"),
+        Indices=SimpleNamespace(SP_500_E_MINI="ES", NASDAQ_100_E_MINI="NQ", RUSSELL_2000_E_MINI="RTY", VIX="VX"),
+        Metals=SimpleNamespace(COPPER="HG", GOLD="GC", SILVER="SI")
+    )
+    names = {
+        "np": np, "pd": pd, "datetime": datetime, "timedelta": timedelta, "List": List, "Callable": Callable,
+        "Symbol": Symbol, "SecurityType": SimpleNamespace(FUTURE="Future"), "Futures": futures,
+        "Market": SimpleNamespace(CME="cme", NYMEX="nymex", CBOT="cbot", CFE="cfe", COMEX="comex", USA="usa"),
+        "Resolution": SimpleNamespace(DAILY="Daily", HOUR="Hour", MINUTE="Minute"),
+        "AlphaModel": AlphaModel, "PortfolioConstructionModel": PortfolioConstructionModel,
+        "Insight": Insight, "InsightDirection": InsightDirection, "PortfolioTarget": PortfolioTarget,
+        "TradeBarConsolidator": TradeBarConsolidator, "Extensions": Extensions,
+        "FutureFilterUniverse": FutureFilterUniverse,
+        "QCAlgorithm": object, "Slice": object, "SecurityChanges": object, "TradeBar": object
+    }
+    for name, value in names.items():
+        setattr(algorithm_imports, name, value)
+    sys.modules["AlgorithmImports"] = algorithm_imports
+
+    selection = types.ModuleType("Selection")
+    future_universe_selection = types.ModuleType("Selection.FutureUniverseSelectionModel")
+    future_universe_selection.FutureUniverseSelectionModel = FutureUniverseSelectionModel
+    selection.FutureUniverseSelectionModel = future_universe_selection
+    sys.modules["Selection"] = selection
+    sys.modules["Selection.FutureUniverseSelectionModel"] = future_universe_selection
+
+# The futures data that is replayed. Each market has a matrix of contract closes (contracts x days), NaN when a contract is not listed
+class MarketData:
+    def __init__(self, symbol, classification, contract_offset, contract_multiplier, expiries, closes):
+        self.symbol = symbol
+        self.classification = classification
+        self.contract_offset = contract_offset
+        self.contract_multiplier = contract_multiplier
+        self.expiries = list(expiries)
+        self.contract_symbols = [symbol.create_contract(expiry) for expiry in self.expiries]
+        self.closes = closes
+
+class TermStructure:
+    def __init__(self, dates, markets):
+        self.dates = list(dates)
+        self.markets = markets
+        for market in self.markets:
+            self.map_contracts(market)
+
+    # Map each day to the contract with the nearest expiry after it, then back adjust the mapped prices at each roll
+    def map_contracts(self, market):
+        day_times = np.array([datetime.combine(day, datetime.min.time()) for day in self.dates])
+        expiries = np.array(market.expiries)
+        listed = ~np.isnan(market.closes)
+        mapped = np.full(len(self.dates), -1)
+        for t, day_time in enumerate(day_times):
+            candidates = np.flatnonzero((expiries > day_time) & listed[:, t])
+            if len(candidates):
+                mapped[t] = candidates[np.argmin(expiries[candidates])]
+        raw = np.array([market.closes[i, t] if i >= 0 else np.nan for t, i in enumerate(mapped)])
+        gaps = np.zeros(len(self.dates))
+        for t in range(1, len(self.dates)):
+            if mapped[t] != mapped[t - 1] and mapped[t] >= 0 and mapped[t - 1] >= 0:
+                gaps[t] = market.closes[mapped[t], t - 1] - market.closes[mapped[t - 1], t - 1]
+        # Every price is shifted by the gaps of the rolls that come after it
+        gaps = np.nan_to_num(gaps)
+        market.mapped = mapped
+        market.adjusted = raw + np.cumsum(gaps[::-1])[::-1] - gaps
+
+    # Define a function to generate a synthetic term structure. Each market follows a random walk with a constant carry yield
+    # and lists quarterly contracts roughly 400 days before they expire
+    @staticmethod
+    def synthetic(n_markets, start, end, seed=1, contracts_table=None):
+        random = np.random.default_rng(seed)
+        dates = [day.date() for day in pd.bdate_range(start, end)]
+        first_expiry_year = dates[0].year
+        last_expiry_year = dates[-1].year + 2
+        expiries = [datetime(year, month, 15) for year in range(first_expiry_year, last_expiry_year + 1) for month in (3, 6, 9, 12)]
+        day_times = np.array([datetime.combine(day, datetime.min.time()) for day in dates])
+
+        # The first markets are the ones the strategy trades, the rest are synthetic markets spread across synthetic classes
+        table = list(contracts_table.items()) if contracts_table else []
+        markets = []
+        for i in range(n_markets):
+            if i < len(table):
+                symbol, contract_data = table[i]
+                classification, contract_offset = contract_data.classification, contract_data.contract_offset
+            else:
+                symbol = Symbol(f"SYN{i}", "synthetic")
+                classification, contract_offset = (f"Class {i % 8}", f"Subclass {i % 3}"), 0
+            spot = 100 * np.exp(np.cumsum(random.normal(0, random.uniform(0.005, 0.02), len(dates))))
+            carry_yield = random.normal(0, 0.05)
+            closes = np.full((len(expiries), len(dates)), np.nan)
+            for j, expiry in enumerate(expiries):
+                days_to_expiry = np.array([(expiry - day_time).days for day_time in day_times])
+                live = (days_to_expiry >= 0) & (days_to_expiry <= 400)
+                closes[j, live] = spot[live] * np.exp(-carry_yield * days_to_expiry[live] / 365)
+            markets.append(MarketData(symbol, classification, contract_offset, 50, expiries, closes))
+        return TermStructure(dates, markets)
+
+    # Define a function to load a term structure from a CSV file with the columns date, market, expiry and close
+    # The optional columns class, subclass, contract_offset and multiplier describe each market
+    @staticmethod
+    def from_csv(path):
+        frame = pd.read_csv(path, parse_dates=["date", "expiry"])
+        dates = sorted(frame["date"].dt.date.unique())
+        index_by_date = {day: t for t, day in enumerate(dates)}
+        markets = []
+        for name, market_frame in frame.groupby("market"):
+            first = market_frame.iloc[0]
+            expiries = sorted(set(market_frame["expiry"].dt.to_pydatetime().tolist()))
+            index_by_expiry = {expiry: j for j, expiry in enumerate(expiries)}
+            closes = np.full((len(expiries), len(dates)), np.nan)
+            for row in market_frame.itertuples():
+                closes[index_by_expiry[row.expiry.to_pydatetime()], index_by_date[row.date.date()]] = row.close
+            classification = (first.get("class", name), first.get("subclass", name))
+            markets.append(MarketData(Symbol(name, "csv"), classification, int(first.get("contract_offset", 0)), float(first.get("multiplier", 1)), expiries, closes))
+        return TermStructure(dates, markets)
+
+# The replay of a term structure through the models
+class Replay:
+    def __init__(self, term_structure, start_date, emac_filters=6, abs_forecast_limit=20, sigma_range=32, risk_tol=0.2, blend_years=3, buffer_value=0.1, cash=10000000):
+        install_stand_ins()
+        from futures_contracts import ContractsData
+        from insights import CarryTrendAlpha
+        from buffered_portfolio import PortfolioConstruction
+        from selection import FutureSelection
+
+        # Initialise the class
+        self.term_structure = term_structure
+        self.algorithm = ReplayAlgorithm(start_date, cash)
+        self.alpha = CarryTrendAlpha(self.algorithm, emac_filters, abs_forecast_limit, sigma_range, risk_tol, blend_years)
+        self.alpha.contracts = {market.symbol: ContractsData(market.classification, market.contract_offset) for market in term_structure.markets}
+        self.portfolio_model = PortfolioConstruction(lambda time: time, buffer_value)
+        self.selection = FutureSelection()
+        self.update_latencies = []
+        self.insight_count = 0
+
+    def run(self, on_day=None):
+        for t, day in enumerate(self.term_structure.dates):
+            self.step(t, day)
+            if on_day is not None:
+                on_day(self, t, day)
+
+    def step(self, t, day):
+        algorithm = self.algorithm
+        algorithm.time = algorithm.utc_time = datetime.combine(day, datetime.min.time()) + timedelta(hours=10)
+
+        # First update the universe, the prices and the daily bars
+        added, removed = self.update_universe(t)
+        if added or removed:
+            changes = SimpleNamespace(added_securities=added, removed_securities=removed)
+            self.alpha.on_securities_changed(algorithm, changes)
+            self.portfolio_model.on_securities_changed(algorithm, changes)
+        previous_prices = {symbol: security.price for symbol, security in algorithm.securities.items()}
+        self.update_prices(t)
+        self.consolidate(t, day)
+
+        # Then run the alpha model and portfolio construction
+        data = SimpleNamespace(time=algorithm.time, quote_bars=SimpleNamespace(count=1))
+        start = time.perf_counter()
+        insights = self.alpha.update(algorithm, data)
+        self.update_latencies.append(time.perf_counter() - start)
+        self.insight_count += len(insights)
+        algorithm.insights.add_range(insights)
+        targets = self.portfolio_model.create_targets(algorithm, insights)
+
+        # Finally mark the holdings to market and fill the targets at the current price
+        profit = sum(security.holdings.quantity * (security.price - previous_prices.get(symbol, security.price)) * security.symbol_properties.contract_multiplier
+                     for symbol, security in algorithm.securities.items() if security.holdings.quantity)
+        algorithm.portfolio.total_portfolio_value += profit
+        for target in targets:
+            # Contracts that have left the universe were closed at their last price
+            if target.symbol in algorithm.securities:
+                algorithm.securities[target.symbol].holdings.quantity = target.quantity
+
+    def update_universe(self, t):
+        algorithm = self.algorithm
+        added, removed = [], []
+        for market in self.term_structure.markets:
+            if market.symbol not in algorithm.securities:
+                canonical = Security(market.symbol, market.contract_multiplier)
+                algorithm.securities[market.symbol] = canonical
+                added.append(canonical)
+            listed = [symbol for j, symbol in enumerate(market.contract_symbols) if not np.isnan(market.closes[j, t])]
+            selected = set(self.selection.expiry_filter(FutureFilterUniverse(listed, algorithm.time)).contracts)
+            current = {symbol for symbol in market.contract_symbols if symbol in algorithm.securities}
+            for symbol in selected - current:
+                security = Security(symbol, market.contract_multiplier)
+                algorithm.securities[symbol] = security
+                added.append(security)
+            for symbol in current - selected:
+                removed.append(algorithm.securities.pop(symbol))
+        return added, removed
+
+    def update_prices(self, t):
+        algorithm = self.algorithm
+        for market in self.term_structure.markets:
+            for j, symbol in enumerate(market.contract_symbols):
+                if symbol in algorithm.securities and not np.isnan(market.closes[j, t]):
+                    algorithm.securities[symbol].price = market.closes[j, t]
+            canonical = algorithm.securities[market.symbol]
+            if market.mapped[t] >= 0:
+                canonical.mapped = market.contract_symbols[market.mapped[t]]
+                canonical.price = market.adjusted[t]
+
+    # Define a function to send the daily bars to the consolidators that are registered
+    def consolidate(self, t, day):
+        algorithm = self.algorithm
+        end_time = datetime.combine(day, datetime.min.time()) + timedelta(hours=16)
+        for symbol, consolidators in list(algorithm.subscription_manager.consolidators_by_symbol.items()):
+            security = algorithm.securities.get(symbol)
+            if security is None or not security.price:
+                continue
+            bar = SimpleNamespace(symbol=symbol, end_time=end_time, close=security.price)
+            for consolidator in list(consolidators):
+                consolidator.data_consolidated.fire(consolidator, bar)
@@ -0,0 +1,314 @@
+# Import the required packages
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from replay import TermStructure, install_stand_ins
+
+# This script sweeps the parameters that CarryAndTrend reads through get_parameter over a grid, running the grid points across a process pool.
+# The series that do not depend on the swept parameters (the EWMAC of every 2**x span, the smoothed carry, the prices and the
+# instrument weights) are computed once in the parent process and shared read only with the workers through shared memory.
+# The volatility estimates only depend on sigma_range and blend_years, so they are computed once for each pair of them.
+# Each worker then only evaluates the forecasts, the positions and the buffered trades of its grid points.
+# The series are computed with the classes of CarryTrendAlpha (EmacSignal, CarrySignal and VolatilityEstimator) and the forecasts
+# with its vectorised functions, with every day and market as one row. The profit is measured on the back adjusted price
+# of the continuous contract.
+# Run it with `python sweep.py --emac_value 4 5 6 --sigma_range 16 32 64 --buffer_value 0 0.1 0.2`
+
+# The parameters of CarryAndTrend and their defaults, see main.py
+default_parameters = {
+    "emac_value": [6],
+    "abs_forecast_limit": [20],
+    "sigma_range": [32],
+    "risk_limit": [0.2],
+    "blend_years": [3],
+    "buffer_value": [0.1]
+}
+
+# Shared arrays are passed to the workers as the name of their shared memory block, their shape and their dtype
+class SharedArrays:
+
+    def __init__(self):
+        # Initialise the class
+        self.blocks = []
+        self.specs = {}
+
+    def add(self, name, array):
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        self.blocks.append(block)
+        self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    # Define a function to attach to the shared arrays from a worker, the views are made read only
+    @staticmethod
+    def attach(specs):
+        blocks, arrays = [], {}
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            blocks.append(block)
+            arrays[name] = array
+        return blocks, arrays
+
+# Define a function to align a series computed on the days a market has data with all the days, holding the latest value
+def fill_forward(values, valid):
+    filled = pd.Series(np.nan, index=np.arange(len(valid)))
+    filled[valid] = values
+    return filled.ffill().to_numpy()
+
+# Define a function to compute the series of every market that do not depend on the swept parameters, with the signals of the alpha
+def precompute_series(term_structure, alpha, instrument_weights, contracts):
+    from carry import CarrySignal
+    from emac import EmacSignal
+
+    dates = term_structure.dates
+    n_days, n_markets = len(dates), len(term_structure.markets)
+    ewmacs = np.full((len(alpha.emac_range), n_days, n_markets), np.nan)
+    smoothed_carry = np.full((len(alpha.carry_range), n_days, n_markets), np.nan)
+    raw_prices = np.full((n_days, n_markets), np.nan)
+    adjusted_prices = np.full((n_days, n_markets), np.nan)
+    prices = np.full((n_days, n_markets), np.nan)
+    price_changes = np.zeros((n_days, n_markets))
+    multipliers = np.array([market.contract_multiplier for market in term_structure.markets])
+
+    for m, market in enumerate(term_structure.markets):
+        valid = market.mapped >= 0
+        t_valid = np.flatnonzero(valid)
+        mapped = market.mapped[t_valid]
+        raw = market.closes[mapped, t_valid]
+        adjusted = market.adjusted[t_valid]
+        adjusted_prices[t_valid, m] = adjusted
+        # The volatility reads the close of the contract that was mapped the day before, as the alpha only updates latest_mapped
+        # after the daily bars are consolidated. The old contract has expired on the day of a roll, so that day has no raw price
+        t_held = t_valid[1:][market.mapped[t_valid[1:] - 1] == mapped[1:]]
+        raw_prices[t_held, m] = market.closes[market.mapped[t_held], t_held]
+
+        # The carry is the annualised difference between the mapped contract and the next one
+        has_further = mapped + 1 < len(market.expiries)
+        further = np.full(len(t_valid), np.nan)
+        further[has_further] = market.closes[mapped[has_further] + 1, t_valid[has_further]]
+        expiries = np.array(market.expiries, dtype="datetime64[D]")
+        month_diff = np.round((expiries[np.minimum(mapped + 1, len(expiries) - 1)] - expiries[mapped]).astype(np.float64) / 30)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            carry = (raw - further) / (np.abs(month_diff) / 12)
+
+        # The alpha subscribes to the contracts of the carry on the day it first maps the future, so they have a bar from the next day
+        has_carry = np.isfinite(carry) & (market.mapped[np.maximum(t_valid - 1, 0)] >= 0) & (t_valid > 0)
+
+        # The trend and the carry are updated as the alpha updates them, each day the market has a bar
+        emac_signal = EmacSignal(alpha.fast_ema_range, alpha.slow_ema_range)
+        carry_signal = CarrySignal(alpha.carry_range, alpha.history_capacity, alpha.lookback_period)
+        for k, t in enumerate(t_valid):
+            emac_signal.update(dates[t], adjusted[k])
+            ewmacs[:, t, m] = emac_signal.ewmac
+            if has_carry[k]:
+                carry_signal.update(dates[t], carry[k])
+            smoothed_carry[:, t, m] = carry_signal.smoothed_carry
+        for series in (ewmacs, smoothed_carry):
+            series[:, :, m] = pd.DataFrame(series[:, :, m].T).ffill().to_numpy().T
+
+        price_changes[t_valid[1:], m] = np.diff(adjusted)
+
+        # The positions are sized on the contract that is traded, which is the mapped contract or the next one
+        target_price = raw if contracts[market.symbol].contract_offset == 0 else further
+        prices[:, m] = fill_forward(target_price, valid)
+
+    # The instrument weights are split between the markets with data on each day
+    classifications = [contracts[market.symbol].classification for market in term_structure.markets]
+    weights = np.zeros((n_days, n_markets))
+    for t in range(n_days):
+        active = np.flatnonzero(~np.isnan(prices[t]))
+        if len(active):
+            weights[t, active] = instrument_weights.get_weights([classifications[m] for m in active])
+
+    return {
+        "ewmacs": ewmacs,
+        "smoothed_carry": smoothed_carry,
+        "raw_prices": raw_prices,
+        "adjusted_prices": adjusted_prices,
+        "prices": prices,
+        "price_changes": price_changes * multipliers,
+        "multipliers": np.broadcast_to(multipliers, (n_days, n_markets)),
+        "weights": weights
+    }
+
+# Define a function to compute the blended volatility estimate of every market for one sigma_range and blend_years,
+# with the VolatilityEstimator of the alpha updated on each day the market has a bar
+def blended_volatility(raw_prices, adjusted_prices, dates, sigma_range, blend_years):
+    install_stand_ins()
+    from insights import CarryTrendAlpha
+    from volatility import VolatilityEstimator
+
+    # Only the volatility parameters of the alpha are read, the others are the defaults
+    alpha = CarryTrendAlpha(None, default_parameters["emac_value"][0], default_parameters["abs_forecast_limit"][0], sigma_range, default_parameters["risk_limit"][0], blend_years)
+    blended = np.full(raw_prices.shape, np.nan)
+    for m in range(raw_prices.shape[1]):
+        volatility_estimator = VolatilityEstimator(alpha.sigma_range, alpha.annualisation_factor, alpha.lookback_period)
+        for t in np.flatnonzero(~np.isnan(raw_prices[:, m])):
+            volatility_estimator.update(dates[t], raw_prices[t, m], adjusted_prices[t, m])
+            estimate = volatility_estimator.blended_estimate
+            blended[t, m] = np.nan if estimate is None else estimate
+    return pd.DataFrame(blended).ffill().to_numpy()
+
+# The shared arrays and the model constants of each worker
+worker_state = {}
+
+def initialise_worker(specs, constants):
+    install_stand_ins()
+    worker_state["blocks"], worker_state["arrays"] = SharedArrays.attach(specs)
+    worker_state.update(constants)
+
+# Define a function to evaluate one grid point
+def evaluate(parameters):
+    from insights import CarryTrendAlpha
+
+    arrays = worker_state["arrays"]
+    first_day = worker_state["first_day"]
+    alpha = CarryTrendAlpha(None, int(parameters["emac_value"]), parameters["abs_forecast_limit"], parameters["sigma_range"], parameters["risk_limit"], parameters["blend_years"])
+    span_index = [worker_state["all_emac_range"].index(span) for span in alpha.emac_range]
+    std_pcts = arrays["volatility"][worker_state["volatility_index"][(parameters["sigma_range"], parameters["blend_years"])]]
+
+    # The forecasts and positions of every day and market at once, with the functions of CarryTrendAlpha.update on a row per day and market
+    daily_risk_prices = std_pcts[first_day:] / alpha.annualisation_factor * arrays["prices"][first_day:]
+    shape = daily_risk_prices.shape
+    with np.errstate(divide="ignore", invalid="ignore"):
+        positions = (worker_state["capital"] * alpha.idm * arrays["weights"][first_day:] * alpha.risk_tol) / (arrays["multipliers"][first_day:] * daily_risk_prices * alpha.annualisation_factor)
+        ewmac_values = arrays["ewmacs"][span_index, first_day:].transpose(1, 2, 0).reshape(-1, len(span_index))
+        smoothed_carry = arrays["smoothed_carry"][:, first_day:].transpose(1, 2, 0).reshape(-1, len(alpha.carry_range))
+        emac_forecasts = alpha.calculate_emac_forecasts(ewmac_values, daily_risk_prices.ravel())
+        carry_forecasts = alpha.calculate_carry_forecasts(smoothed_carry, daily_risk_prices.ravel())
+        forecasts, has_forecast = alpha.calculate_combined_forecasts(emac_forecasts, carry_forecasts)
+    forecasts, has_forecast = forecasts.reshape(shape), has_forecast.reshape(shape)
+    has_forecast &= np.isfinite(forecasts) & np.isfinite(positions)
+
+    # The buffer depends on the holdings, so the trades are found one day at a time, for all the markets at once
+    buffer_value = parameters["buffer_value"]
+    holdings = np.zeros(positions.shape[1])
+    profits = np.zeros(positions.shape[0])
+    price_changes = arrays["price_changes"][first_day:]
+    trades, contracts_traded = 0, 0.0
+    for t in range(positions.shape[0]):
+        profits[t] = holdings @ price_changes[t]
+        active = has_forecast[t]
+        best_positions = forecasts[t, active] * positions[t, active] / 10
+        buffer_range = buffer_value * np.abs(positions[t, active])
+        lower_limits = np.round(best_positions - buffer_range)
+        upper_limits = np.round(best_positions + buffer_range)
+        current = holdings[active]
+        amounts = np.where(current < lower_limits, lower_limits, np.where(current > upper_limits, upper_limits, current))
+        trades += int(np.count_nonzero(amounts != current))
+        contracts_traded += float(np.abs(amounts - current).sum())
+        holdings[active] = amounts
+        # Markets without a forecast are liquidated, as their insights expire
+        contracts_traded += float(np.abs(holdings[~active]).sum())
+        trades += int(np.count_nonzero(holdings[~active]))
+        holdings[~active] = 0
+
+    # Then summarise the daily returns on the capital
+    daily_returns = profits / worker_state["capital"]
+    equity = np.cumsum(daily_returns)
+    annual_return = daily_returns.mean() * worker_state["business_days"]
+    annual_volatility = daily_returns.std() * worker_state["annualisation_factor"]
+    return {
+        **parameters,
+        "annual return": annual_return,
+        "annual volatility": annual_volatility,
+        "sharpe ratio": annual_return / annual_volatility if annual_volatility > 0 else np.nan,
+        "max drawdown": float(np.max(np.maximum.accumulate(np.maximum(equity, 0)) - equity)) if len(equity) else 0.0,
+        "trades": trades,
+        "contracts traded": contracts_traded
+    }
+
+# Define a function to run the sweep over the grid of parameters, the results are sorted by Sharpe ratio
+def run_sweep(term_structure, parameter_grid, start_date, capital=10000000, max_workers=None):
+    install_stand_ins()
+    from futures_contracts import ContractsData, contracts as contracts_table
+    from insights import CarryTrendAlpha
+    from weights import InstrumentWeights
+
+    contracts = dict(contracts_table)
+    for market in term_structure.markets:
+        if market.symbol not in contracts:
+            contracts[market.symbol] = ContractsData(market.classification, market.contract_offset)
+
+    # The series are computed with the longest EMAC filter of the grid, the grid points read the spans they use
+    alpha = CarryTrendAlpha(None, int(max(parameter_grid["emac_value"])), default_parameters["abs_forecast_limit"][0], default_parameters["sigma_range"][0],
+                            default_parameters["risk_limit"][0], default_parameters["blend_years"][0])
+    series = precompute_series(term_structure, alpha, InstrumentWeights(), contracts)
+    volatility_pairs = sorted(set(itertools.product(parameter_grid["sigma_range"], parameter_grid["blend_years"])))
+
+    constants = {
+        "first_day": int(np.searchsorted(np.array(term_structure.dates), start_date.date())),
+        "all_emac_range": alpha.emac_range,
+        "volatility_index": {pair: k for k, pair in enumerate(volatility_pairs)},
+        "business_days": CarryTrendAlpha.business_days,
+        "annualisation_factor": alpha.annualisation_factor,
+        "capital": capital
+    }
+    names = list(parameter_grid)
+    grid = [dict(zip(names, values)) for values in itertools.product(*parameter_grid.values())]
+
+    shared_arrays = SharedArrays()
+    try:
+        # The volatility of each pair of sigma_range and blend_years is computed across the pool too
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            sigma_ranges, blend_years = zip(*volatility_pairs)
+            series["volatility"] = np.stack(list(executor.map(blended_volatility, itertools.repeat(series["raw_prices"]), itertools.repeat(series["adjusted_prices"]),
+                                                              itertools.repeat(term_structure.dates), sigma_ranges, blend_years)))
+        for name in ("raw_prices", "adjusted_prices"):
+            del series[name]
+        for name, array in series.items():
+            shared_arrays.add(name, array)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=initialise_worker, initargs=(shared_arrays.specs, constants)) as executor:
+            results = list(executor.map(evaluate, grid, chunksize=max(1, len(grid) // (4 * (max_workers or os.cpu_count() or 1)))))
+    finally:
+        shared_arrays.close()
+    return pd.DataFrame(results).sort_values("sharpe ratio", ascending=False, ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the CarryAndTrend parameters over a grid on the offline replay data")
+    parser.add_argument("--csv", help="CSV term structure with the columns date, market, expiry and close, synthetic data is used if not given")
+    parser.add_argument("--markets", type=int, default=18, help="number of synthetic markets")
+    parser.add_argument("--start", default="2012-01-01", help="first day of the synthetic data")
+    parser.add_argument("--end", default="2019-12-31", help="last day of the synthetic data")
+    parser.add_argument("--start-date", help="first day the grid points are evaluated on, the data before it is the warm up (defaults to a third of the data)")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--output", help="CSV file to save the results to")
+    for name, default in default_parameters.items():
+        parser.add_argument(f"--{name}", type=type(default[0]), nargs="+", default=default)
+    args = parser.parse_args()
+
+    install_stand_ins()
+    from futures_contracts import contracts
+
+    if args.csv:
+        term_structure = TermStructure.from_csv(args.csv)
+    else:
+        term_structure = TermStructure.synthetic(args.markets, args.start, args.end, contracts_table=contracts)
+    start_date = datetime.strptime(args.start_date, "%Y-%m-%d") if args.start_date else datetime.combine(term_structure.dates[len(term_structure.dates) // 3], datetime.min.time())
+
+    parameter_grid = {name: getattr(args, name) for name in default_parameters}
+    start = time.perf_counter()
+    results = run_sweep(term_structure, parameter_grid, start_date, max_workers=args.workers)
+    print(f"Evaluated {len(results)} grid points in {time.perf_counter() - start:.1f}s")
+    print(results.to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Import the required packages
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+
+from replay import install_stand_ins
+
+install_stand_ins()
+from carry import CarrySignal
+
+# This script checks that a carry observation for a date that is updated several times, as the alpha does on every slice
+# until it emits its insights, leaves the signal as if the latest value had been added once
+class CarrySignalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = [date(2024, 1, 1) + timedelta(days) for days in range(30)]
+        self.carry = np.random.default_rng(0).normal(0, 0.1, len(self.dates))
+
+    # Define a function to create a signal with short spans, so the smoothed carry is not NaN
+    def create_signal(self):
+        return CarrySignal([2, 4, 8], 64, timedelta(365))
+
+    def test_repeated_date_matches_single_update(self):
+        single, repeated = self.create_signal(), self.create_signal()
+        for day, carry in zip(self.dates, self.carry):
+            single.update(day, carry)
+            # Update the same date with other values first, then with the final one
+            for value in [carry + 1, carry - 2, carry + 0.5, carry]:
+                repeated.update(day, value)
+        np.testing.assert_allclose(repeated.means, single.means, rtol=1e-12)
+        np.testing.assert_allclose(repeated.old_wts, single.old_wts, rtol=1e-12)
+        np.testing.assert_allclose(repeated.smoothed_carry, single.smoothed_carry, rtol=1e-12)
+        self.assertEqual(repeated.nobs, single.nobs)
+
+    def test_repeated_date_after_restore(self):
+        single, repeated = self.create_signal(), self.create_signal()
+        for day, carry in zip(self.dates[:-1], self.carry[:-1]):
+            single.update(day, carry)
+            repeated.update(day, carry)
+        # A signal restored from a checkpoint must still undo the latest date correctly
+        restored = self.create_signal()
+        restored.set_state(repeated.get_state())
+        for value in [1.0, -1.0, 2.0, self.carry[-2]]:
+            restored.update(self.dates[-2], value)
+        single.update(self.dates[-1], self.carry[-1])
+        restored.update(self.dates[-1], self.carry[-1])
+        np.testing.assert_allclose(restored.smoothed_carry, single.smoothed_carry, rtol=1e-12)
+
+if __name__ == "__main__":
+    unittest.main()
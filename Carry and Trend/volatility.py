@@ -0,0 +1,140 @@
+# Import the required packages
+from AlgorithmImports import *
+from collections import deque
+
+# This script keeps a streaming estimate of the annualised standard deviation of % daily returns for a future.
+# The blend reproduces the pandas path on the price window trimmed to the lookback period: the estimates of
+# returns.ewm(span=sigma_range, min_periods=sigma_range).std() (adjust=True, bias=False) over the returns of the window,
+# with the EWM starting again at the start of the window every day.
+# Each return keeps the decayed sums of the weights, the weighted returns, the weighted squared returns and the squared weights
+# since the first return. The sums of an EWM that starts after a return are the sums at each later return minus the sums of
+# that return decayed by the number of returns in between, so the estimates of the whole window are one vectorised pass
+class VolatilityEstimator:
+
+    def __init__(self, sigma_range, annualisation_factor, lookback_period):
+        # Initialise the class
+        self.decay = 1 - 2 / (sigma_range + 1)
+        self.min_periods = sigma_range
+        self.annualisation_factor = annualisation_factor
+        self.lookback_period = lookback_period
+        # The returns are kept in a ring buffer like PriceHistory, every return is written twice so the window is one contiguous slice.
+        # There is at most one return per calendar day in the window, plus the one that starts it
+        self.capacity = lookback_period.days + 2
+        self._return_dates = np.empty(2 * self.capacity, dtype="datetime64[D]")
+        self._return_sums = np.empty((2 * self.capacity, 4), dtype=np.float64)
+        # The returns are numbered consecutively, so the decay of the sums at the start of the window is the same at each position
+        steps = np.arange(1, self.capacity + 1)[:, None]
+        self.start_decays = self.decay ** (steps * np.array([1, 1, 1, 2]))
+        self.reset()
+
+    def reset(self):
+        # The last aligned raw and adjusted prices are needed to compute the next return
+        self.last_date = None
+        self.last_raw = None
+        self.last_adjusted = None
+
+        # Decayed sums of the weights, weighted returns, weighted squared returns and squared weights
+        self.sums = np.zeros(4)
+
+        # Dates of the aligned prices inside the lookback window
+        self.price_dates = deque()
+
+        # Date and decayed sums of each return inside the window, and of the return on the first price date if there is one
+        self._start = 0
+        self._size = 0
+        self._blended_estimate = None
+        self._blended_stale = True
+
+    # Zero-copy views of the returns currently held, from the oldest to the latest
+    @property
+    def return_dates(self):
+        return self._return_dates[self._start:self._start + self._size]
+
+    @property
+    def return_sums(self):
+        return self._return_sums[self._start:self._start + self._size]
+
+    # Define a function that consumes a new aligned pair of raw and adjusted prices
+    def update(self, date, raw, adjusted):
+        # Prices are only accepted once per date and in chronological order
+        if self.last_date is not None and date <= self.last_date:
+            return
+        # Drop the price dates that have fallen out of the lookback period, as the price histories are trimmed
+        self.price_dates.append(date)
+        while self.price_dates[0] < date - self.lookback_period:
+            self.price_dates.popleft()
+        if self.last_date is not None:
+            self.update_sums(date, (adjusted - self.last_adjusted) / self.last_raw)
+        # Drop the returns before the first price date, the return on that date starts the EWM of the window
+        count = int(np.searchsorted(self.return_dates, np.datetime64(self.price_dates[0], "D"), side="left"))
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+        self._blended_stale = True
+        self.last_date = date
+        self.last_raw = raw
+        self.last_adjusted = adjusted
+
+    def update_sums(self, date, value):
+        # Decay the existing weights, then fold in the new observation with a weight of 1
+        self.sums *= (self.decay, self.decay, self.decay, self.decay * self.decay)
+        self.sums += (1.0, value, value * value, 1.0)
+        if self._size == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+        index = (self._start + self._size) % self.capacity
+        self._size += 1
+        self._return_dates[index] = self._return_dates[index + self.capacity] = np.datetime64(date, "D")
+        self._return_sums[index] = self._return_sums[index + self.capacity] = self.sums
+
+    # Define a function that computes the annualised estimates of the returns inside the window, NaN before min_periods returns
+    def annualised_stds(self):
+        sums = self.return_sums
+        has_start = self._size > 0 and self.return_dates[0] == np.datetime64(self.price_dates[0], "D")
+        if len(sums) - has_start < self.min_periods:
+            return np.array([])
+        if has_start:
+            # Remove the sums up to the start of the window, decayed by the number of returns since then
+            sums = sums[1:] - self.start_decays[:len(sums) - 1] * sums[0]
+        sum_wt, sum_x, sum_x2, sum_wt2 = sums.T
+        mean = sum_x / sum_wt
+        var = np.maximum(sum_x2 / sum_wt - mean * mean, 0)
+        # Then apply the bias correction to obtain the unbiased variance
+        numerator = sum_wt * sum_wt
+        denominator = numerator - sum_wt2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stds = np.where(denominator > 0, np.sqrt(numerator / denominator * var), np.nan) * self.annualisation_factor
+        stds[:self.min_periods - 1] = np.nan
+        return stds
+
+    # Define functions to save and restore the estimator, see checkpoint.py
+    def get_state(self):
+        return {
+            "last_date": np.datetime64(self.last_date, "D") if self.last_date is not None else np.datetime64("NaT", "D"),
+            "last_prices": np.array([self.last_raw, self.last_adjusted], dtype=np.float64),
+            "sums": self.sums.copy(),
+            "price_dates": np.array(self.price_dates, dtype="datetime64[D]"),
+            "return_dates": self.return_dates.copy(),
+            "return_sums": self.return_sums.copy()
+        }
+
+    def set_state(self, state):
+        self.reset()
+        self.last_date = state["last_date"].item()
+        if self.last_date is not None:
+            self.last_raw, self.last_adjusted = state["last_prices"].tolist()
+        self.sums = state["sums"].astype(np.float64)
+        self.price_dates.extend(state["price_dates"].tolist())
+        self._size = len(state["return_dates"])
+        self._return_dates[:self._size] = self._return_dates[self.capacity:self.capacity + self._size] = state["return_dates"]
+        self._return_sums[:self._size] = self._return_sums[self.capacity:self.capacity + self._size] = state["return_sums"]
+
+    # Obtain a blended estimate of the annualised standard deviation
+    @property
+    def blended_estimate(self):
+        # The estimates only change with a new price, so the blend is computed once per price
+        if self._blended_stale:
+            stds = self.annualised_stds()
+            stds = stds[~np.isnan(stds)]
+            self._blended_estimate = 0.3 * stds.mean() + 0.7 * stds[-1] if len(stds) > 0 else None
+            self._blended_stale = False
+        return self._blended_estimate
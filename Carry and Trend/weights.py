@@ -1,22 +1,57 @@
 # Import the required packages
 from AlgorithmImports import *
+from collections import Counter, OrderedDict
+
+# The default scheme gives each asset class an equal weight, then splits it equally between its subclasses and then between the instruments in each subclass
+# A scheme takes the number of instruments in each (class, subclass) and returns the weight of one instrument of each (class, subclass)
+def equal_hierarchical_scheme(counts):
+    subclass_total = Counter(class_ for class_, _ in counts)
+    class_total = len(subclass_total)
+    return {(class_, subclass): 1 / class_total / subclass_total[class_] / count for (class_, subclass), count in counts.items()}
+
+# A handcrafted scheme uses fixed relative weights per class (for example correlation groups) and optionally per subclass
+# Classes or subclasses without a weight get a relative weight of 1, the weights are then normalised over the active instruments
+class HandcraftedScheme:
+
+    def __init__(self, class_weights, subclass_weights=None):
+        # Initialise the class
+        self.class_weights = class_weights
+        self.subclass_weights = subclass_weights or {}
+
+    def __call__(self, counts):
+        class_total = sum(self.class_weights.get(class_, 1) for class_ in {class_ for class_, _ in counts})
+        subclass_total = Counter()
+        for (class_, subclass) in counts:
+            subclass_total[class_] += self.subclass_weights.get((class_, subclass), 1)
+        return {
+            (class_, subclass): self.class_weights.get(class_, 1) / class_total * self.subclass_weights.get((class_, subclass), 1) / subclass_total[class_] / count
+            for (class_, subclass), count in counts.items()
+        }
+
+# The weights only depend on how many instruments are active in each (class, subclass), which rarely changes between days
+# so the result of the scheme is cached on that, with the least recently used entries dropped first
+class InstrumentWeights:
+
+    def __init__(self, scheme=equal_hierarchical_scheme, max_size=64):
+        # Initialise the class
+        self.scheme = scheme
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+    # Define a function that returns the instrument weights as an array aligned with the classifications given
+    def get_weights(self, classifications):
+        counts = Counter(classifications)
+        key = frozenset(counts.items())
+        weight_by_classification = self.cache.get(key)
+        if weight_by_classification is None:
+            weight_by_classification = self.scheme(counts)
+            self.cache[key] = weight_by_classification
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return np.array([weight_by_classification[classification] for classification in classifications])
 
 def GetWeights(group):
-    subclasses = {}
-    for class_, subclass in group.values():
-        if class_ not in subclasses:
-            subclasses[class_] = {subclass: 0}
-        elif subclass not in subclasses[class_]:
-            subclasses[class_][subclass] = 0
-        subclasses[class_][subclass] += 1
-
-    class_total = len(subclasses.keys())
-    subclass_total = {class_: len(subclass.keys()) for class_, subclass in subclasses.items()}
-    
-    weights = {}
-    for ticker in group:
-        class_, subclass = group[ticker]
-        weight = 1 / class_total / subclass_total[class_] / subclasses[class_][subclass]
-        weights[ticker] = weight
-    
-    return weights
\ No newline at end of file
+    weight_by_classification = equal_hierarchical_scheme(Counter(group.values()))
+    return {ticker: weight_by_classification[classification] for ticker, classification in group.items()}
@@ -1,8 +1,7 @@
 # Import the required packages
 from AlgorithmImports import *
-from scipy import optimize
-from scipy.optimize import Bounds
 from factors import *
+from factor_weights import FactorWeightSolver
 
 
 class FamaFrenchOptimizationAlgorithm(QCAlgorithm):
@@ -19,25 +18,32 @@ class FamaFrenchOptimizationAlgorithm(QCAlgorithm):
         self._lookback = self.get_parameter('lookback', 60) # Set the lookback period to 60 business days
         # Rebalance the portfolio after 31 days
         self.schedule.on(self.date_rules.month_start(spy), self.time_rules.after_market_open(spy, ), self._rebalance)
-
-    #  Pull the factors that have been defined in the factors script
-    def on_securities_changed(self, changes):
-        for security in changes.added_securities: 
-            security.factors = [MKT(security), SMB(security), HML(security), RMW(security), CMA(security)]
+        # The factors that have been defined in the factors script, read for the whole universe at each rebalance
+        self._factors = FACTORS
+        # The factor weights maximise the trailing return of the factor portfolio exactly, optionally with a ridge or a turnover penalty
+        self._factor_weight_solver = FactorWeightSolver(0, 1, ridge=self.get_parameter('factor_weight_ridge', 0.0), turnover=self.get_parameter('factor_weight_turnover', 0.0))
+        self._factor_weights = None
 
     def _rebalance(self):
-        # Obtain the raw factor data for each of the constituents
-        factors_df = pd.DataFrame()
-        for symbol in self._universe.selected:
-            for i, factors in enumerate(self.securities[symbol].factors):
-                factors_df.loc[symbol, i] = factors.value
-        # Determine the z scores for each of the factors
-        factor_zscores = (factors_df - factors_df.mean()) / factors_df.std()
-        # Run an optimisation to maximise the trailing returns to determine the optimal factor weights
-        trailing_return = self.history(list(self._universe.selected), self._lookback, Resolution.DAILY).close.unstack(0).pct_change(self._lookback-1).iloc[-1]
-        num_factors = factors_df.shape[1]
-        factor_weights = optimize.minimize(lambda weights: -(np.dot(factor_zscores, weights) * trailing_return).sum(), x0=np.array([1.0/num_factors] * num_factors), method='Nelder-Mead', bounds=Bounds([0] * num_factors, [1] * num_factors), options={'maxiter': 10}).x
+        symbols = list(self._universe.selected or [])
+        if not symbols:
+            return
+        # Obtain the raw factor data for each of the constituents, in one pass into an array with a row per symbol and a column per factor
+        factor_values = read_factor_values(self.securities, symbols, self._factors)
+        # Determine the z scores for each of the factors, a missing value is given a z score of 0
+        factor_zscores = nan_zscores(factor_values)
+        # Obtain the trailing returns to determine the optimal factor weights
+        history = self.history(symbols, self._lookback, Resolution.DAILY)
+        if history.empty:
+            return
+        # The trailing returns are in the order of the symbols, a symbol without a trailing return does not count in the objective
+        trailing_return = history.close.unstack(0).pct_change(self._lookback-1).iloc[-1].reindex(symbols).fillna(0).to_numpy()
+        # Solve for the factor weights that maximise the trailing returns, if no factor earned a positive return keep the current holdings
+        factor_weights = self._factor_weight_solver.solve(factor_zscores, trailing_return, self._factor_weights)
+        if not np.any(factor_weights > 0):
+            return
+        self._factor_weights = factor_weights
         # Determine the portfolio weights
-        portfolio_weights = (factor_zscores * factor_weights).sum(axis=1)
+        portfolio_weights = pd.Series(factor_zscores @ factor_weights, index=symbols)
         portfolio_weights = portfolio_weights[portfolio_weights > 0]
         self.set_holdings([PortfolioTarget(symbol, weight/portfolio_weights.sum()) for symbol, weight in portfolio_weights.items()], True)
\ No newline at end of file
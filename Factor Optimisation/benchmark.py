@@ -0,0 +1,73 @@
+# Import the required packages
+import argparse
+import time
+
+import numpy as np
+from scipy import optimize
+from scipy.optimize import Bounds
+
+from factor_weights import FactorWeightSolver
+
+# This script benchmarks the factor weight solver against the Nelder-Mead call that FamaFrenchOptimizationAlgorithm._rebalance used,
+# on synthetic factor z scores and trailing returns. It reports the latency of each solve and the objective values it reaches.
+# Run it with `python benchmark.py`, or `python benchmark.py --stocks 20 100 500 --factors 5`
+
+# The previous call, capped at 10 iterations
+def nelder_mead(factor_zscores, trailing_return, maxiter=10):
+    num_factors = factor_zscores.shape[1]
+    return optimize.minimize(lambda weights: -(np.dot(factor_zscores, weights) * trailing_return).sum(), x0=np.array([1.0/num_factors] * num_factors), method='Nelder-Mead', bounds=Bounds([0] * num_factors, [1] * num_factors), options={'maxiter': maxiter}).x
+
+def synthetic_problem(stocks, factors, rng):
+    factor_zscores = rng.standard_normal((stocks, factors))
+    # The trailing returns are partly explained by the factors, so some factors earn a positive return and some a negative one
+    trailing_return = factor_zscores @ rng.normal(0, 0.02, factors) + rng.normal(0, 0.1, stocks)
+    return factor_zscores, trailing_return
+
+def time_call(function, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        latencies.append(time.perf_counter() - start)
+    return np.median(latencies) * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the factor weight solver against the Nelder-Mead call")
+    parser.add_argument("--stocks", type=int, nargs="*", default=[20, 100, 500], help="numbers of stocks in the universe")
+    parser.add_argument("--factors", type=int, default=5, help="number of factors")
+    parser.add_argument("--problems", type=int, default=20, help="number of random problems for each number of stocks")
+    parser.add_argument("--repeats", type=int, default=5, help="timed repeats of each solve")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the synthetic problems")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    solvers = {
+        "nelder-mead 10 iterations": lambda z, r, previous: nelder_mead(z, r),
+        "nelder-mead converged": lambda z, r, previous: nelder_mead(z, r, maxiter=10000),
+        "exact": lambda z, r, previous: FactorWeightSolver().solve(z, r),
+        "ridge 1": lambda z, r, previous: FactorWeightSolver(ridge=1.0).solve(z, r),
+        "turnover 1": lambda z, r, previous: FactorWeightSolver(turnover=1.0).solve(z, r, previous),
+        "budget 1": lambda z, r, previous: FactorWeightSolver(budget=1.0).solve(z, r),
+        "ridge 1, budget 1": lambda z, r, previous: FactorWeightSolver(ridge=1.0, budget=1.0).solve(z, r)
+    }
+    # The objective is the linear one of _rebalance, the penalised solvers give up some of it for smaller or steadier weights
+    # and the budgeted ones can only reach a smaller set of weights
+    linear = FactorWeightSolver()
+    for stocks in args.stocks:
+        print(f"{stocks} stocks, {args.factors} factors:")
+        results = {name: ([], []) for name in solvers}
+        for _ in range(args.problems):
+            factor_zscores, trailing_return = synthetic_problem(stocks, args.factors, rng)
+            previous = rng.random(args.factors)
+            for name, solver in solvers.items():
+                latency, weights = time_call(lambda: solver(factor_zscores, trailing_return, previous), args.repeats)
+                results[name][0].append(latency)
+                results[name][1].append(linear.objective(weights, factor_zscores, trailing_return))
+        best = np.array(results["exact"][1])
+        for name, (latencies, objectives) in results.items():
+            # The gap is the share of the total objective of the exact optimum that the solver misses
+            gap = (best - np.array(objectives)).sum() / max(np.abs(best).sum(), 1e-12)
+            print(f"  {name:28s} median {np.median(latencies):8.3f} ms, mean objective {np.mean(objectives):10.4f}, gap to the exact optimum {gap:7.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Import the required packages
+import numpy as np
+
+# The factor weights maximise the trailing return of the factor portfolio, sum(factor_zscores @ w * trailing_return), which is the
+# linear objective c @ w with c = factor_zscores.T @ trailing_return, the trailing return each factor would have earned.
+# Without a penalty the optimum over the box lower <= w <= upper is a corner of the box: each factor takes its upper bound
+# if it earned a positive return and its lower bound otherwise.
+# The optional penalties are a ridge on the weights, (ridge / 2) * |w|^2, and a turnover penalty on the change from the previous
+# weights, (turnover / 2) * |w - previous|^2. The problem is then a separable QP whose optimum is the unconstrained optimum
+# clipped to the box. With a budget, sum(w) = budget, a multiplier is subtracted from c. Without a penalty the budget goes to the
+# factors with the highest returns first, with one the multiplier is found exactly from the kinks of the sum of the weights.
+# The module only depends on numpy so the benchmark can import it outside of LEAN
+
+class FactorWeightSolver:
+    def __init__(self, lower=0.0, upper=1.0, ridge=0.0, turnover=0.0, budget=None):
+        self.lower = lower
+        self.upper = upper
+        self.ridge = ridge
+        self.turnover = turnover
+        self.budget = budget
+
+    # The trailing return each factor would have earned with a weight of one
+    @staticmethod
+    def factor_returns(factor_zscores, trailing_return):
+        return np.asarray(factor_zscores).T @ np.asarray(trailing_return)
+
+    # The value of the objective, including the penalties
+    def objective(self, weights, factor_zscores, trailing_return, previous_weights=None):
+        weights = np.asarray(weights)
+        value = self.factor_returns(factor_zscores, trailing_return) @ weights - self.ridge / 2 * weights @ weights
+        if self.turnover > 0 and previous_weights is not None:
+            value -= self.turnover / 2 * np.sum((weights - previous_weights) ** 2)
+        return value
+
+    def solve(self, factor_zscores, trailing_return, previous_weights=None):
+        returns = self.factor_returns(factor_zscores, trailing_return)
+        lower = np.broadcast_to(np.asarray(self.lower, dtype=np.float64), returns.shape)
+        upper = np.broadcast_to(np.asarray(self.upper, dtype=np.float64), returns.shape)
+        # Without a previous solve there is no turnover to penalise
+        turnover = self.turnover if previous_weights is not None else 0.0
+        curvature = self.ridge + turnover
+        if curvature <= 0:
+            return self._solve_linear(returns, lower, upper)
+
+        # The optimum of each weight is where its marginal return is zero, clipped to the box
+        centre = returns + turnover * (np.asarray(previous_weights) if turnover > 0 else 0)
+        if self.budget is None:
+            return np.clip(centre / curvature, lower, upper)
+        self._check_budget(lower, upper)
+        # The sum of the weights is piecewise linear and falls as the multiplier rises, with a kink where a weight reaches a bound.
+        # Evaluate it at every kink at once, then interpolate the multiplier that meets the budget on the segment that holds it
+        kinks = np.sort(np.concatenate([centre - curvature * upper, centre - curvature * lower]))
+        sums = np.clip((centre - kinks[:, None]) / curvature, lower, upper).sum(axis=1)
+        multiplier = np.interp(self.budget, sums[::-1], kinks[::-1])
+        return np.clip((centre - multiplier) / curvature, lower, upper)
+
+    def _solve_linear(self, returns, lower, upper):
+        if self.budget is None:
+            return np.where(returns > 0, upper, lower)
+        # With a budget, start from the lower bounds and give what is left to the factors with the highest returns first
+        self._check_budget(lower, upper)
+        weights = lower.copy()
+        remaining = self.budget - weights.sum()
+        for factor in np.argsort(-returns, kind='stable'):
+            step = min(upper[factor] - lower[factor], remaining)
+            weights[factor] += step
+            remaining -= step
+            if remaining <= 0:
+                break
+        return weights
+
+    def _check_budget(self, lower, upper):
+        if not lower.sum() - 1e-12 <= self.budget <= upper.sum() + 1e-12:
+            raise ValueError(f"The budget {self.budget} cannot be met with weights between {lower.tolist()} and {upper.tolist()}")
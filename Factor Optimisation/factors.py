@@ -8,44 +8,90 @@ from AlgorithmImports import *
 # HML - Quality given by operating profit margin
 # RMW - Profitability given by ROE
 # CMA - Investment pattern given by total assets growth
+# Each class reads its value from a security, or from fundamentals that have already been looked up with `read`
 
 class MKT:
     def __init__(self, security):
         self._security = security
 
+    @staticmethod
+    def read(fundamentals):
+        return fundamentals.valuation_ratios.book_value_per_share
+
     @property
     def value(self):
-        return self._security.fundamentals.valuation_ratios.book_value_per_share
+        return self.read(self._security.fundamentals)
 
 
 class SMB:
     def __init__(self, security):
         self._security = security
 
+    @staticmethod
+    def read(fundamentals):
+        return fundamentals.financial_statements.balance_sheet.total_equity.value
+
     @property
     def value(self):
-        return self._security.fundamentals.financial_statements.balance_sheet.total_equity.value
+        return self.read(self._security.fundamentals)
 
 class HML:
     def __init__(self, security):
         self._security = security
 
+    @staticmethod
+    def read(fundamentals):
+        return fundamentals.operation_ratios.operation_margin.value
+
     @property
     def value(self):
-        return self._security.fundamentals.operation_ratios.operation_margin.value
+        return self.read(self._security.fundamentals)
 
 class RMW:
     def __init__(self, security):
         self._security = security
 
+    @staticmethod
+    def read(fundamentals):
+        return fundamentals.operation_ratios.ROE.value
+
     @property
     def value(self):
-        return self._security.fundamentals.operation_ratios.ROE.value
+        return self.read(self._security.fundamentals)
 
 class CMA:
     def __init__(self, security):
         self._security = security
 
+    @staticmethod
+    def read(fundamentals):
+        return fundamentals.operation_ratios.total_assets_growth.value
+
     @property
     def value(self):
-        return self._security.fundamentals.operation_ratios.total_assets_growth.value
+        return self.read(self._security.fundamentals)
+
+# The factors in the order of the columns of the factor arrays
+FACTORS = [MKT, SMB, HML, RMW, CMA]
+
+# Read every factor of every symbol into one array with a row per symbol and a column per factor.
+# The fundamentals of each security are looked up once, and the values that are missing or not finite are NaN
+def read_factor_values(securities, symbols, factors=FACTORS):
+    values = np.full((len(symbols), len(factors)), np.nan)
+    readers = [factor.read for factor in factors]
+    for row, symbol in enumerate(symbols):
+        fundamentals = securities[symbol].fundamentals if securities.contains_key(symbol) else None
+        if fundamentals is None:
+            continue
+        values[row] = [np.nan if value is None else value for value in (read(fundamentals) for read in readers)]
+    values[~np.isfinite(values)] = np.nan
+    return values
+
+# Standardise each factor over the symbols that have a value for it, the missing values get a z score of 0 so they are neutral
+def nan_zscores(values):
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=0)
+    mean = np.where(valid, values, 0).sum(axis=0) / np.maximum(counts, 1)
+    deviations = np.where(valid, values - mean, 0)
+    std = np.sqrt((deviations ** 2).sum(axis=0) / np.maximum(counts - 1, 1))
+    return np.divide(deviations, std, out=np.zeros_like(deviations), where=(std > 0) & (counts > 1))
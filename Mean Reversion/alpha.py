@@ -6,25 +6,32 @@ Created on Fri Jul 26 12:35:59 2024
 """
 #region imports
 from AlgorithmImports import *
+
+from indicator import AdjustableRateOfChange
+from ranking import RateOfChangeRanking
 #endregion
 
 
 class MeanReversionAlphaModel(AlphaModel):
 
-    _securities = []
     _month = -1
 
     def __init__(self, roc_period, num_positions_per_side):
         self._roc_period = roc_period
         self._num_positions_per_side = num_positions_per_side
+        self._ranking = RateOfChangeRanking()
+        self._indicator_by_symbol = {}
 
     def update(self, algorithm: QCAlgorithm, data: Slice) -> List[Insight]:
-        # Reset indicators when corporate actions occur
-        for symbol in set(data.splits.keys() + data.dividends.keys()):
-            security = algorithm.securities[symbol]
-            if security in self._securities:
-                algorithm.unregister_indicator(security.indicator)
-                self._initialize_indicator(algorithm, security)
+        # Adjust the price windows of the indicators when corporate actions occur
+        for symbol in data.splits.keys():
+            split = data.splits[symbol]
+            if split.type == SplitType.SPLIT_OCCURRED and symbol in self._ranking:
+                self._indicator_by_symbol[symbol].adjust_for_split(split.split_factor)
+        for symbol in data.dividends.keys():
+            dividend = data.dividends[symbol]
+            if symbol in self._ranking:
+                self._indicator_by_symbol[symbol].adjust_for_dividend(dividend.distribution, dividend.reference_price)
         
         # Only emit insights when there is quote data, not when a corporate action occurs (at midnight)
         if data.quote_bars.count == 0:
@@ -35,30 +42,55 @@ class MeanReversionAlphaModel(AlphaModel):
             return []
         
         # Check if enough indicators are ready
-        ready_securities = [security for security in self._securities if security.indicator.is_ready and security.symbol in data.quote_bars]
-        if len(ready_securities) < 2 * self._num_positions_per_side:
+        has_quote = np.fromiter((symbol in data.quote_bars for symbol in self._ranking.symbols), dtype=bool, count=len(self._ranking))
+        legs = self._ranking.select(self._num_positions_per_side, has_quote)
+        if legs is None:
             return []
 
         self._month = algorithm.time.month
 
         # Short securities that have the highest trailing ROC
-        sorted_by_roc = sorted(ready_securities, key=lambda security: security.indicator.current.value)
-        insights = [Insight.price(security.symbol, Expiry.END_OF_MONTH, InsightDirection.DOWN) for security in sorted_by_roc[-self._num_positions_per_side:]]
+        lowest_roc, highest_roc = legs
+        insights = [Insight.price(symbol, Expiry.END_OF_MONTH, InsightDirection.DOWN) for symbol in highest_roc]
         # Long securities that have the lowest trailing ROC
-        insights += [Insight.price(security.symbol, Expiry.END_OF_MONTH, InsightDirection.UP) for security in sorted_by_roc[:self._num_positions_per_side]]
+        insights += [Insight.price(symbol, Expiry.END_OF_MONTH, InsightDirection.UP) for symbol in lowest_roc]
         return insights
 
-    def _initialize_indicator(self, algorithm, security):
-        security.indicator = algorithm.ROC(security.symbol, self._roc_period, Resolution.DAILY)
-        algorithm.warm_up_indicator(security.symbol, security.indicator)
+    def _initialize_indicators(self, algorithm, securities):
+        if not securities:
+            return
+        for security in securities:
+            self._indicator_by_symbol[security.symbol] = AdjustableRateOfChange(self._roc_period)
+            # The indicator is updated with the daily bars of the security
+            security.consolidator = TradeBarConsolidator(timedelta(1))
+            security.consolidator.data_consolidated += self._consolidation_handler
+            algorithm.subscription_manager.add_consolidator(security.symbol, security.consolidator)
+
+        # Warm up all the indicators with a single history request rather than one per security
+        history = algorithm.history([security.symbol for security in securities], self._roc_period + 1, Resolution.DAILY)
+        closes = history['close'].unstack(0) if not history.empty else pd.DataFrame()
+        for security in securities:
+            indicator = self._indicator_by_symbol[security.symbol]
+            if security.symbol in closes:
+                for time, close in closes[security.symbol].dropna().items():
+                    indicator.update(time, close)
+            # The ranking holds the latest value of each indicator
+            self._ranking.update(security.symbol, indicator.value, indicator.is_ready)
+
+    def _consolidation_handler(self, sender: object, consolidated_bar: TradeBar) -> None:
+        indicator = self._indicator_by_symbol[consolidated_bar.symbol]
+        indicator.update(consolidated_bar.end_time, consolidated_bar.close)
+        self._ranking.update(consolidated_bar.symbol, indicator.value, indicator.is_ready)
 
     def on_securities_changed(self, algorithm: QCAlgorithm, changes: SecurityChanges) -> None:
-        for security in changes.added_securities:
-            self._initialize_indicator(algorithm, security)
-            self._securities.append(security)
+        added_securities = [security for security in changes.added_securities if security.symbol not in self._ranking]
+        for security in added_securities:
+            self._ranking.add(security.symbol)
+        self._initialize_indicators(algorithm, added_securities)
 
         for security in changes.removed_securities:
-            if security in self._securities:
-                algorithm.unregister_indicator(security.indicator)
-                self._securities.remove(security)
-
+            if security.symbol in self._ranking:
+                security.consolidator.data_consolidated -= self._consolidation_handler
+                algorithm.subscription_manager.remove_consolidator(security.symbol, security.consolidator)
+                self._ranking.remove(security.symbol)
+                del self._indicator_by_symbol[security.symbol]
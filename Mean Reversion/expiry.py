@@ -0,0 +1,37 @@
+#region imports
+from AlgorithmImports import *
+
+import heapq
+#endregion
+
+
+class InsightExpiryIndex:
+    # Keeps the insights in a max-heap on their close time so the latest close time is read in O(1) amortised,
+    # instead of sorting the close times of every insight in the collection on each call.
+    # Entries are checked lazily when they reach the top of the heap: insights that have been removed from the
+    # collection are dropped, and insights whose close time changed (for example when cancelled) are pushed back with it
+
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+
+    def add(self, insights):
+        for insight in insights:
+            self._push(insight, insight.close_time_utc)
+
+    def _push(self, insight, close_time):
+        # The key is negated so the min-heap gives the latest close time first, the counter breaks ties
+        heapq.heappush(self._heap, (datetime.min - close_time, self._counter, insight, close_time))
+        self._counter += 1
+
+    def latest_close_time(self, insight_collection):
+        while self._heap:
+            _, _, insight, close_time = self._heap[0]
+            if not insight_collection.contains(insight):
+                heapq.heappop(self._heap)
+            elif insight.close_time_utc != close_time:
+                heapq.heappop(self._heap)
+                self._push(insight, insight.close_time_utc)
+            else:
+                return close_time
+        return None
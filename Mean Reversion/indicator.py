@@ -0,0 +1,47 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+
+
+class AdjustableRateOfChange:
+    # A rate of change indicator, (price - price period bars ago) / price period bars ago, that keeps its price window
+    # in a circular array. Splits and dividends are applied to the window in place, so a corporate action does not
+    # need a new indicator and a new history request
+
+    def __init__(self, period):
+        self.period = period
+        self.warm_up_period = period + 1
+        self._window = np.empty(period + 1)
+        self.reset()
+
+    def reset(self):
+        self._next = 0
+        self._count = 0
+        self.value = 0.0
+
+    @property
+    def is_ready(self):
+        return self._count >= self.warm_up_period
+
+    @property
+    def samples(self):
+        return self._count
+
+    def update(self, time, price):
+        self._window[self._next] = price
+        self._next = (self._next + 1) % len(self._window)
+        self._count += 1
+        if self.is_ready:
+            # Once the window is full the next slot holds the oldest price
+            oldest = self._window[self._next]
+            self.value = (price - oldest) / oldest if oldest != 0 else 0.0
+        return self.is_ready
+
+    # The prices before a split are multiplied by its split factor, for example 0.5 for a 2 for 1 split
+    def adjust_for_split(self, split_factor):
+        self._window *= split_factor
+
+    # The prices before a dividend are multiplied by (reference price - distribution) / reference price
+    def adjust_for_dividend(self, distribution, reference_price):
+        if reference_price > 0:
+            self._window *= (reference_price - distribution) / reference_price
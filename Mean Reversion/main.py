@@ -9,6 +9,7 @@ from AlgorithmImports import *
 
 from universe import CountryEquityIndexUniverseSelectionModel
 from alpha import MeanReversionAlphaModel
+from expiry import InsightExpiryIndex
 #endregion
 
 
@@ -45,12 +46,16 @@ class CountryEquityIndexesMeanReversionAlgorithm(QCAlgorithm):
 
         self.set_warm_up(timedelta(31))
 
+        # Track the close time of the insights as they are generated, so the rebalance function doesn't scan them all
+        self._insight_expiry_index = InsightExpiryIndex()
+        self.insights_generated += lambda _, insights_collection: self._insight_expiry_index.add(insights_collection.insights)
+
     def _rebalance_func(self, time):
         # Rebalance when all of the following are true:
         # - There are new insights or old insights have been cancelled since the last rebalance
         # - The algorithm isn't warming up
         # - There is QuoteBar data in the current slice
-        latest_expiry_time = sorted([insight.close_time_utc for insight in self.insights], reverse=True)[0] if self.insights.count else None
+        latest_expiry_time = self._insight_expiry_index.latest_close_time(self.insights)
         if self._previous_expiry_time != latest_expiry_time and not self.is_warming_up and self.current_slice.quote_bars.count > 0:
             self._previous_expiry_time = latest_expiry_time
             return time
@@ -0,0 +1,74 @@
+#region imports
+from AlgorithmImports import *
+#endregion
+
+
+class RateOfChangeRanking:
+    # Keeps the latest ROC of every security in contiguous arrays, indexed by a slot per symbol,
+    # so the securities with the lowest and highest ROC can be selected without sorting the universe
+
+    def __init__(self, capacity=64):
+        self._symbols = []
+        self._index_by_symbol = {}
+        self._values = np.full(capacity, np.nan)
+        self._ready = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._index_by_symbol
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    def add(self, symbol):
+        if symbol in self._index_by_symbol:
+            return
+        index = len(self._symbols)
+        if index == len(self._values):
+            # Double the capacity so additions stay amortised O(1)
+            self._values = np.concatenate([self._values, np.full(index, np.nan)])
+            self._ready = np.concatenate([self._ready, np.zeros(index, dtype=bool)])
+        self._symbols.append(symbol)
+        self._index_by_symbol[symbol] = index
+        self._values[index] = np.nan
+        self._ready[index] = False
+
+    def remove(self, symbol):
+        index = self._index_by_symbol.pop(symbol, None)
+        if index is None:
+            return
+        # Move the last security into the freed slot so the arrays stay contiguous
+        last = len(self._symbols) - 1
+        if index != last:
+            last_symbol = self._symbols[last]
+            self._symbols[index] = last_symbol
+            self._index_by_symbol[last_symbol] = index
+            self._values[index] = self._values[last]
+            self._ready[index] = self._ready[last]
+        self._symbols.pop()
+        self._values[last] = np.nan
+        self._ready[last] = False
+
+    def update(self, symbol, value, is_ready):
+        index = self._index_by_symbol.get(symbol)
+        if index is None:
+            return
+        self._values[index] = value
+        self._ready[index] = is_ready
+
+    def select(self, count, eligible=None):
+        # Returns the symbols with the `count` lowest and the `count` highest ROC among the ready and eligible securities,
+        # or None if there are fewer than 2 * count of them
+        n = len(self._symbols)
+        mask = self._ready[:n] if eligible is None else self._ready[:n] & eligible
+        candidates = np.flatnonzero(mask)
+        if len(candidates) < 2 * count:
+            return None
+        if count == 0:
+            return [], []
+        # Partition around the count-th lowest and count-th highest values, which is O(n) rather than a full sort
+        partitioned = candidates[np.argpartition(self._values[candidates], [count - 1, len(candidates) - count])]
+        return [self._symbols[i] for i in partitioned[:count]], [self._symbols[i] for i in partitioned[-count:]]
@@ -7,60 +7,121 @@ Created on Fri Jul 26 11:08:52 2024
 # region imports
 from AlgorithmImports import *
 
-from alpha import RandomForestAlphaModel
-from portfolio import MeanVarianceOptimizationPortfolioConstructionModel
+from sklearn.ensemble import RandomForestRegressor
+
+from features import FeatureStore
+from warm_up import HistoryWarmUpService
 # endregion
 
 
-class RandomForestAlgorithm(QCAlgorithm):
-
-    _undesired_symbols_from_previous_deployment = []
-    _checked_symbols_from_previous_deployment = False
-
-    def initialize(self):
-        self.set_start_date(2022, 6, 1)
-        self.set_end_date(2023, 6, 1)
-        self.set_cash(1_000_000)
-        
-        self.set_brokerage_model(BrokerageName.INTERACTIVE_BROKERS_BROKERAGE, AccountType.MARGIN)
-
-        self.settings.minimum_order_margin_portfolio_percentage = 0
-
-        self.universe_settings.data_normalization_mode = DataNormalizationMode.RAW
-        tickers = ["SHY", "TLT", "IEI", "SHV", "TLH", "EDV", "BIL", "SPTL", "TBT", "TMF", 
-                    "TMV", "TBF", "VGSH", "VGIT", "VGLT", "SCHO", "SCHR", "SPTS", "GOVT"]
-        symbols = [ Symbol.create(ticker, SecurityType.EQUITY, Market.USA) for ticker in tickers]
-        self.add_universe_selection(ManualUniverseSelectionModel(symbols))
-
-        self.add_alpha(RandomForestAlphaModel(
-            self,
-            self.get_parameter("minutes_before_close", 5),
-            self.get_parameter("n_estimators", 100),
-            self.get_parameter("min_samples_split", 5),
-            self.get_parameter("lookback_days", 360)
-        ))
-
-        self.set_portfolio_construction(MeanVarianceOptimizationPortfolioConstructionModel(self, lambda time: None, PortfolioBias.LONG, period=self.get_parameter("pcm_periods", 5)))
-        
-        self.add_risk_management(NullRiskManagementModel())
-
-        self.set_execution(ImmediateExecutionModel())
-
-        self.set_warm_up(timedelta(5))
-
-    def on_data(self, data):
-        # Exit positions that aren't backed by existing insights.
-        # If you don't want this behavior, delete this method definition.
-        if not self.is_warming_up and not self._checked_symbols_from_previous_deployment:
-            for security_holding in self.portfolio.values():
-                if not security_holding.invested:
-                    continue
-                symbol = security_holding.symbol
-                if not self.insights.has_active_insights(symbol, self.utc_time):
-                    self._undesired_symbols_from_previous_deployment.append(symbol)
-            self._checked_symbols_from_previous_deployment = True
-        
-        for symbol in self._undesired_symbols_from_previous_deployment[:]:
-            if self.is_market_open(symbol):
-                self.liquidate(symbol, tag="Holding from previous deployment that's no longer desired")
-                self._undesired_symbols_from_previous_deployment.remove(symbol)
+class RandomForestAlphaModel(AlphaModel):
+
+    # The features are the last daily returns of every symbol
+    _lags = 5
+    # The share of the trees that is replaced by trees fitted on the latest data each day
+    _retrain_fraction = 0.1
+
+    def __init__(self, algorithm, minutes_before_close, n_estimators, min_samples_split, lookback_days, warm_up_service=None):
+        self._algorithm = algorithm
+        self._minutes_before_close = minutes_before_close
+        self._n_estimators = n_estimators
+        self._min_samples_split = min_samples_split
+        self._lookback_days = lookback_days
+        self._random_state = np.random.RandomState(0)
+
+        # The feature store is filled with the daily bars of the warm up service, which can be shared with other models.
+        # The bars are scaled raw, as the mean-variance PCM requests them, so the history is adjusted for past splits and dividends
+        # and ends at the raw price. The scheduled predictions then add raw prices, which update adjusts at each corporate action
+        self._warm_up_service = HistoryWarmUpService(algorithm) if warm_up_service is None else warm_up_service
+        self._data_normalization_mode = DataNormalizationMode.SCALED_RAW
+
+        self._symbols = []
+        self._feature_store = None
+        self._model = None
+        self._insights = []
+        self._scheduled = False
+
+    def update(self, algorithm: QCAlgorithm, data: Slice) -> List[Insight]:
+        # Adjust the stored prices when corporate actions occur, the prices added every day are raw prices
+        if self._feature_store is not None:
+            for symbol in data.splits.keys():
+                split = data.splits[symbol]
+                if split.type == SplitType.SPLIT_OCCURRED:
+                    self._feature_store.adjust(symbol, split.split_factor)
+            for symbol in data.dividends.keys():
+                dividend = data.dividends[symbol]
+                if dividend.reference_price > 0:
+                    self._feature_store.adjust(symbol, (dividend.reference_price - dividend.distribution) / dividend.reference_price)
+
+        # The insights are created by the scheduled prediction before the close
+        insights = self._insights
+        self._insights = []
+        return insights
+
+    def _predict(self):
+        algorithm = self._algorithm
+        # Add today's prices to the feature store, they are the latest prices a few minutes before the close
+        self._feature_store.add([algorithm.securities[symbol].price for symbol in self._symbols])
+
+        # Predict the return of every symbol until tomorrow's prediction in one batch
+        features = self._feature_store.latest_features()
+        if self._model is not None and features is not None and not algorithm.is_warming_up:
+            predictions = np.asarray(self._model.predict(features)).reshape(-1)
+            self._insights = []
+            for symbol, prediction in zip(self._symbols, predictions):
+                hours = algorithm.securities[symbol].exchange.hours
+                next_prediction = hours.get_next_market_close(algorithm.time + timedelta(minutes=self._minutes_before_close + 1), False) - timedelta(minutes=self._minutes_before_close)
+                direction = InsightDirection.UP if prediction > 0 else (InsightDirection.DOWN if prediction < 0 else InsightDirection.FLAT)
+                self._insights.append(Insight.price(symbol, next_prediction - algorithm.time, direction, float(prediction)))
+
+        # Then update the forest with the return that has just been observed
+        self._train()
+
+    def _train(self, full=False):
+        features, targets = self._feature_store.training_data()
+        if features is None or len(features) < self._min_samples_split:
+            return
+        if self._model is None or full:
+            self._model = RandomForestRegressor(
+                n_estimators=self._n_estimators,
+                min_samples_split=self._min_samples_split,
+                warm_start=True,
+                n_jobs=-1,
+                random_state=self._random_state
+            )
+            self._model.fit(features, targets)
+            return
+        # Retire the oldest trees, then warm start adds the same number of trees fitted on the latest window in parallel
+        trees = max(1, int(self._n_estimators * self._retrain_fraction))
+        del self._model.estimators_[:trees]
+        self._model.n_estimators = len(self._model.estimators_) + trees
+        self._model.fit(features, targets)
+
+    def on_securities_changed(self, algorithm: QCAlgorithm, changes: SecurityChanges) -> None:
+        removed_symbols = {security.symbol for security in changes.removed_securities}
+        symbols = [symbol for symbol in self._symbols if symbol not in removed_symbols]
+        symbols += [security.symbol for security in changes.added_securities if security.symbol not in symbols]
+        if symbols == self._symbols:
+            return
+        self._symbols = symbols
+
+        # The features depend on the universe, so the store is filled again with one history request and the forest is refitted
+        self._feature_store = FeatureStore(symbols, self._lookback_days, self._lags)
+        self._model = None
+        if not symbols:
+            return
+        bars_by_symbol = self._warm_up_service.get(symbols, self._lookback_days + self._lags + 1, Resolution.DAILY, self._data_normalization_mode)
+        times = sorted({bar.end_time for bars in bars_by_symbol.values() for bar in bars})
+        row_by_time = {time: row for row, time in enumerate(times)}
+        closes = np.full((len(times), len(symbols)), np.nan)
+        for column, symbol in enumerate(symbols):
+            for bar in bars_by_symbol[symbol]:
+                closes[row_by_time[bar.end_time], column] = bar.close
+        for prices in closes:
+            self._feature_store.add(prices)
+        self._train(full=True)
+
+        # Predict every day just before the close
+        if not self._scheduled:
+            algorithm.schedule.on(algorithm.date_rules.every_day(symbols[0]), algorithm.time_rules.before_market_close(symbols[0], self._minutes_before_close), self._predict)
+            self._scheduled = True
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import argparse
+import sys
+import time
+import types
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+
+### <summary>
+### Benchmarks the WarmStartMinimumVariancePortfolioOptimizer against the SLSQP solve of LEAN's MinimumVariancePortfolioOptimizer.
+### Each case slides a window of synthetic daily returns by one row per rebalance, as the mean-variance PCM does, and reports
+### the median latency of each optimizer, how much higher the variance of the warm-started weights is and how far the weights are apart.
+### The default cases are the deployed configuration (19 ETFs, 5 returns, long only, a 2% target return that the daily returns
+### cannot reach) and larger universes with 63 returns.
+### Run it with `python benchmark.py`, or `python benchmark.py --names 19 100 --period 63 --bias long_short --target 0.001`
+### </summary>
+
+def install_stand_ins():
+    """Make numpy and pandas importable from AlgorithmImports so optimizer.py can be imported outside of LEAN"""
+    if "AlgorithmImports" in sys.modules:
+        return
+    algorithm_imports = types.ModuleType("AlgorithmImports")
+    algorithm_imports.np = np
+    algorithm_imports.pd = pd
+    sys.modules["AlgorithmImports"] = algorithm_imports
+
+def lean_minimum_variance(historical_returns, minimum_weight, maximum_weight, target_return):
+    """The solve of MinimumVariancePortfolioOptimizer.optimize"""
+    covariance = historical_returns.cov()
+    expected_returns = historical_returns.mean()
+    size = historical_returns.columns.size
+    constraints = [{'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1}]
+    if target_return is not None:
+        constraints.append({'type': 'eq', 'fun': lambda weights: np.dot(np.matrix(expected_returns), np.matrix(weights).T).item() - target_return})
+    opt = minimize(lambda weights: np.dot(weights.T, np.dot(covariance, weights)),
+                   x0 = np.array(size * [1. / size]),
+                   bounds = tuple((minimum_weight, maximum_weight) for _ in range(size)),
+                   constraints = constraints,
+                   method = 'SLSQP')
+    return opt['x']
+
+def run_case(names, period, minimum_weight, target_return, rebalances, rng):
+    from optimizer import WarmStartMinimumVariancePortfolioOptimizer
+
+    # Daily returns with a small drift and a spread of volatilities
+    returns = rng.normal(0.0003, 0.01, (period + rebalances, names)) * rng.uniform(0.5, 2, names)
+    optimizer = WarmStartMinimumVariancePortfolioOptimizer(minimum_weight, 1, target_return)
+    latencies = {"lean": [], "warm start": []}
+    variance_gaps, weight_gaps, reachable = [], [], 0
+    for start in range(rebalances):
+        historical_returns = pd.DataFrame(returns[start:start + period])
+        begin = time.perf_counter()
+        lean_weights = lean_minimum_variance(historical_returns, minimum_weight, 1, target_return)
+        latencies["lean"].append(time.perf_counter() - begin)
+        begin = time.perf_counter()
+        weights = optimizer.optimize(historical_returns)
+        latencies["warm start"].append(time.perf_counter() - begin)
+
+        covariance = historical_returns.cov().to_numpy()
+        lean_variance = lean_weights @ covariance @ lean_weights
+        variance_gaps.append((weights @ covariance @ weights - lean_variance) / lean_variance)
+        weight_gaps.append(np.abs(weights - lean_weights).sum())
+        # Long only weights that sum to one cannot return more than the best expected return
+        expected_returns = historical_returns.mean().to_numpy()
+        reachable += target_return is None or minimum_weight < 0 or expected_returns.max() >= target_return
+    return {name: np.median(values) * 1000 for name, values in latencies.items()}, max(variance_gaps), max(weight_gaps), reachable
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the warm-started minimum variance optimizer against LEAN's SLSQP solve")
+    parser.add_argument("--names", type = int, nargs = "*", help = "numbers of symbols, the default cases are used if not given")
+    parser.add_argument("--period", type = int, default = 63, help = "number of returns in the window")
+    parser.add_argument("--bias", choices = ["long", "long_short"], default = "long", help = "long only weights or weights between -1 and 1")
+    parser.add_argument("--target", type = float, default = 0.02, help = "target return, a negative value to only minimize the variance")
+    parser.add_argument("--rebalances", type = int, default = 20, help = "number of rebalances in each case")
+    parser.add_argument("--seed", type = int, default = 42, help = "seed of the synthetic returns")
+    args = parser.parse_args()
+
+    install_stand_ins()
+    rng = np.random.default_rng(args.seed)
+    # The lower bound of the long only PCM is 1.1 times the minimum absolute portfolio target percentage
+    minimum_weight = 1.1e-7 if args.bias == "long" else -1
+    target_return = args.target if args.target >= 0 else None
+    if args.names:
+        cases = [(names, args.period, minimum_weight, target_return) for names in args.names]
+    else:
+        cases = [(19, 5, 1.1e-7, 0.02), (19, 63, 1.1e-7, 0.02), (100, 63, 1.1e-7, 0.02), (300, 63, 1.1e-7, 0.02)]
+    for names, period, minimum_weight, target_return in cases:
+        latencies, variance_gap, weight_gap, reachable = run_case(names, period, minimum_weight, target_return, args.rebalances, rng)
+        print(f"{names} names, {period} returns, minimum weight {minimum_weight}, target {target_return} (reachable in {reachable}/{args.rebalances}): "
+              f"lean {latencies['lean']:.2f} ms, warm start {latencies['warm start']:.2f} ms, "
+              f"variance gap at most {variance_gap:.2e}, weights apart by at most {weight_gap:.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from AlgorithmImports import *
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+### <summary>
+### Keeps a rolling window of one price snapshot per day for every symbol of the universe, and builds the training and prediction
+### data of the random forest from it. The features of a day are the last `lags` daily returns of every symbol and the targets
+### are the returns of every symbol over the next day.
+### Each row is written twice, `capacity` rows apart, so the latest rows are always a contiguous view and nothing is shifted.
+### </summary>
+class FeatureStore:
+    def __init__(self, symbols, lookback_days, lags):
+        """Initialize the store
+        Args:
+            symbols: The symbols of the universe, in the order of the columns
+            lookback_days(int): The number of days of training samples
+            lags(int): The number of daily returns of each symbol in the features"""
+        self._symbols = list(symbols)
+        self._column_by_symbol = {symbol: column for column, symbol in enumerate(self._symbols)}
+        self._lags = lags
+        self._capacity = lookback_days + lags + 1
+        self._prices = np.full((2 * self._capacity, len(self._symbols)), np.nan)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    @property
+    def prices(self):
+        """A view of the stored prices, oldest first"""
+        end = self._next + self._capacity
+        return self._prices[end - self._count:end]
+
+    def add(self, prices):
+        """Add the prices of every symbol for a new day, prices that are not positive are treated as missing"""
+        prices = np.asarray(prices, dtype = np.float64)
+        prices = np.where(prices > 0, prices, np.nan)
+        self._prices[self._next] = prices
+        self._prices[self._next + self._capacity] = prices
+        self._next = (self._next + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def adjust(self, symbol, factor):
+        """Multiply the stored prices of a symbol by the factor of a corporate action, so it does not show up as a return
+        Args:
+            symbol: The symbol with the split or dividend, symbols that are not in the store are ignored
+            factor(float): The split factor, for example 0.5 for a 2 for 1 split, or (reference price - distribution) / reference price"""
+        column = self._column_by_symbol.get(symbol)
+        if column is not None:
+            self._prices[:, column] *= factor
+
+    def _returns(self):
+        prices = self.prices
+        return prices[1:] / prices[:-1] - 1
+
+    def training_data(self):
+        """Get the features and targets of every day with a known next day return, the days with missing prices are skipped"""
+        returns = self._returns()
+        if len(returns) <= self._lags:
+            return None, None
+        # One row of features per day, with the returns of each symbol in chronological order
+        windows = sliding_window_view(returns, self._lags, axis = 0)
+        features = windows.reshape(len(windows), -1)[:-1]
+        targets = returns[self._lags:]
+        valid = ~(np.isnan(features).any(axis = 1) | np.isnan(targets).any(axis = 1))
+        return features[valid], targets[valid]
+
+    def latest_features(self):
+        """Get the features of the latest day, None if they are not available"""
+        returns = self._returns()
+        if len(returns) < self._lags:
+            return None
+        features = returns[-self._lags:].T.reshape(1, -1)
+        return None if np.isnan(features).any() else features
@@ -9,6 +9,7 @@ from AlgorithmImports import *
 
 from alpha import RandomForestAlphaModel
 from portfolio import MeanVarianceOptimizationPortfolioConstructionModel
+from warm_up import HistoryWarmUpService
 # endregion
 
 
@@ -32,15 +33,19 @@ class RandomForestAlgorithm(QCAlgorithm):
         symbols = [ Symbol.create(ticker, SecurityType.EQUITY, Market.USA) for ticker in tickers]
         self.add_universe_selection(ManualUniverseSelectionModel(symbols))
 
+        # The models share the history used to warm up their indicators
+        warm_up_service = HistoryWarmUpService(self)
+
         self.add_alpha(RandomForestAlphaModel(
             self,
             self.get_parameter("minutes_before_close", 5),
             self.get_parameter("n_estimators", 100),
             self.get_parameter("min_samples_split", 5),
-            self.get_parameter("lookback_days", 360)
+            self.get_parameter("lookback_days", 360),
+            warm_up_service
         ))
 
-        self.set_portfolio_construction(MeanVarianceOptimizationPortfolioConstructionModel(self, lambda time: None, PortfolioBias.LONG, period=self.get_parameter("pcm_periods", 5)))
+        self.set_portfolio_construction(MeanVarianceOptimizationPortfolioConstructionModel(self, lambda time: None, PortfolioBias.LONG, period=self.get_parameter("pcm_periods", 5), warm_up_service=warm_up_service))
         
         self.add_risk_management(NullRiskManagementModel())
 
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+from AlgorithmImports import *
+
+import hashlib
+from scipy.optimize import minimize
+
+
+### <summary>
+### Solves the same problem as MinimumVariancePortfolioOptimizer, minimize w'Σw subject to sum(w) = 1, μ'w = target return
+### and minimum weight <= w <= maximum weight, but is built for a rebalance that repeats the solve on a window that moves slowly:
+###  - When the inputs are bit-identical to the previous call the previous weights are returned.
+###  - When the returns window has slid by a few rows the sums behind the mean and covariance are updated with a rank-one
+###    add and drop per row, rather than recomputed, and fully recomputed every `refresh_period` rows.
+###  - The weights are found with a primal active-set method that starts from the previous weights. Each step solves the KKT system
+###    of the equality constrained problem, so when no bound is hit it is the closed form solution in one step.
+###  - The range of returns the bounds can reach is found by filling the budget from the lowest and from the highest expected return.
+###    A target outside of it is moved to the nearest end, as SLSQP ends on the portfolio closest to a target it cannot reach,
+###    and a mix of the two portfolios is the feasible weights the active-set method starts from when the previous ones are not.
+###  - If the active-set method fails (for example on returns that are not finite) it falls back to SLSQP seeded with the previous weights.
+### A tiny ridge is added to the covariance so the KKT system stays solvable when there are fewer returns than symbols.
+### </summary>
+class WarmStartMinimumVariancePortfolioOptimizer:
+    def __init__(self,
+                 minimum_weight = -1,
+                 maximum_weight = 1,
+                 target_return = 0.02,
+                 refresh_period = 100):
+        """Initialize the optimizer
+        Args:
+            minimum_weight(float): The lower bound on portfolio weights
+            maximum_weight(float): The upper bound on portfolio weights
+            target_return(float): The target portfolio return, None to only minimize the variance
+            refresh_period(int): The number of incremental updates after which the mean and covariance are recomputed"""
+        self._minimum_weight = minimum_weight
+        self._maximum_weight = maximum_weight
+        self._target_return = target_return
+        self._refresh_period = refresh_period
+
+        self._cache_key = None
+        self._columns = None
+        self._weights = None
+
+        # The previous returns and the sums of the returns and of their products
+        self._returns = None
+        self._sum = None
+        self._sum_of_products = None
+        self._updates = 0
+
+    def optimize(self, historical_returns, expected_returns = None, covariance = None):
+        """
+        Perform portfolio optimization for a provided matrix of historical returns and an array of expected returns
+        Args:
+            historical_returns: Matrix of annualized historical returns where each column represents a security and each row returns for the given date/time (size: K x N).
+            expected_returns: Array of double with the portfolio annualized expected returns (size: K x 1).
+            covariance: Multi-dimensional array of double with the portfolio covariance of annualized returns (size: K x K).
+        Returns:
+            Array of double with the portfolio weights (size: K x 1)
+        """
+        values = historical_returns.to_numpy(dtype = np.float64)
+        columns = tuple(historical_returns.columns)
+
+        # The same inputs give the same weights
+        cache_key = self._get_cache_key(values, columns, expected_returns, covariance)
+        if cache_key == self._cache_key:
+            return self._weights.copy()
+
+        if expected_returns is None or covariance is None:
+            mean, cov = self._get_moments(values, columns)
+            if mean is None:
+                # Returns with missing values use the pairwise covariance of pandas
+                mean, cov = historical_returns.mean().to_numpy(), historical_returns.cov().to_numpy()
+            expected_returns = mean if expected_returns is None else expected_returns
+            covariance = cov if covariance is None else covariance
+        expected_returns = np.asarray(expected_returns, dtype = np.float64).ravel()
+        covariance = np.asarray(covariance, dtype = np.float64)
+
+        previous_weights = self._weights if columns == self._columns else None
+        weights = self._solve_active_set(covariance, expected_returns, previous_weights)
+        if weights is None:
+            weights = self._solve_slsqp(covariance, expected_returns, previous_weights)
+
+        self._cache_key = cache_key
+        self._columns = columns
+        self._weights = weights
+        return weights.copy()
+
+    def _get_cache_key(self, values, columns, expected_returns, covariance):
+        digest = hashlib.blake2b(np.ascontiguousarray(values).tobytes(), digest_size = 16)
+        for array in (expected_returns, covariance):
+            if array is not None:
+                digest.update(np.ascontiguousarray(array, dtype = np.float64).tobytes())
+        return (values.shape, columns, expected_returns is None, covariance is None, digest.digest())
+
+    def _get_moments(self, values, columns):
+        """Get the mean and covariance of the returns, updating them incrementally when the window has slid by a few rows"""
+        if len(values) < 2 or np.isnan(values).any():
+            self._returns = None
+            return None, None
+
+        shift = self._get_shift(values, columns)
+        if shift is None or self._updates + shift > self._refresh_period:
+            self._sum = values.sum(axis = 0)
+            self._sum_of_products = values.T @ values
+            self._updates = 0
+        elif shift > 0:
+            # Add the new rows and drop the ones that left the window
+            dropped, added = self._returns[:shift], values[-shift:]
+            self._sum += added.sum(axis = 0) - dropped.sum(axis = 0)
+            self._sum_of_products += added.T @ added - dropped.T @ dropped
+            self._updates += shift
+        self._returns = values.copy()
+        self._returns_columns = columns
+
+        count = len(values)
+        mean = self._sum / count
+        cov = (self._sum_of_products - count * np.outer(mean, mean)) / (count - 1)
+        return mean, cov
+
+    def _get_shift(self, values, columns):
+        """Get the number of rows the window has slid by since the previous returns, None if it is not a slide of at most half the window"""
+        if self._returns is None or self._returns.shape != values.shape or self._returns_columns != columns:
+            return None
+        count = len(values)
+        for shift in range(count // 2 + 1):
+            if np.array_equal(values[:count - shift], self._returns[shift:]):
+                return shift
+        return None
+
+    def _get_constraints(self, expected_returns, target_return):
+        size = len(expected_returns)
+        if target_return is None:
+            return np.ones((1, size)), np.array([1.0])
+        return np.vstack([np.ones(size), expected_returns]), np.array([1.0, target_return])
+
+    def _get_extreme_weights(self, expected_returns, lower, upper):
+        """Get the weights with the lowest and the highest return within the bounds, None if the bounds cannot meet the budget"""
+        if not lower.sum() - 1e-12 <= 1 <= upper.sum() + 1e-12:
+            return None
+        extremes = []
+        for order in (np.argsort(expected_returns, kind = 'stable'), np.argsort(-expected_returns, kind = 'stable')):
+            # Start from the lower bounds and give what is left of the budget to the weights in order
+            weights = lower.copy()
+            room = np.cumsum((upper - lower)[order])
+            remaining = 1 - lower.sum()
+            weights[order] += np.clip(remaining - (room - (upper - lower)[order]), 0, (upper - lower)[order])
+            extremes.append(weights)
+        return extremes
+
+    def _solve_active_set(self, covariance, expected_returns, previous_weights):
+        """Solve the problem with a primal active-set method, the working set holds the weights that are kept at a bound"""
+        size = len(expected_returns)
+        if size == 0:
+            return np.array([])
+        if not (np.isfinite(covariance).all() and np.isfinite(expected_returns).all()):
+            return None
+
+        lower = np.full(size, float(self._minimum_weight))
+        upper = np.full(size, float(self._maximum_weight))
+        extremes = self._get_extreme_weights(expected_returns, lower, upper)
+        if extremes is None:
+            return None
+        # A target return the bounds cannot reach is moved to the nearest return they can
+        target_return = self._target_return
+        if target_return is not None:
+            target_return = min(max(target_return, expected_returns @ extremes[0]), expected_returns @ extremes[1])
+        a, b = self._get_constraints(expected_returns, target_return)
+        scale = max(np.trace(covariance) / size, np.finfo(np.float64).tiny)
+        q = 2 * covariance + 1e-10 * scale * np.eye(size)
+        tolerance = 1e-10
+
+        weights = self._get_feasible_weights(a, b, lower, upper, previous_weights, expected_returns, extremes, target_return)
+        at_lower = weights <= lower + tolerance
+        at_upper = ~at_lower & (weights >= upper - tolerance)
+        # Keep enough free weights for the constraints to stay independent
+        for i in np.flatnonzero(at_lower | at_upper):
+            if np.linalg.matrix_rank(a[:, ~(at_lower | at_upper)]) == len(b):
+                break
+            at_lower[i] = at_upper[i] = False
+
+        for _ in range(10 * size + 50):
+            free = ~(at_lower | at_upper)
+            step, multipliers = self._solve_step(q, a, weights, free)
+            # A step that barely lowers the variance is numerical noise along a flat direction, so it is treated as no step
+            decrease = -(q @ weights) @ step - 0.5 * step @ q @ step
+            if np.abs(step).max() <= tolerance or decrease <= 1e-12 * scale:
+                # The weights are optimal for the working set, they are optimal overall if no bound is holding them back
+                gradient = q @ weights + a.T @ multipliers
+                wrong_sign = np.where(at_lower, -gradient, np.where(at_upper, gradient, -np.inf))
+                i = np.argmax(wrong_sign)
+                if wrong_sign[i] <= 1e-9 * max(np.abs(gradient).max(), scale):
+                    return np.clip(weights, lower, upper)
+                at_lower[i] = at_upper[i] = False
+                continue
+
+            # Move towards the optimum of the working set until a bound blocks the step
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                ratios = np.where(step < -tolerance, (lower - weights) / step, np.where(step > tolerance, (upper - weights) / step, np.inf))
+            ratios[~free] = np.inf
+            i = np.argmin(ratios)
+            alpha = max(min(1.0, ratios[i]), 0.0)
+            weights = weights + alpha * step
+            if alpha < 1:
+                if step[i] < 0:
+                    at_lower[i], weights[i] = True, lower[i]
+                else:
+                    at_upper[i], weights[i] = True, upper[i]
+        return None
+
+    def _get_feasible_weights(self, a, b, lower, upper, previous_weights, expected_returns, extremes, target_return):
+        """Get weights that satisfy the constraints, starting from the previous weights when possible"""
+        size = len(lower)
+        candidates = [np.full(size, 1. / size)] if previous_weights is None else [previous_weights, np.full(size, 1. / size)]
+        for weights in candidates:
+            # Correct the weights with the smallest change that satisfies the equality constraints
+            weights = weights + a.T @ np.linalg.lstsq(a @ a.T, b - a @ weights, rcond = None)[0]
+            if (weights >= lower - 1e-12).all() and (weights <= upper + 1e-12).all():
+                return np.clip(weights, lower, upper)
+        # Otherwise mix the lowest and highest return weights, which meets the budget and the bounds, to reach the target
+        lowest, highest = extremes
+        if target_return is None:
+            return lowest
+        spread = expected_returns @ highest - expected_returns @ lowest
+        mix = (target_return - expected_returns @ lowest) / spread if spread > 0 else 0.0
+        return np.clip((1 - mix) * lowest + mix * highest, lower, upper)
+
+    def _solve_step(self, q, a, weights, free):
+        """Solve the KKT system for the step to the optimum with the weights in the working set fixed"""
+        free = np.flatnonzero(free)
+        size, count = len(free), len(a)
+        kkt = np.zeros((size + count, size + count))
+        kkt[:size, :size] = q[np.ix_(free, free)]
+        kkt[:size, size:] = a[:, free].T
+        kkt[size:, :size] = a[:, free]
+        rhs = np.concatenate([-(q[free] @ weights), np.zeros(count)])
+        try:
+            solution = np.linalg.solve(kkt, rhs)
+        except np.linalg.LinAlgError:
+            solution = np.linalg.lstsq(kkt, rhs, rcond = None)[0]
+        step = np.zeros(len(weights))
+        step[free] = solution[:size]
+        return step, solution[size:]
+
+    def _solve_slsqp(self, covariance, expected_returns, previous_weights):
+        size = len(expected_returns)
+        x0 = previous_weights if previous_weights is not None else np.array(size * [1. / size])
+
+        constraints = [{'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1}]
+        if self._target_return is not None:
+            constraints.append({'type': 'eq', 'fun': lambda weights: expected_returns @ weights - self._target_return})
+
+        opt = minimize(lambda weights: weights @ covariance @ weights,
+                       x0,
+                       jac = lambda weights: 2 * covariance @ weights,
+                       bounds = tuple((self._minimum_weight, self._maximum_weight) for _ in range(size)),
+                       constraints = constraints,
+                       method = 'SLSQP')
+        return opt['x']
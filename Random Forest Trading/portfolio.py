@@ -7,6 +7,9 @@ Created on Fri Jul 26 11:48:10 2024
 from AlgorithmImports import *
 
 from Portfolio.MinimumVariancePortfolioOptimizer import MinimumVariancePortfolioOptimizer
+from returns_matrix import ReturnsMatrix
+from optimizer import WarmStartMinimumVariancePortfolioOptimizer
+from warm_up import HistoryWarmUpService
 
 
 ### <summary>
@@ -22,7 +25,9 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
                  period = 63,
                  resolution = Resolution.DAILY,
                  target_return = 0.02,
-                 optimizer = None):
+                 optimizer = None,
+                 warm_start = True,
+                 warm_up_service = None):
         """Initialize the model
         Args:
             rebalance: Rebalancing parameter. If it is a timedelta, date rules or Resolution, it will be converted into a function.
@@ -34,7 +39,10 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
             lookback(int): Historical return lookback period
             period(int): The time interval of history price to calculate the weight
             resolution: The resolution of the history price
-            optimizer(class): Method used to compute the portfolio weights"""
+            optimizer(class): Method used to compute the portfolio weights
+            warm_start(bool): If no optimizer is given, use the WarmStartMinimumVariancePortfolioOptimizer that reuses the previous solve
+                              rather than the MinimumVariancePortfolioOptimizer
+            warm_up_service(HistoryWarmUpService): The service that provides the history to warm up the indicators, it can be shared with other models"""
         super().__init__()
         self._algorithm = algorithm
         self._lookback = lookback
@@ -45,11 +53,19 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
 
         lower = algorithm.settings.min_absolute_portfolio_target_percentage*1.1 if portfolio_bias == PortfolioBias.LONG else -1
         upper = 0 if portfolio_bias == PortfolioBias.SHORT else 1
-        self._optimizer = MinimumVariancePortfolioOptimizer(lower, upper, target_return) if optimizer is None else optimizer
+        if optimizer is None:
+            optimizer = WarmStartMinimumVariancePortfolioOptimizer(lower, upper, target_return) if warm_start else MinimumVariancePortfolioOptimizer(lower, upper, target_return)
+        self._optimizer = optimizer
 
         self._symbol_data_by_symbol = {}
+        # The returns of every symbol are kept in one matrix, which the optimizer reads without copying
+        self._returns = ReturnsMatrix(period)
         self._new_insights = False
 
+        # The indicators are warmed up with the history of the warm up service, the symbols are queued until the next call to create_targets
+        self._warm_up_service = HistoryWarmUpService(algorithm) if warm_up_service is None else warm_up_service
+        self._warm_up_symbols = set()
+
     def is_rebalance_due(self, insights, algorithmUtc):
         if not self._new_insights:
             self._new_insights = len(insights) > 0
@@ -61,14 +77,14 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
     def create_targets(self, algorithm, insights):
         # Reset and warm-up indicators when corporate actions occur
         data = algorithm.current_slice
-        reset_symbols = []
         for symbol in set(data.dividends.keys()) | set(data.splits.keys()):
             symbol_data = self._symbol_data_by_symbol[symbol]
             if symbol_data.should_reset():
                 symbol_data.clear_history()
-                reset_symbols.append(symbol)
-        if reset_symbols:
-            self._warm_up(algorithm, reset_symbols)
+                self._warm_up_symbols.add(symbol)
+        if self._warm_up_symbols:
+            self._warm_up(algorithm, list(self._warm_up_symbols))
+            self._warm_up_symbols = set()
 
         return super().create_targets(algorithm, insights)
 
@@ -98,9 +114,8 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
 
         symbols = [insight.symbol for insight in activeInsights]
 
-        # Create a dictionary keyed by the symbols in the insights with an pandas.series as value to create a data frame
-        returns = { str(symbol.id) : data.return_ for symbol, data in self._symbol_data_by_symbol.items() if symbol in symbols }
-        returns = pd.DataFrame(returns)
+        # Get a data frame of the returns of the symbols in the insights, it is a view of the returns matrix when they cover the universe
+        returns = self._returns.returns(symbols)
 
         # The portfolio optimizer finds the optional weights for the given data
         weights = self._optimizer.optimize(returns)
@@ -123,34 +138,39 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
         for removed in changes.removed_securities:
             symbol_data = self._symbol_data_by_symbol.pop(removed.symbol, None)
             symbol_data.reset()
+            self._returns.remove_symbol(removed.symbol)
+            self._warm_up_symbols.discard(removed.symbol)
 
         # initialize data for added securities
         symbols = [x.symbol for x in changes.added_securities]
         for symbol in [x for x in symbols if x not in self._symbol_data_by_symbol]:
-            self._symbol_data_by_symbol[symbol] = self.MeanVarianceSymbolData(symbol, self._lookback, self._period)
-        self._warm_up(algorithm, symbols)
+            self._returns.add_symbol(symbol)
+            self._symbol_data_by_symbol[symbol] = self.MeanVarianceSymbolData(symbol, self._lookback, self._returns)
+        self._warm_up_service.request(symbols, self._lookback * self._period + 1, self._resolution, DataNormalizationMode.SCALED_RAW)
+        self._warm_up_symbols.update(symbols)
     
     def _warm_up(self, algorithm, symbols):
-        history = algorithm.history[TradeBar](symbols, self._lookback * self._period + 1, self._resolution, data_normalization_mode=DataNormalizationMode.SCALED_RAW)
-        for bars in history:
-            for symbol, bar in bars.items():
+        bars_by_symbol = self._warm_up_service.get(symbols, self._lookback * self._period + 1, self._resolution, DataNormalizationMode.SCALED_RAW)
+        for symbol, bars in bars_by_symbol.items():
+            for bar in bars:
                 self._symbol_data_by_symbol.get(symbol).update(bar.end_time, bar.value)
 
 
     class MeanVarianceSymbolData:
-        def __init__(self, symbol, lookback, period):
+        def __init__(self, symbol, lookback, returns):
             self._symbol = symbol
             self._roc = RateOfChange(f'{symbol}.ROC({lookback})', lookback)
             self._roc.updated += self._on_rate_of_change_updated
-            self._window = RollingWindow[IndicatorDataPoint](period)
+            # The returns are written in place into the symbol's column of the shared returns matrix
+            self._returns = returns
 
         def should_reset(self):
-            # Don't need to reset when the `window` only contain data from the insight.magnitude
-            return self._window.samples < self._window.size * 2
+            # Don't need to reset when the window only contain data from the insight.magnitude
+            return self._returns.samples(self._symbol) < self._returns.period * 2
         
         def clear_history(self):
             self._roc.reset()
-            self._window.reset()
+            self._returns.clear(self._symbol)
 
         def reset(self):
             self._roc.updated -= self._on_rate_of_change_updated
@@ -161,21 +181,18 @@ class MeanVarianceOptimizationPortfolioConstructionModel(PortfolioConstructionMo
 
         def _on_rate_of_change_updated(self, roc, value):
             if roc.is_ready:
-                self._window.add(value)
+                self._returns.add(self._symbol, value.value)
 
         def add(self, time, value):
-            item = IndicatorDataPoint(self._symbol, time, value)
-            self._window.add(item)
+            self._returns.add(self._symbol, value)
 
         # Get symbols' returns, we use simple return according to
         # Meucci, Attilio, Quant Nugget 2: Linear vs. Compounded Returns – Common Pitfalls in Portfolio Management (May 1, 2010). 
         # GARP Risk Professional, pp. 49-51, April 2010 , Available at SSRN: https://ssrn.com/abstract=1586656
         @property
         def return_(self):
-            return pd.Series(
-                data = [x.value for x in self._window],
-                index = [x.end_time for x in self._window])
+            return self._returns.returns([self._symbol]).iloc[:, 0]
 
         @property
         def is_ready(self):
-            return self._window.is_ready
+            return self._returns.is_ready(self._symbol)
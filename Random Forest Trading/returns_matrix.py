@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from AlgorithmImports import *
+
+
+### <summary>
+### Holds the latest returns of every symbol in one (period x symbols) ring matrix for the mean-variance optimizer.
+### The matrix is in Fortran order so the returns of each symbol are contiguous. Each column has the row of its latest return,
+### a new return is written after it and again `period` rows below, so the last `period` returns of a column are always one slice.
+### New and cleared columns start at the row most columns are on, so while the symbols are updated together the returns of
+### every symbol are a single view of the matrix, with the rows lined up from the most recent return.
+### Symbols are mapped to columns as they are added to the universe, and a removed symbol's column is filled by the last one.
+### </summary>
+class ReturnsMatrix:
+    def __init__(self, period, capacity = 32):
+        """Initialize the matrix
+        Args:
+            period(int): The number of returns kept for each symbol
+            capacity(int): The initial number of columns, it doubles when it is full"""
+        self._period = period
+        self._values = np.full((2 * period, capacity), np.nan, order = 'F')
+        self._heads = np.full(capacity, period - 1, dtype = np.int64)
+        self._samples = np.zeros(capacity, dtype = np.int64)
+        self._symbols = []
+        self._columns = []
+        self._column_by_symbol = {}
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._column_by_symbol
+
+    @property
+    def period(self):
+        return self._period
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    @property
+    def values(self):
+        """The returns of every symbol, in the order of `symbols`. It is a view when the columns are on the same row"""
+        return self._window(list(range(len(self._symbols))))
+
+    def _window(self, columns):
+        heads = self._heads[columns]
+        if len(columns) == 0 or (heads == heads[0]).all():
+            start = heads[0] + 1 if len(columns) else 0
+            # The columns in use are contiguous, so all of them are a basic slice and stay a view
+            if columns == list(range(len(columns))):
+                return self._values[start:start + self._period, :len(columns)]
+            return self._values[start:start + self._period, columns]
+        # Otherwise gather the last `period` rows of each column
+        rows = heads[None, :] + 1 + np.arange(self._period)[:, None]
+        return self._values[rows, np.asarray(columns)[None, :]]
+
+    def _common_head(self):
+        count = len(self._symbols)
+        if count == 0:
+            return self._period - 1
+        return int(np.bincount(self._heads[:count], minlength = self._period).argmax())
+
+    def add_symbol(self, symbol):
+        if symbol in self._column_by_symbol:
+            return
+        column = len(self._symbols)
+        if column == self._values.shape[1]:
+            values = np.full((2 * self._period, 2 * column), np.nan, order = 'F')
+            values[:, :column] = self._values
+            self._values = values
+            self._heads = np.concatenate([self._heads, np.full(column, self._period - 1, dtype = np.int64)])
+            self._samples = np.concatenate([self._samples, np.zeros(column, dtype = np.int64)])
+        head = self._common_head()
+        self._symbols.append(symbol)
+        self._columns.append(str(symbol.id))
+        self._column_by_symbol[symbol] = column
+        self._values[:, column] = np.nan
+        self._heads[column] = head
+        self._samples[column] = 0
+
+    def remove_symbol(self, symbol):
+        column = self._column_by_symbol.pop(symbol, None)
+        if column is None:
+            return
+        # Move the last column into the free one so the columns in use stay contiguous
+        last = len(self._symbols) - 1
+        if column != last:
+            last_symbol = self._symbols[last]
+            self._symbols[column] = last_symbol
+            self._columns[column] = self._columns[last]
+            self._column_by_symbol[last_symbol] = column
+            self._values[:, column] = self._values[:, last]
+            self._heads[column] = self._heads[last]
+            self._samples[column] = self._samples[last]
+        self._symbols.pop()
+        self._columns.pop()
+        self._values[:, last] = np.nan
+        self._samples[last] = 0
+
+    def clear(self, symbol):
+        column = self._column_by_symbol[symbol]
+        self._values[:, column] = np.nan
+        self._heads[column] = self._common_head()
+        self._samples[column] = 0
+
+    def add(self, symbol, value):
+        column = self._column_by_symbol.get(symbol)
+        if column is None:
+            return
+        head = (self._heads[column] + 1) % self._period
+        self._values[head, column] = self._values[head + self._period, column] = value
+        self._heads[column] = head
+        self._samples[column] += 1
+
+    def samples(self, symbol):
+        return int(self._samples[self._column_by_symbol[symbol]])
+
+    def is_ready(self, symbol):
+        return self.samples(symbol) >= self._period
+
+    def column(self, symbol):
+        return self._column_by_symbol[symbol]
+
+    def returns(self, symbols = None):
+        """Get the returns of the given symbols as a DataFrame with a column per symbol id, the symbols that are not in the matrix are skipped.
+        When the symbols are all the symbols in the matrix and they are on the same row the DataFrame is a view of it, otherwise their columns are copied"""
+        count = len(self._symbols)
+        if symbols is None:
+            columns = list(range(count))
+        else:
+            columns = list(dict.fromkeys(self._column_by_symbol[symbol] for symbol in symbols if symbol in self._column_by_symbol))
+            if len(columns) == count:
+                columns = list(range(count))
+        return pd.DataFrame(self._window(columns), columns = [self._columns[column] for column in columns], copy = False)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmark import install_stand_ins
+
+install_stand_ins()
+algorithm_imports = sys.modules["AlgorithmImports"]
+for name, value in {
+    "AlphaModel": object, "QCAlgorithm": object, "Slice": object, "SecurityChanges": object, "Insight": object, "InsightDirection": object,
+    "List": list, "timedelta": timedelta, "Resolution": SimpleNamespace(DAILY = "Daily"),
+    "DataNormalizationMode": SimpleNamespace(SCALED_RAW = "ScaledRaw"), "SplitType": SimpleNamespace(WARNING = 0, SPLIT_OCCURRED = 1)
+}.items():
+    setattr(algorithm_imports, name, value)
+
+from alpha import RandomForestAlphaModel
+from features import FeatureStore
+
+
+### <summary>
+### Checks that a split or a dividend in the middle of the feature window does not show up as a return in the features and
+### targets of the random forest. The alpha is warmed up with adjusted daily bars, then raw prices are added before the close
+### every day and the corporate action arrives in a slice between two of them.
+### </summary>
+class WarmUpService:
+    def __init__(self, closes_by_symbol, start):
+        self._closes_by_symbol = closes_by_symbol
+        self._start = start
+
+    def get(self, symbols, window, resolution, data_normalization_mode):
+        return {symbol: [SimpleNamespace(end_time = self._start + timedelta(day), close = close) for day, close in enumerate(self._closes_by_symbol[symbol][-window:])]
+                for symbol in symbols}
+
+
+class Algorithm:
+    def __init__(self, start):
+        self.time = start
+        self.is_warming_up = True
+        self.securities = {}
+        self.schedule = SimpleNamespace(on = lambda *args: None)
+        self.date_rules = SimpleNamespace(every_day = lambda symbol: None)
+        self.time_rules = SimpleNamespace(before_market_close = lambda symbol, minutes: None)
+
+
+def empty_slice():
+    return SimpleNamespace(splits = {}, dividends = {})
+
+
+class CorporateActionTest(unittest.TestCase):
+    symbols = ["SPY", "TLT"]
+    warm_up_days = 30
+    live_days = 20
+
+    def setUp(self):
+        # Adjusted prices of every day, the first days fill the store at warm up and the others are added before the close
+        rng = np.random.default_rng(0)
+        days = self.warm_up_days + self.live_days
+        self.adjusted = {symbol: 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days))) for symbol in self.symbols}
+
+    def run_alpha(self, action_day, create_slice, raw_factor):
+        """Warm the alpha up, then add the raw prices of each day and send the corporate action before the prices of `action_day`.
+        The raw prices before the action are the adjusted ones divided by `raw_factor`"""
+        start = datetime(2024, 1, 1)
+        algorithm = Algorithm(start)
+        warm_up = {symbol: closes[:self.warm_up_days] for symbol, closes in self.adjusted.items()}
+        # The warm up bars are scaled raw, so they end at the raw price of the day before the live days
+        warm_up["SPY"] = warm_up["SPY"] / raw_factor
+        alpha = RandomForestAlphaModel(algorithm, 10, 5, 5, 20, WarmUpService(warm_up, start))
+        alpha.on_securities_changed(algorithm, SimpleNamespace(added_securities = [SimpleNamespace(symbol = symbol) for symbol in self.symbols], removed_securities = []))
+        for day in range(self.warm_up_days, self.warm_up_days + self.live_days):
+            alpha.update(algorithm, create_slice() if day == action_day else empty_slice())
+            for symbol in self.symbols:
+                price = self.adjusted[symbol][day] / (raw_factor if symbol == "SPY" and day < action_day else 1)
+                algorithm.securities[symbol] = SimpleNamespace(price = price)
+            alpha._predict()
+        return alpha._feature_store
+
+    def assert_matches_adjusted(self, feature_store):
+        expected = FeatureStore(self.symbols, 20, 5)
+        for day in range(self.warm_up_days + self.live_days):
+            expected.add([self.adjusted[symbol][day] for symbol in self.symbols])
+        np.testing.assert_allclose(feature_store.prices, expected.prices, rtol = 1e-12)
+        features, targets = feature_store.training_data()
+        expected_features, expected_targets = expected.training_data()
+        np.testing.assert_allclose(features, expected_features, rtol = 1e-9, atol = 1e-15)
+        np.testing.assert_allclose(targets, expected_targets, rtol = 1e-9, atol = 1e-15)
+
+    def test_split_in_the_middle_of_the_window(self):
+        # A 2 for 1 split halves the raw price, the prices before it are multiplied by the split factor
+        action_day = self.warm_up_days + self.live_days // 2
+        create_slice = lambda: SimpleNamespace(splits = {"SPY": SimpleNamespace(type = 1, split_factor = 0.5)}, dividends = {})
+        self.assert_matches_adjusted(self.run_alpha(action_day, create_slice, 0.5))
+
+    def test_split_warning_is_ignored(self):
+        # The warning the day before a split does not change the prices
+        action_day = self.warm_up_days + self.live_days // 2
+        create_slice = lambda: SimpleNamespace(splits = {"SPY": SimpleNamespace(type = 0, split_factor = 0.5)}, dividends = {})
+        self.assert_matches_adjusted(self.run_alpha(action_day, create_slice, 1))
+
+    def test_dividend_in_the_middle_of_the_window(self):
+        # The raw price drops by the distribution on the ex-date, the prices before it are multiplied by the dividend factor
+        action_day = self.warm_up_days + self.live_days // 2
+        reference_price = self.adjusted["SPY"][action_day - 1] / 0.98
+        distribution = 0.02 * reference_price
+        create_slice = lambda: SimpleNamespace(splits = {}, dividends = {"SPY": SimpleNamespace(distribution = distribution, reference_price = reference_price)})
+        self.assert_matches_adjusted(self.run_alpha(action_day, create_slice, 0.98))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from AlgorithmImports import *
+
+
+### <summary>
+### Serves the history that models need to warm up their indicators after a corporate action or a universe addition.
+### Models queue the symbols they will warm up with the window they need, for a resolution and normalization mode.
+### The first request of a time step fetches the requested symbols and every queued symbol of the same resolution and
+### normalization mode in one history request, with the largest of their windows. The result is kept for the rest of
+### the time step, so other models that need the same bars get them without another request.
+### </summary>
+class HistoryWarmUpService:
+    def __init__(self, algorithm):
+        self._algorithm = algorithm
+        self._pending_by_key = {}
+        self._cache = {}
+        self._time = None
+
+    def request(self, symbols, window, resolution, data_normalization_mode):
+        """Queue symbols that will be warmed up with `window` bars, so they are part of the next history request"""
+        pending = self._pending_by_key.setdefault((resolution, data_normalization_mode), {})
+        for symbol in symbols:
+            pending[symbol] = max(pending.get(symbol, 0), window)
+
+    def get(self, symbols, window, resolution, data_normalization_mode):
+        """Get the last `window` bars of each symbol as a dictionary of lists of TradeBar, oldest first"""
+        if self._time != self._algorithm.time:
+            self._time = self._algorithm.time
+            self._cache = {}
+
+        key = (resolution, data_normalization_mode)
+        cached_window, bars_by_symbol = self._cache.get(key, (0, {}))
+        missing = set(symbols) - set(bars_by_symbol)
+        if missing or cached_window < window:
+            # Fetch the symbols that the models have queued together, with the longest window any of them needs
+            pending = self._pending_by_key.pop(key, {})
+            fetch_window = max([window] + list(pending.values()))
+            if fetch_window > cached_window:
+                # The cached bars are too short, so they are fetched again with the longer window
+                missing |= set(bars_by_symbol)
+                bars_by_symbol = {}
+            else:
+                fetch_window = cached_window
+            others = set(pending) - missing - set(bars_by_symbol)
+            fetch = list(missing) + [symbol for symbol in others if self._algorithm.securities.contains_key(symbol)]
+            for symbol in fetch:
+                bars_by_symbol[symbol] = []
+            for bars in self._algorithm.history[TradeBar](fetch, fetch_window, resolution, data_normalization_mode=data_normalization_mode):
+                for symbol, bar in bars.items():
+                    bars_by_symbol[symbol].append(bar)
+            self._cache[key] = (fetch_window, bars_by_symbol)
+        return {symbol: bars_by_symbol[symbol][-window:] for symbol in symbols}
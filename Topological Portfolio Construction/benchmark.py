@@ -0,0 +1,95 @@
+# Import the required packages
+import argparse
+import time
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from clustering import clustering_tickers
+
+# This script benchmarks the clustering of the Kepler Mapper graph into symbols. It builds graphs shaped like the mapper output,
+# with nodes that hold the rows of stocks that are close on a 1d lens and links between the nodes that share stocks,
+# and compares the disjoint set clustering with the previous implementation. Run it with `python benchmark.py`
+
+# The previous implementation of TopologicalUniverseSelection.clustering_tickers
+def legacy_clustering_tickers(graph, ticker_list):
+    joined_clusters = []
+    for a, b in graph['links'].items():
+        isin = False
+        for n in range(len(joined_clusters)):
+            if a in joined_clusters[n] or b in joined_clusters[n]:
+                joined_clusters[n] = list(set(joined_clusters[n] + [a] + b))
+                isin = True
+        if isin:
+            continue
+        joined_clusters.append([a] + b)
+    joined_clusters += [[a] for a in graph['nodes'] if a not in [c for b in joined_clusters for c in b]]
+    return [[list([ticker_list[graph['nodes'][a]]][0]) for a in joined_cluster] for joined_cluster in joined_clusters]
+
+# Define a function to build a graph like the mapper does. Each node holds stocks that are next to each other on the lens,
+# some stretches of the lens are left uncovered so the graph has several components
+def synthetic_graph(nodes, stocks, rng):
+    covered = rng.random(stocks) > 0.05
+    starts = np.sort(rng.integers(0, stocks, nodes))
+    graph = {'nodes': {}, 'links': {}}
+    for node, start in enumerate(starts):
+        members = [row for row in range(start, min(start + rng.integers(1, 6), stocks)) if covered[row]]
+        if members:
+            graph['nodes'][f"node{node}"] = members
+    # Link the nodes that share a stock, the node that comes first holds the link
+    names = list(graph['nodes'])
+    members = [set(graph['nodes'][name]) for name in names]
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            if min(members[j]) > max(members[i]):
+                break
+            if members[i] & members[j]:
+                graph['links'].setdefault(names[i], []).append(names[j])
+    return graph
+
+# Define a function to check the clusters against the connected components of the graph found by scipy
+def is_partition_of_components(graph, clusters):
+    names = list(graph['nodes'])
+    index = {name: i for i, name in enumerate(names)}
+    edges = [(index[a], index[b]) for a, linked in graph['links'].items() for b in linked]
+    rows, columns = zip(*edges) if edges else ((), ())
+    adjacency = coo_matrix((np.ones(len(edges)), (rows, columns)), shape=(len(names), len(names)))
+    count, labels = connected_components(adjacency, directed=False)
+    expected = sorted(sorted(sorted(graph['nodes'][names[i]]) for i in np.flatnonzero(labels == label)) for label in range(count))
+    found = sorted(sorted(sorted(node) for node in cluster) for cluster in clusters)
+    return expected == found
+
+def time_call(function, *args, repeats=3):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the clustering of the Kepler Mapper graph into symbols")
+    parser.add_argument("--nodes", type=int, nargs="*", default=[100, 300, 1000, 3000], help="numbers of nodes of the graphs")
+    parser.add_argument("--stocks", type=int, default=500, help="number of stocks in the graph")
+    parser.add_argument("--legacy-limit", type=int, default=3000, help="largest number of nodes the previous implementation is run on")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the synthetic graphs")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for nodes in args.nodes:
+        graph = synthetic_graph(nodes, args.stocks, rng)
+        # The members are the row indices of the stocks, as in the mapper graph, so the ticker list is the row of each stock
+        ticker_list = np.arange(args.stocks)
+        elapsed, clusters = time_call(clustering_tickers, graph, ticker_list)
+        line = f"{len(graph['nodes'])} nodes, {sum(map(len, graph['links'].values()))} links: disjoint set {elapsed * 1000:.2f} ms, {len(clusters)} clusters"
+        line += f", components {'match' if is_partition_of_components(graph, clusters) else 'DO NOT match'}"
+        if len(graph['nodes']) <= args.legacy_limit:
+            legacy_elapsed, legacy_clusters = time_call(legacy_clustering_tickers, graph, ticker_list, repeats=1)
+            # The previous implementation only merges on the first node of a link, so it can duplicate nodes across clusters
+            line += f"; previous {legacy_elapsed * 1000:.2f} ms ({legacy_elapsed / elapsed:.0f}x), {len(legacy_clusters)} clusters"
+            line += f", components {'match' if is_partition_of_components(graph, legacy_clusters) else 'do not match'}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
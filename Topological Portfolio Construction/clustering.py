@@ -0,0 +1,79 @@
+# Import the required packages
+import numpy as np
+
+class DisjointSet:
+    # Initialise the class, every element starts in its own set. The parents are a list while the sets are merged,
+    # as single elements of a list are much faster to read and write than those of an array
+    def __init__(self, size: int) -> None:
+        self.parents = list(range(size))
+        self.sizes = [1] * size
+
+    def find(self, element: int) -> int:
+        # Find the root of the set, halving the path on the way so later finds are shorter
+        parents = self.parents
+        while parents[element] != element:
+            parents[element] = parents[parents[element]]
+            element = parents[element]
+        return element
+
+    def union(self, a: int, b: int) -> None:
+        # Attach the root of the smaller set to the root of the larger one
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.sizes[a] < self.sizes[b]:
+            a, b = b, a
+        self.parents[b] = a
+        self.sizes[a] += self.sizes[b]
+
+    def labels(self) -> np.ndarray:
+        # Compress every path at once so each element points to its root, then number the roots in order of first appearance
+        parents = np.asarray(self.parents, dtype=np.int64)
+        while True:
+            grandparents = parents[parents]
+            if np.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+        self.parents = parents.tolist()
+        _, first, labels = np.unique(parents, return_index=True, return_inverse=True)
+        return np.argsort(np.argsort(first))[labels]
+
+def correlation_distances(log_rets: np.ndarray, dtype: type = np.float64) -> np.ndarray:
+    # Standardise each row to a zero mean and a unit norm, so the correlations of all the pairs are a single matrix multiply
+    standardised = log_rets - log_rets.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(standardised, axis=1, keepdims=True)
+    standardised = np.divide(standardised, norms, out=np.zeros_like(standardised), where=norms > 0).astype(dtype, copy=False)
+    # The correlation distance is one minus the correlation, as the 'correlation' metric of scikit-learn computes it
+    distances = standardised @ standardised.T
+    np.subtract(1, distances, out=distances)
+    np.clip(distances, 0, 2, out=distances)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+def connected_nodes(graph: dict[str, object]) -> tuple[list[str], np.ndarray]:
+    # Number the nodes of the graph, then merge the nodes of each link
+    nodes = list(graph['nodes'])
+    index_by_node = {node: index for index, node in enumerate(nodes)}
+    disjoint_set = DisjointSet(len(nodes))
+    for a, linked in graph['links'].items():
+        for b in linked:
+            disjoint_set.union(index_by_node[a], index_by_node[b])
+    # Return the nodes and the connected component of each of them
+    return nodes, disjoint_set.labels()
+
+def clustering_tickers(graph: dict[str, object], ticker_list: list[object]) -> list[list[list[object]]]:
+    # Find the connected components of the graph, a node without any link is a component on its own
+    nodes, labels = connected_nodes(graph)
+    if not nodes:
+        return []
+    # Gather the members of every node in one index array, ordered by component and then by node
+    order = np.argsort(labels, kind='stable')
+    members = [np.asarray(graph['nodes'][nodes[index]], dtype=np.int64) for index in order]
+    counts = np.fromiter((len(member) for member in members), dtype=np.int64, count=len(members))
+    # Map all the members to their symbols at once, then split them back into nodes and the nodes into components
+    tickers = np.fromiter(ticker_list, dtype=object, count=len(ticker_list))
+    symbols = tickers[np.concatenate(members)].tolist()
+    node_ends = np.cumsum(counts)
+    node_symbols = [symbols[end - count:end] for end, count in zip(node_ends, counts)]
+    component_ends = np.cumsum(np.bincount(labels))
+    return [node_symbols[end - count:end] for end, count in zip(component_ends, np.bincount(labels))]
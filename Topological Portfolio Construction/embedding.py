@@ -0,0 +1,78 @@
+# Import the required packages
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+from umap import UMAP
+
+# The module only depends on numpy and scikit-learn so the workers of the topological ensemble can import it outside of LEAN
+class CachedEmbedding:
+    # Initialise the class. The lens of the mapper is the projection of the log returns of each stock on the principal components that
+    # explain `variance_ratio` of the variance, then onto 1 dimension with UMAP. Each step is scaled to [0, 1] as Kepler Mapper does.
+    # The UMAP model is refitted every `refit_period` recalibrations. In between, the new principal components are rotated onto the ones
+    # the model was fitted on, and if they only drifted by `drift_tolerance` the model projects them without being refitted
+    def __init__(self, variance_ratio: float = 0.8, refit_period: int = 4, drift_tolerance: float = 0.1, random_state: int = 1) -> None:
+        self.variance_ratio = variance_ratio
+        self.refit_period = refit_period
+        self.drift_tolerance = drift_tolerance
+        self.random_state = random_state
+        self._umap = None
+        self._scaler = None
+        self._components = None
+        self._row_by_symbol = {}
+        self._transforms = 0
+
+    def fit_transform(self, log_rets: np.ndarray, symbols: list[object]) -> np.ndarray:
+        # Project the stocks on the principal components
+        components, count = self.principal_components(log_rets)
+        # Reuse the cached UMAP model if the components have not drifted too far since it was fitted
+        rotated = self._rotate(components, symbols)
+        if rotated is None:
+            self._components = components[:, :count]
+            self._row_by_symbol = {symbol: row for row, symbol in enumerate(symbols)}
+            self._scaler = MinMaxScaler().fit(self._components)
+            self._umap = UMAP(n_components=1, random_state=self.random_state, n_jobs=-1)
+            lens = self._umap.fit_transform(self._scaler.transform(self._components))
+            self._transforms = 0
+        else:
+            lens = self._umap.transform(self._scaler.transform(rotated))
+            self._transforms += 1
+        return MinMaxScaler().fit_transform(lens)
+
+    def principal_components(self, log_rets: np.ndarray) -> tuple[np.ndarray, int]:
+        # Centre each day, as PCA does, then take the eigenvectors of the smaller of the two Gram matrices
+        centred = log_rets - log_rets.mean(axis=0)
+        samples, features = centred.shape
+        if samples <= features:
+            eigenvalues, eigenvectors = np.linalg.eigh(centred @ centred.T)
+            eigenvalues, eigenvectors = eigenvalues[::-1], eigenvectors[:, ::-1]
+            components = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+        else:
+            eigenvalues, eigenvectors = np.linalg.eigh(centred.T @ centred)
+            eigenvalues, eigenvectors = eigenvalues[::-1], eigenvectors[:, ::-1]
+            components = centred @ eigenvectors
+        # Keep the components with a positive variance, with the largest coordinate of each one positive so the signs are stable
+        rank = max(int((eigenvalues > eigenvalues[0] * 1e-12).sum()), 1)
+        eigenvalues, components = eigenvalues[:rank], components[:, :rank]
+        components *= np.where(components[np.abs(components).argmax(axis=0), np.arange(rank)] < 0, -1, 1)
+        # The number of components that explain the variance ratio, as PCA(n_components=variance_ratio) selects them
+        count = min(int(np.searchsorted(np.cumsum(eigenvalues) / eigenvalues.sum(), self.variance_ratio, side='right')) + 1, rank)
+        return components, count
+
+    def _rotate(self, components: np.ndarray, symbols: list[object]) -> np.ndarray:
+        # Refit on schedule, or when there are too few components or stocks in common with the fit
+        if self._umap is None or self._transforms + 1 >= self.refit_period:
+            return None
+        count = self._components.shape[1]
+        rows = [(row, self._row_by_symbol[symbol]) for row, symbol in enumerate(symbols) if symbol in self._row_by_symbol]
+        if components.shape[1] < count or len(rows) <= count or 2 * len(rows) < len(self._row_by_symbol):
+            return None
+        new = components[[row for row, _ in rows], :count]
+        old = self._components[[row for _, row in rows]]
+        # Find the rotation and scale that best map the new components onto the old ones (orthogonal Procrustes)
+        u, s, vt = np.linalg.svd(new.T @ old)
+        rotation = u @ vt
+        scale = s.sum() / max((new ** 2).sum(), np.finfo(np.float64).tiny)
+        # The drift is the share of the old components that the rotated new ones do not reproduce
+        drift = ((scale * new @ rotation - old) ** 2).sum() / max((old ** 2).sum(), np.finfo(np.float64).tiny)
+        if drift > self.drift_tolerance:
+            return None
+        return scale * components[:, :count] @ rotation
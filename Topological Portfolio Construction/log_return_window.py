@@ -0,0 +1,94 @@
+# Import the required packages
+from AlgorithmImports import *
+import bisect
+
+class LogReturnWindow:
+    # Initialise the class. The window keeps the log closes of the last `size` trading days of every tracked symbol in one array,
+    # with a row per day and a column per symbol, so the log returns of the universe are a single difference along the rows.
+    # Each day is written twice, `size` rows apart, so the days from the oldest to the latest are always a contiguous view
+    # and a new day overwrites the oldest one rather than shifting the array
+    def __init__(self, size: int, capacity: int = 256) -> None:
+        self.size = size
+        self._log_prices = np.full((2 * size, capacity), np.nan)
+        # The row of the oldest day, which the next day overwrites
+        self._next = 0
+        self._dates = []
+        self._symbols = []
+        self._column_by_symbol = {}
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def __contains__(self, symbol: Symbol) -> bool:
+        return symbol in self._column_by_symbol
+
+    @property
+    def symbols(self) -> list[Symbol]:
+        return self._symbols
+
+    @property
+    def window(self) -> np.ndarray:
+        # A view of the log closes of the last `size` days, from the oldest to the latest
+        return self._log_prices[self._next:self._next + self.size]
+
+    def add_symbol(self, symbol: Symbol) -> None:
+        if symbol in self._column_by_symbol:
+            return
+        # Double the number of columns when the array is full
+        column = len(self._symbols)
+        if column == self._log_prices.shape[1]:
+            log_prices = np.full((2 * self.size, 2 * column), np.nan)
+            log_prices[:, :column] = self._log_prices
+            self._log_prices = log_prices
+        self._symbols.append(symbol)
+        self._column_by_symbol[symbol] = column
+        self._log_prices[:, column] = np.nan
+
+    def remove_symbol(self, symbol: Symbol) -> None:
+        column = self._column_by_symbol.pop(symbol, None)
+        if column is None:
+            return
+        # Move the last column into the free one so the columns in use stay contiguous
+        last = len(self._symbols) - 1
+        if column != last:
+            self._symbols[column] = self._symbols[last]
+            self._column_by_symbol[self._symbols[column]] = column
+            self._log_prices[:, column] = self._log_prices[:, last]
+        self._symbols.pop()
+        self._log_prices[:, last] = np.nan
+
+    def update(self, day: date, prices: dict[Symbol, float], extend: bool = True) -> None:
+        # A day after the latest one starts a new row and drops the oldest one, unless the window should not be extended
+        if not self._dates or day > self._dates[-1]:
+            if not extend:
+                return
+            self._log_prices[[self._next, self._next + self.size]] = np.nan
+            self._next = (self._next + 1) % self.size
+            self._dates = self._dates[1 - self.size:] + [day] if self.size > 1 else [day]
+            row = self.size - 1
+        else:
+            # Otherwise fill the row of that day, if it is still in the window
+            index = bisect.bisect_left(self._dates, day)
+            if index == len(self._dates) or self._dates[index] != day:
+                return
+            row = self.size - len(self._dates) + index
+        row = (self._next + row) % self.size
+        for symbol, price in prices.items():
+            column = self._column_by_symbol.get(symbol)
+            if column is not None and price > 0:
+                self._log_prices[row, column] = self._log_prices[row + self.size, column] = np.log(price)
+
+    def log_prices(self, symbols: list[Symbol], lookback_period: int) -> tuple[np.ndarray, list[Symbol]]:
+        # Gather the log closes of the last `lookback_period` days of the symbols in the window, with a row per day
+        symbols = [symbol for symbol in symbols if symbol in self._column_by_symbol]
+        rows = min(lookback_period, len(self._dates))
+        return self.window[self.size - rows:, [self._column_by_symbol[symbol] for symbol in symbols]], symbols
+
+    def log_returns(self, symbols: list[Symbol], lookback_period: int) -> tuple[np.ndarray, list[Symbol]]:
+        log_prices, symbols = self.log_prices(symbols, lookback_period)
+        # Skip the symbols without any price, then the days where a symbol has no return, as the history request and dropna did
+        has_prices = ~np.isnan(log_prices).all(axis=0)
+        log_rets = np.diff(log_prices[:, has_prices], axis=0)
+        log_rets = log_rets[~np.isnan(log_rets).any(axis=1)]
+        # Return a row per stock and a column per day
+        return log_rets.T, [symbol for symbol, has in zip(symbols, has_prices) if has]
@@ -19,43 +19,78 @@ class TopologicalPortfolio(QCAlgorithm):
         # We define the lookback period to construct and analyse our topological structure, then we define a period to reconstruct the topological complex
         lookback_period = self.get_parameter("lookback_period", 150)
         recalibration_period = self.get_parameter("recalibration_period", 125)
-        self.universe_topologicalmodel = TopologicalUniverseSelection(sp500, lookback_period, recalibration_period, lambda u: [x.symbol for x in sorted([x for x in u if x.weight], key=lambda x: x.weight, reverse=True)[:200]])
+        # The UMAP projection is refitted every few recalibrations, or sooner when the structure of the returns drifts
+        umap_refit_period = self.get_parameter("umap_refit_period", 4)
+        drift_tolerance = self.get_parameter("drift_tolerance", 0.1)
+        # An ensemble of lookback periods and UMAP seeds, given as comma separated lists (for example "60,120,150,250" and "1,2,3"), makes the clusters more stable
+        ensemble_lookback_periods = [int(x) for x in self.get_parameter("ensemble_lookback_periods", "").split(",") if x.strip()]
+        ensemble_seeds = [int(x) for x in self.get_parameter("ensemble_seeds", "1").split(",") if x.strip()]
+        # The members of the ensemble are fitted in the algorithm's process, more workers fit them in a pool of spawned processes
+        ensemble_max_workers = self.get_parameter("ensemble_max_workers", 1)
+        self.universe_topologicalmodel = TopologicalUniverseSelection(sp500, lookback_period, recalibration_period, lambda u: [x.symbol for x in sorted([x for x in u if x.weight], key=lambda x: x.weight, reverse=True)[:200]], umap_refit_period, drift_tolerance,
+                                                                      ensemble_lookback_periods=ensemble_lookback_periods, ensemble_seeds=ensemble_seeds, ensemble_max_workers=ensemble_max_workers)
         self.add_universe_selection(self.universe_topologicalmodel)
 
         # Then schedule the portfolio to be rebalanced on a daily basis
         self.schedule.on(self.date_rules.every_day(sp500), self.time_rules.at(9, 31), self.rebalance)
+        # The weights are cached until the clusters are recalibrated, and a stock is only traded when its weight drifted by more than the tolerance
+        self._wghts = None
+        self._wghts_version = None
+        self._rebalance_tolerance = self.get_parameter("rebalance_tolerance", 0.001)
 
         # Finally, set a warm up period of 1 year
         self.set_warm_up(timedelta(365))
 
+    def on_data(self, data: Slice) -> None:
+        # Pass the splits and dividends to the universe selection model, which fills the closes of those stocks again
+        self.universe_topologicalmodel.on_data(self, data)
+
+    def on_end_of_algorithm(self) -> None:
+        # Shut down the process pool of the ensemble, if there is one
+        self.universe_topologicalmodel.close()
+
     def rebalance(self) -> None:
         # First check if there are any clusters in the investment universe
         if self.universe_topologicalmodel.clustered_symbols:
-            # Then determine the weights allocated to each cluster
-            wghts = self.wght_allocation(self.universe_topologicalmodel.clustered_symbols)
-            # Then rebalance the portfolio based on the clustered weights
-            self.set_holdings([PortfolioTarget(symbol, wght) for symbol, wght in wghts.items()], liquidate_existing_holdings=True)
+            # Then determine the weights allocated to each cluster, they only change when the clusters are recalibrated
+            if self._wghts_version != self.universe_topologicalmodel.clustering_version:
+                self._wghts = self.wght_allocation(self.universe_topologicalmodel.clustered_symbols)
+                self._wghts_version = self.universe_topologicalmodel.clustering_version
+            # Then rebalance the portfolio based on the clustered weights, only trading the stocks that drifted from their weight
+            total_portfolio_value = self.portfolio.total_portfolio_value
+            if total_portfolio_value <= 0:
+                return
+            current_wghts = np.array([self.portfolio[symbol].holdings_value for symbol in self._wghts.index]) / total_portfolio_value
+            drifted = np.abs(self._wghts.values - current_wghts) > self._rebalance_tolerance
+            targets = [PortfolioTarget(symbol, wght) for symbol, wght in self._wghts[drifted].items()]
+            # Liquidate the stocks that are no longer in any cluster
+            for holding in [kvp.value for kvp in self.portfolio if kvp.value.invested and kvp.key not in self._wghts.index]:
+                self.liquidate(holding.symbol)
+            if targets:
+                self.set_holdings(targets)
 
     def wght_allocation(self, clustered_symbols):
         # Assign weights to the clusters. Do note invest in any outliers
-        # Initialise a dictionary to store the weights
-        wghts = {}
-        # Define a function that will allocate weights
-        def allocate_wghts(nested_list, level=1):
-            # Determine the length of the list of stocks
-            len_list = len(nested_list)
-            # If the length is 0 then return
-            if len_list == 0:
-                return
-            # Assign an initial equal weight per element
-            wght_per_elmnt = 1 / len_list
-            # Loop over the list, if an item is in the list then the function is recursively called to the subcluster
-            # Otherwise it is a single stock and the weight is determined and added to the dictionary
+        # A stock is weighted by one over the number of elements of the list that holds it, halved at every level of depth
+        symbols, leaves, depths, parent_sizes = self.flatten_clusters(clustered_symbols)
+        if not symbols:
+            return pd.Series(dtype=float)
+        # Sum the weights of every stock in one pass, a stock can be in several nodes, then normalise them
+        wghts = np.bincount(leaves, weights=1 / (parent_sizes * 2.0 ** (depths - 1)), minlength=len(symbols))
+        return pd.Series(wghts / wghts.sum(), index=symbols)
+
+    def flatten_clusters(self, clustered_symbols):
+        # Walk the nested lists with a stack, recording for every stock its index, its level and the length of the list that holds it
+        index_by_symbol = {}
+        leaves, depths, parent_sizes = [], [], []
+        stack = [(clustered_symbols, 1)]
+        while stack:
+            nested_list, level = stack.pop()
             for item in nested_list:
                 if isinstance(item, list):
-                    allocate_wghts(item, level + 1)
+                    stack.append((item, level + 1))
                 else:
-                    wghts[item] = wghts.get(item, 0) + wght_per_elmnt / (2 ** (level - 1))
-        # Determine the overall weights
-        allocate_wghts(clustered_symbols)
-        return pd.Series(wghts) / sum(wghts.values())
\ No newline at end of file
+                    leaves.append(index_by_symbol.setdefault(item, len(index_by_symbol)))
+                    depths.append(level)
+                    parent_sizes.append(len(nested_list))
+        return list(index_by_symbol), np.array(leaves, dtype=np.int64), np.array(depths, dtype=np.float64), np.array(parent_sizes, dtype=np.float64)
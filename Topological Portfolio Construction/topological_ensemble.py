@@ -0,0 +1,129 @@
+# Import the required packages
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import kmapper as km
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from clustering import DisjointSet, connected_nodes, correlation_distances
+from embedding import CachedEmbedding
+
+# This module clusters the stocks of TopologicalUniverseSelection with an ensemble of Kepler Mapper graphs, one for each pair of a
+# lookback period and a UMAP seed, so the clusters do not hinge on a single window. The members are fitted one after the other in
+# this process by default. With more than one worker the log closes of the longest lookback are written once to shared memory and
+# every member is fitted in a process pool on its own slice of them. The members are then merged by co-association: two stocks are
+# in the same cluster when they are in the same component of enough of the graphs.
+# It does not import AlgorithmImports so the workers can import it outside of LEAN
+
+# The shared memory block the worker is attached to
+worker_state = {}
+
+# Define a function to attach a worker to the shared log closes, the block stays attached until the parent writes a new one
+def attach_log_prices(block_name, shape, dtype):
+    if worker_state.get("block_name") != block_name:
+        if "block" in worker_state:
+            worker_state["block"].close()
+        block = shared_memory.SharedMemory(name=block_name)
+        log_prices = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        log_prices.flags.writeable = False
+        worker_state.update(block_name=block_name, block=block, log_prices=log_prices)
+    return worker_state["log_prices"]
+
+# Define a function to find the component of each stock in the graph of one member, -1 for the stocks that are in no node
+def member_labels(log_prices, lookback_period, seed, precompute_distances=True):
+    labels = np.full(log_prices.shape[1], -1, dtype=np.int64)
+    # Compute the log returns of the lookback period with a row per stock. Only the stocks with a close on the first day of the window
+    # are in the member, so a stock that joined later does not drop the days before it for every other stock
+    window = log_prices[-lookback_period:]
+    stocks = np.flatnonzero(~np.isnan(window[0]))
+    log_rets = np.diff(window[:, stocks], axis=0)
+    log_rets = log_rets[~np.isnan(log_rets).any(axis=1)].T
+    if log_rets.shape[1] < 2 or len(stocks) < 2:
+        return labels
+    # Build the graph of the member as TopologicalUniverseSelection.obtain_simplicial_complex does, with the seed of the member
+    lens = CachedEmbedding(0.8, refit_period=1, random_state=seed).fit_transform(log_rets, stocks.tolist())
+    mapper = km.KeplerMapper(verbose=0)
+    if precompute_distances:
+        graph = mapper.map(lens, correlation_distances(log_rets), clusterer=DBSCAN(metric='precomputed'), precomputed=True)
+    else:
+        graph = mapper.map(lens, log_rets, clusterer=DBSCAN(metric='correlation'))
+    # Every stock of a node takes the component of the node, linked nodes share stocks so a stock is in one component
+    nodes, node_labels = connected_nodes(graph)
+    for node, label in zip(nodes, node_labels):
+        labels[stocks[graph['nodes'][node]]] = label
+    return labels
+
+# Define the task of a worker, which fits one member on the shared log closes
+def fit_member(block_name, shape, dtype, lookback_period, seed, precompute_distances):
+    return member_labels(attach_log_prices(block_name, shape, dtype), lookback_period, seed, precompute_distances)
+
+# Define a function to compute the share of the members in which each pair of stocks is in the same component
+def co_association(labels):
+    labels = np.asarray(labels)
+    members, stocks = labels.shape
+    matrix = np.zeros((stocks, stocks))
+    for member in labels:
+        assigned = np.flatnonzero(member >= 0)
+        # One column per component, so the pairs in the same component are a single matrix multiply
+        one_hot = np.zeros((len(assigned), member.max() + 1))
+        one_hot[np.arange(len(assigned)), member[assigned]] = 1
+        matrix[np.ix_(assigned, assigned)] += one_hot @ one_hot.T
+    return matrix / max(members, 1)
+
+# Define a function to merge the members into clusters of stocks, as lists of column indices
+def consensus_clusters(labels, threshold=0.5):
+    labels = np.asarray(labels)
+    # The stocks that are in no node in most of the members are outliers and are not clustered
+    clustered = np.flatnonzero((labels >= 0).mean(axis=0) >= threshold)
+    matrix = co_association(labels)[np.ix_(clustered, clustered)]
+    # Join the stocks that are together in at least `threshold` of the members
+    disjoint_set = DisjointSet(len(clustered))
+    for a, b in zip(*np.nonzero(np.triu(matrix >= threshold, 1))):
+        disjoint_set.union(int(a), int(b))
+    cluster_labels = disjoint_set.labels() if len(clustered) > 0 else np.array([], dtype=np.int64)
+    return [clustered[cluster_labels == label] for label in range(cluster_labels.max() + 1 if len(cluster_labels) > 0 else 0)]
+
+class TopologicalEnsemble:
+    # Initialise the class. The members are every pair of a lookback period and a seed, they are fitted in this process unless more
+    # than one worker is asked for. The pool of `max_workers` processes is kept between the fits and its workers are spawned rather
+    # than forked, so they do not inherit the threads and the state of the process that hosts the algorithm. Check a pool inside LEAN
+    # before using it there
+    def __init__(self, lookback_periods: list[int], seeds: list[int], threshold: float = 0.5, max_workers: int = 1, precompute_distances: bool = True) -> None:
+        self.members = [(lookback_period, seed) for lookback_period in lookback_periods for seed in seeds]
+        self.threshold = threshold
+        self.max_workers = min(max_workers, len(self.members))
+        self.precompute_distances = precompute_distances
+        self._executor = None
+
+    @property
+    def lookback_period(self) -> int:
+        return max(lookback_period for lookback_period, _ in self.members)
+
+    def fit(self, log_prices: np.ndarray) -> list[np.ndarray]:
+        # Fit the members on the log closes, with a row per day and a column per stock, then merge them
+        log_prices = np.ascontiguousarray(log_prices, dtype=np.float64)
+        if self.max_workers <= 1:
+            labels = [member_labels(log_prices, lookback_period, seed, self.precompute_distances) for lookback_period, seed in self.members]
+            return consensus_clusters(labels, self.threshold)
+
+        # Write the log closes to shared memory once, every worker reads its window from there
+        block = shared_memory.SharedMemory(create=True, size=max(log_prices.nbytes, 1))
+        try:
+            np.ndarray(log_prices.shape, log_prices.dtype, buffer=block.buf)[...] = log_prices
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            futures = [self._executor.submit(fit_member, block.name, log_prices.shape, log_prices.dtype.str, lookback_period, seed, self.precompute_distances)
+                       for lookback_period, seed in self.members]
+            labels = [future.result() for future in futures]
+        finally:
+            block.close()
+            block.unlink()
+        return consensus_clusters(labels, self.threshold)
+
+    def close(self) -> None:
+        # Shut the process pool down
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
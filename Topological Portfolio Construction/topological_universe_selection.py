@@ -3,19 +3,37 @@ import kmapper as km
 from AlgorithmImports import *
 from Selection.ETFConstituentsUniverseSelectionModel import ETFConstituentsUniverseSelectionModel
 from sklearn.cluster import DBSCAN
-from sklearn.decomposition import PCA
-from umap import UMAP
+import clustering
+from embedding import CachedEmbedding
+from log_return_window import LogReturnWindow
+from topological_ensemble import TopologicalEnsemble
 
 # Initialise the random seed
 np.random.seed(42)
 
 class TopologicalUniverseSelection(ETFConstituentsUniverseSelectionModel):
     # Initialise the class
-    def __init__(self, etf_ticker: Symbol, lookback_period: int = 250, recalibration_period: timedelta = None, universe_filter_func: Callable[list[ETFConstituentUniverse], list[Symbol]] = None) -> None:
+    def __init__(self, etf_ticker: Symbol, lookback_period: int = 250, recalibration_period: timedelta = None, universe_filter_func: Callable[list[ETFConstituentUniverse], list[Symbol]] = None, umap_refit_period: int = 4, drift_tolerance: float = 0.1, precompute_distances: bool = True, distance_dtype: type = np.float64, ensemble_lookback_periods: list[int] = None, ensemble_seeds: list[int] = None, ensemble_max_workers: int = 1) -> None:
         self.clustered_symbols = None
+        # The version of the clusters, which changes every time they are recalibrated
+        self.clustering_version = 0
         self.lookback_period = lookback_period
         self.recalibration_period = recalibration_period
         self._ticker = etf_ticker
+        # In ensemble mode the stocks are clustered with a graph for every pair of a lookback period and a UMAP seed, fitted in this process
+        # unless a process pool of more than one worker is asked for
+        self._ensemble = TopologicalEnsemble(ensemble_lookback_periods, ensemble_seeds or [1], max_workers=ensemble_max_workers, precompute_distances=precompute_distances) if ensemble_lookback_periods else None
+        # The log returns are kept from the daily closes of the constituents, so a recalibration does not request any history
+        self._log_returns = LogReturnWindow(max(lookback_period, self._ensemble.lookback_period) if self._ensemble else lookback_period)
+        # The stored closes are not adjusted again after a split or a dividend, so the stocks with one are filled again from history
+        self._adjusted_symbols = set()
+        # The UMAP projection is reused between its refits while the principal components of the returns drift little
+        self._embedding = CachedEmbedding(0.8, umap_refit_period, drift_tolerance, random_state=1)
+        # The correlation distances of the stocks can be computed once per recalibration rather than in every cube of the cover,
+        # float32 halves the memory of the matrix
+        self.precompute_distances = precompute_distances
+        self.distance_dtype = distance_dtype
+        self.distances = None
         super().__init__(etf_ticker, None, universe_filter_func)
 
     def create_universes(self, algorithm: QCAlgorithm) -> list[Universe]:
@@ -23,14 +41,70 @@ class TopologicalUniverseSelection(ETFConstituentsUniverseSelectionModel):
         # Warm up the investment universe, gather the tickers when the market next opens at 9:31 in the morning
         market_open = algorithm.securities[self._ticker].exchange.hours.get_next_market_open(algorithm.time, False)
         algorithm.schedule.on(algorithm.date_rules.on([market_open]), algorithm.time_rules.at(9, 31), lambda: self.obtain_graph_symbols(algorithm))
+        # Record the close of every constituent each day
+        algorithm.schedule.on(algorithm.date_rules.every_day(self._ticker), algorithm.time_rules.after_market_close(self._ticker, 1), lambda: self.update_log_returns(algorithm))
         return list_of_universes
 
+    def on_data(self, algorithm: QCAlgorithm, data: Slice) -> None:
+        # Record the tracked stocks with a split or a dividend, the warnings of a split the day before do not change the prices
+        splits = [symbol for symbol, split in data.splits.items() if split.type == SplitType.SPLIT_OCCURRED]
+        self._adjusted_symbols.update(symbol for symbol in splits + list(data.dividends.keys()) if symbol in self._log_returns)
+
+    def update_log_returns(self, algorithm: QCAlgorithm) -> None:
+        # First track the constituents that were selected since the last update
+        self.update_constituents(algorithm)
+        # Then fill the stocks with a split or a dividend again, their history is adjusted to the latest price
+        adjusted = [symbol for symbol in self._adjusted_symbols if symbol in self._log_returns]
+        self._adjusted_symbols.clear()
+        if adjusted:
+            for symbol in adjusted:
+                self._log_returns.remove_symbol(symbol)
+                self._log_returns.add_symbol(symbol)
+            self.fill_history(algorithm, adjusted, False)
+        # Then add today's close of the constituents that traded today
+        today = algorithm.time.date()
+        prices = {}
+        for symbol in self._log_returns.symbols:
+            security = algorithm.securities.get(symbol)
+            last_data = security.get_last_data() if security is not None else None
+            if last_data is not None and last_data.end_time.date() == today:
+                prices[symbol] = security.close
+        self._log_returns.update(today, prices)
+
+    def update_constituents(self, algorithm: QCAlgorithm) -> None:
+        # Stop tracking the stocks that left the investment universe
+        selected = set(self.universe.selected) if self.universe.selected else set()
+        for symbol in [symbol for symbol in self._log_returns.symbols if symbol not in selected]:
+            self._log_returns.remove_symbol(symbol)
+        # The stocks that joined it are filled with one history request, which also fills an empty window
+        added = [symbol for symbol in selected if symbol not in self._log_returns]
+        if not added:
+            return
+        extend = len(self._log_returns) == 0
+        for symbol in added:
+            self._log_returns.add_symbol(symbol)
+        self.fill_history(algorithm, added, extend)
+
+    def fill_history(self, algorithm: QCAlgorithm, symbols: list[Symbol], extend: bool) -> None:
+        # Fill the columns of the stocks with the daily closes of one history request, as long as the window
+        for bars in algorithm.history[TradeBar](symbols, self._log_returns.size, Resolution.DAILY):
+            for symbol, bar in bars.items():
+                self._log_returns.update(bar.time.date(), {symbol: bar.close}, extend)
+
     def obtain_graph_symbols(self, algorithm: QCAlgorithm) -> None:
-        # We first construct a simplicial complex
-        graph, ticker_list = self.obtain_simplicial_complex(algorithm, self.lookback_period)
-        # If the ticker list is not empty then we can perform the clustering
-        if len(ticker_list) > 0:
-            self.clustered_symbols = self.clustering_tickers(graph, ticker_list)
+        if self._ensemble is not None:
+            # Merge the clusters of the ensemble, if there are any
+            clustered_symbols = self.obtain_ensemble_clusters(algorithm)
+            if clustered_symbols:
+                self.clustered_symbols = clustered_symbols
+                self.clustering_version += 1
+        else:
+            # We first construct a simplicial complex
+            graph, ticker_list = self.obtain_simplicial_complex(algorithm, self.lookback_period)
+            # If the ticker list is not empty then we can perform the clustering
+            if len(ticker_list) > 0:
+                self.clustered_symbols = self.clustering_tickers(graph, ticker_list)
+                self.clustering_version += 1
         # Then schedule a time to reconstruct the topological structure
         algorithm.schedule.on(algorithm.date_rules.on([algorithm.time + timedelta(self.recalibration_period)]), algorithm.time_rules.at(0, 1), lambda: self.obtain_graph_symbols(algorithm))
 
@@ -38,40 +112,44 @@ class TopologicalUniverseSelection(ETFConstituentsUniverseSelectionModel):
         # If the investment universe is blank then return nothing
         if not self.universe.selected:
             return {}, []
-        # First obtain the stock prices of each S&P500 constituent
-        stock_prices = algorithm.history(self.universe.selected, lookback_period, Resolution.DAILY).unstack(0).close
-        # Then determine the log returns of each stock
-        log_rets = np.log(stock_prices / stock_prices.shift(1)).dropna().T
+        # First obtain the log returns of each S&P500 constituent from the rolling window, only new constituents request history
+        self.update_constituents(algorithm)
+        log_rets, symbols = self._log_returns.log_returns(list(self.universe.selected), lookback_period)
         # If the log returns are empty then return nothing
-        if log_rets.empty:
+        if log_rets.size == 0:
             return {}, []
         # Then initialise the Keppler Mapper algorithm
         mapper = km.KeplerMapper()
-        # We then project the data into a 2d subspace using 2 transformations: PCA and UMAP. PCA is used as it can retain the most variance in the data
+        # We then project the data into a 1d subspace using 2 transformations: PCA and UMAP. PCA is used as it can retain the most variance in the data
         # UMAP is used as it addresses non linear relationships well and preserves local and global structures
-        projected_stock_data = mapper.fit_transform(log_rets, projection=[PCA(n_components=0.8, random_state=1), UMAP(n_components=1, random_state=1, n_jobs=-1)])
+        projected_stock_data = self._embedding.fit_transform(log_rets, symbols)
         # Then cluster the data with DBSCAN (it is used as it can better handle noise, the correlation distance to cluster is important for forming portfolios
-        final_graph = mapper.map(projected_stock_data, log_rets, clusterer=DBSCAN(metric='correlation', n_jobs=-1))
-        return final_graph, stock_prices.columns
+        if self.precompute_distances:
+            # The distances of every pair of stocks are computed once and kept until the next recalibration, each cube clusters a submatrix of them
+            self.distances = clustering.correlation_distances(log_rets, self.distance_dtype)
+            final_graph = mapper.map(projected_stock_data, self.distances, clusterer=DBSCAN(metric='precomputed', n_jobs=-1), precomputed=True)
+        else:
+            final_graph = mapper.map(projected_stock_data, log_rets, clusterer=DBSCAN(metric='correlation', n_jobs=-1))
+        return final_graph, pd.Index(symbols)
+
+    def obtain_ensemble_clusters(self, algorithm: QCAlgorithm) -> list[list[list[Symbol]]]:
+        # If the investment universe is blank then return nothing
+        if not self.universe.selected:
+            return []
+        # Fit the members of the ensemble on the log closes of the longest lookback period, only new constituents request history
+        self.update_constituents(algorithm)
+        log_prices, symbols = self._log_returns.log_prices(list(self.universe.selected), self._ensemble.lookback_period)
+        if log_prices.shape[0] < 2 or not symbols:
+            return []
+        clusters = self._ensemble.fit(log_prices)
+        # Each cluster of the ensemble is a single node, in the same nested form as the clusters of a single graph
+        return [[[symbols[index] for index in cluster]] for cluster in clusters]
+
+    def close(self) -> None:
+        # Shut down the process pool of the ensemble
+        if self._ensemble is not None:
+            self._ensemble.close()
 
     def clustering_tickers(self, graph: dict[str, object], ticker_list: list[Symbol]) -> list[list[object]]:
-        # Initialise the list of joined clusters
-        joined_clusters = []
-        # Loop over each pair in the links section of the graph dictionary
-        for a, b in graph['links'].items():
-            # If a and b are already part of an existing cluster set the flag to False
-            isin = False
-            # Loop over the existing clusters
-            for n in range(len(joined_clusters)):
-                # Check if a or b are part of an existing cluster, if so then merge joined cluster with a and b and set the flag to True
-                if a in joined_clusters[n] or b in joined_clusters[n]:
-                    joined_clusters[n] = list(set(joined_clusters[n] + [a] + b))
-                    isin = True
-            # If isin is True then continue
-            if isin:
-                continue
-            joined_clusters.append([a] + b)
-        # Add any nodes from the graph that have not already been included in a joined cluster as a single cluster
-        joined_clusters += [[a] for a in graph['nodes'] if a not in [c for b in joined_clusters for c in b]]
-        # Finally convert the node into a symbol
-        return [[list([ticker_list[graph['nodes'][a]]][0]) for a in joined_cluster] for joined_cluster in joined_clusters]
\ No newline at end of file
+        # Merge the linked nodes of the graph into clusters with a disjoint set, then convert the nodes into symbols
+        return clustering.clustering_tickers(graph, ticker_list)